@@ -0,0 +1,182 @@
+# Benchmark Runner:
+# Measures the run time and peak memory usage of this project's mapping,
+# data cleaning, database, and export code at multiple data scales
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# Example usage (from the project's root folder):
+#
+# python benchmarks/run_benchmarks.py
+# (Runs every scenario at 1x, 10x, and 100x scale and compares the results
+# to benchmarks/baselines.json. render_map@100x needs around 8 GB of 
+# memory, so on smaller machines, pass --scales 1 10 instead.)
+#
+# python benchmarks/run_benchmarks.py --scenarios render_map read_database
+# --scales 1 10
+#
+# python benchmarks/run_benchmarks.py --save-baselines
+# (Stores the current results as the new baselines)
+#
+# When any result exceeds its baseline by more than the allowed tolerance,
+# this script exits with a status of 1, so it can be added to scheduled
+# jobs that should fail (or send an alert) when a regression appears.
+#
+# Each measurement is taken twice: once to record the run time (the
+# fastest of --repeat runs is kept), and once while tracemalloc is
+# tracking memory allocations. tracemalloc slows code down, which is
+# why it isn't active during the timed runs. Note that tracemalloc
+# records memory allocated by Python, NumPy, and pandas, but not memory
+# allocated within GEOS (the library used by shapely) or SQLite.
+#
+# The prepare_county_table scenario is untracked: it has no baselines
+# because this repository doesn't include cb_2022_us_county_500k.shp (the
+# other files within data/cb_2022_us_county_500k are present). It will be
+# skipped unless that file is downloaded from the Census Bureau's
+# cartographic boundary files page (https://www.census.gov/geographies/
+# mapping-files/time-series/geo/cartographic-boundary.html). Results for
+# scenarios without baselines are still printed but can't be flagged as
+# regressions.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+from scenarios import SkipScenario, benchmark_folder, scenarios
+
+default_baseline_path = os.path.join(benchmark_folder, 'baselines.json')
+
+
+def measure_scenario(scenario_name, scale, repeat = 3):
+    '''Runs a scenario at a given scale and returns its fastest run time
+    (in seconds) and its peak traced memory usage (in megabytes).
+    A new setup is performed before each run so that every run starts
+    from the same state.'''
+    setup = scenarios[scenario_name]
+    run_times = []
+    for i in range(repeat):
+        run = setup(scale)
+        gc.collect()
+        start_time = time.perf_counter()
+        run()
+        run_times.append(time.perf_counter() - start_time)
+        del run
+
+    run = setup(scale)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del run
+    gc.collect()
+    return {'seconds':round(min(run_times), 4),
+    'peak_memory_mb':round(peak_memory / 1e6, 2)}
+
+
+def _result_key(scenario_name, scale):
+    return f'{scenario_name}@{scale}x'
+
+
+def load_baselines(baseline_path):
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path) as baseline_file:
+        return json.load(baseline_file)['results']
+
+
+def save_baselines(baseline_path, results):
+    '''Adds results to the baseline file (replacing any existing baselines
+    for the same scenarios and scales).'''
+    baselines = load_baselines(baseline_path)
+    baselines.update(results)
+    temp_baseline_path = baseline_path + '.tmp'
+    with open(temp_baseline_path, 'w') as baseline_file:
+        json.dump({'machine':platform.platform(),
+        'python':platform.python_version(),
+        'saved_at':time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results':dict(sorted(baselines.items()))}, baseline_file, indent = 2)
+    os.replace(temp_baseline_path, baseline_path)
+
+
+def compare_to_baselines(results, baselines, time_tolerance = 0.25,
+    memory_tolerance = 0.25):
+    '''Returns a DataFrame comparing each result to its baseline. A result
+    is flagged as a regression if its run time or peak memory exceeds
+    the baseline by more than time_tolerance or memory_tolerance (e.g.
+    0.25 = 25%).'''
+    comparison_rows = []
+    for result_key, result in results.items():
+        baseline = baselines.get(result_key, {})
+        comparison_row = {'Benchmark':result_key, **result}
+        for metric, tolerance in [('seconds', time_tolerance),
+        ('peak_memory_mb', memory_tolerance)]:
+            if metric in baseline and metric in result:
+                ratio = result[metric] / max(baseline[metric], 1e-9)
+                comparison_row[metric + '_vs_baseline'] = round(ratio, 2)
+                comparison_row['regression'] = comparison_row.get(
+                    'regression', False) or ratio > 1 + tolerance
+        comparison_rows.append(comparison_row)
+    return pd.DataFrame(comparison_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measures the run time \
+and peak memory usage of this project's main workflows.")
+    parser.add_argument('--scenarios', nargs = '+',
+    default = list(scenarios), choices = list(scenarios))
+    parser.add_argument('--scales', nargs = '+', type = int,
+    default = [1, 10, 100])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--baselines', default = default_baseline_path)
+    parser.add_argument('--save-baselines', action = 'store_true')
+    parser.add_argument('--time-tolerance', type = float, default = 0.25)
+    parser.add_argument('--memory-tolerance', type = float, default = 0.25)
+    parser.add_argument('--output', default = None, help = "An optional \
+path to a .json file in which the results will be saved.")
+    args = parser.parse_args()
+
+    results = {}
+    for scenario_name in args.scenarios:
+        for scale in args.scales:
+            result_key = _result_key(scenario_name, scale)
+            print(f"Running {result_key}:", flush = True)
+            try:
+                results[result_key] = measure_scenario(
+                    scenario_name, scale, repeat = args.repeat)
+            except SkipScenario as skip_reason:
+                print(f"Skipping {result_key}: {skip_reason}")
+                continue
+            print(results[result_key], flush = True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent = 2)
+
+    baselines = load_baselines(args.baselines)
+    if len(results) == 0:
+        print("No scenarios were run.")
+        return
+    df_comparison = compare_to_baselines(results, baselines,
+    time_tolerance = args.time_tolerance,
+    memory_tolerance = args.memory_tolerance)
+    with pd.option_context('display.width', 200,
+    'display.max_columns', None):
+        print(df_comparison)
+
+    if args.save_baselines:
+        save_baselines(args.baselines, results)
+        print(f"Saved baselines to {args.baselines}.")
+    elif ('regression' in df_comparison.columns and
+    df_comparison['regression'].fillna(False).any()):
+        print("Regressions were found.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
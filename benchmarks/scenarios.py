@@ -0,0 +1,281 @@
+# Benchmark Scenarios:
+# The workloads measured by run_benchmarks.py
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# Each scenario is defined by a setup function that accepts a scale
+# (1 for the data shipped with this project, 10 for a copy that's ten
+# times larger, and so on) and returns a function that performs the work
+# being measured. Only the returned function gets timed, so reading
+# inputs, creating temporary folders, and other preparation steps don't
+# affect the results.
+#
+# Scaled copies of the project's data are created the first time they're
+# needed and then stored within benchmarks/scaled_data so that later runs
+# can reuse them.
+
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+benchmark_folder = os.path.dirname(os.path.abspath(__file__))
+project_folder = os.path.dirname(benchmark_folder)
+data_folder = os.path.join(project_folder, 'data')
+scaled_data_folder = os.path.join(benchmark_folder, 'scaled_data')
+
+for module_folder in ['part_x_mapping', 'part_x_data_cleaning',
+'part_x_google_sheets_uploads', os.path.join('supplemental', 'db_tools'),
+os.path.join('supplemental', 'db_generator')]:
+    sys.path.append(os.path.join(project_folder, module_folder))
+
+county_shapefile_path = os.path.join(data_folder, 'cb_2022_us_county_500k',
+'cb_2022_us_county_500k.shp')
+county_data_path = os.path.join(data_folder, 'co-est2022-alldata.csv')
+migration_data_path = os.path.join(data_folder,
+'2020-2023_net_domestic_migration_dataset.csv')
+winter_results_folder = os.path.join(project_folder, 'part_x_data_cleaning',
+'winter_2023_2024_test_results')
+database_path = os.path.join(data_folder, 'network_database.db')
+
+
+class SkipScenario(Exception):
+    '''Raised by a setup function when its scenario can't run (e.g. because
+    an input file is missing).'''
+
+
+def _scaled_folder(scale):
+    folder = os.path.join(scaled_data_folder, f'x{scale}')
+    os.makedirs(folder, exist_ok = True)
+    return folder
+
+
+def _temporary_folder():
+    '''Returns a new temporary folder that will be deleted when the
+    benchmark process exits.'''
+    import atexit
+    folder = tempfile.mkdtemp(prefix = 'pfn_benchmark_')
+    atexit.register(shutil.rmtree, folder, ignore_errors = True)
+    return folder
+
+
+# prepare_county_table
+
+def _scaled_county_files(scale):
+    '''Returns the paths to a county shapefile and a county population
+    table containing scale copies of each county. Each copy receives its
+    own set of state codes (the original codes plus 100, 200, etc.) so that
+    the merge within prepare_county_table still matches one shape to
+    one row.'''
+    if not os.path.exists(county_shapefile_path):
+        raise SkipScenario(f"{county_shapefile_path} wasn't found. (This \
+file isn't included within the repository; see run_benchmarks.py.)")
+    if scale == 1:
+        return county_shapefile_path, county_data_path
+    import geopandas
+    folder = _scaled_folder(scale)
+    shape_path = os.path.join(folder, 'counties.gpkg')
+    data_path = os.path.join(folder, 'counties.csv')
+    if not os.path.exists(shape_path) or not os.path.exists(data_path):
+        shapes = geopandas.read_file(county_shapefile_path)
+        county_data = pd.read_csv(county_data_path)
+        shape_copies = []
+        data_copies = []
+        for copy in range(scale):
+            shape_copy = shapes.copy()
+            shape_copy['STATEFP'] = (shape_copy['STATEFP'].astype(int)
+            + 100 * copy).astype(str).str.zfill(2)
+            shape_copies.append(shape_copy)
+            data_copy = county_data.copy()
+            data_copy['STATE'] = data_copy['STATE'] + 100 * copy
+            data_copies.append(data_copy)
+        pd.concat(data_copies).to_csv(data_path, index = False)
+        # A GeoPackage (rather than a shapefile) is used for the scaled
+        # copies since shapefiles can't exceed 2 GB.
+        geopandas.GeoDataFrame(pd.concat(shape_copies, ignore_index = True),
+        crs = shapes.crs).to_file(shape_path + '.tmp', driver = 'GPKG')
+        os.replace(shape_path + '.tmp', shape_path)
+    return shape_path, data_path
+
+
+def setup_prepare_county_table(scale):
+    from mapping_functions import prepare_county_table
+    shape_path, data_path = _scaled_county_files(scale)
+    return lambda: prepare_county_table(shape_path, 'STATEFP', 'COUNTYFP',
+    tolerance = 0.005, data_path = data_path, data_state_code_column =
+    'STATE', data_county_code_column = 'COUNTY')
+
+
+# render_map
+
+def _scaled_map_table(scale):
+    '''Returns a county-level map table (based on the net domestic
+    migration dataset, which stores its shapes as WKT) containing scale
+    copies of each county.'''
+    from mapping_functions import convert_wkt_csv, read_map_table
+    folder = _scaled_folder(1)
+    base_path = os.path.join(folder, 'migration_map_table.parquet')
+    if not os.path.exists(base_path):
+        convert_wkt_csv(migration_data_path, base_path)
+    map_table = read_map_table(base_path)
+    if scale == 1:
+        return map_table
+    map_copies = []
+    for copy in range(scale):
+        map_copy = map_table.copy()
+        map_copy['NAME'] = map_copy['NAME'] + f' ({copy})'
+        map_copies.append(map_copy)
+    return pd.concat(map_copies, ignore_index = True)
+
+
+def setup_render_map(scale):
+    from mapping_functions import render_map
+    map_table = _scaled_map_table(scale)
+    output_folder = _temporary_folder()
+    return lambda: render_map(map_table, 'NAME',
+    '2020-2023_NDM_as_%_of_2020_Population', 'County', 'benchmark_map',
+    output_folder, output_folder, generate_image = False)
+
+
+# Test result cleaning and deduplication
+
+def _scaled_result_folder(scale):
+    '''Returns a result folder in which each file contains scale copies of
+    the original file's rows. Each copy's IDs are offset by a different
+    amount so that the deduplication step sees the same share of
+    duplicate IDs at every scale.'''
+    if scale == 1:
+        return winter_results_folder
+    result_folder = os.path.join(_scaled_folder(scale),
+    os.path.basename(winter_results_folder))
+    if not os.path.exists(result_folder):
+        os.makedirs(result_folder + '_tmp', exist_ok = True)
+        for file_name in os.listdir(winter_results_folder):
+            df_result = pd.read_csv(os.path.join(
+                winter_results_folder, file_name), dtype = str)
+            id_digits = df_result['Identification Code'].str.replace(
+                r'\D', '', regex = True).astype('int64')
+            pd.concat([df_result.assign(**{'Identification Code':'ID:'
+            + (id_digits + copy * 1000000).astype(str)})
+            for copy in range(scale)]).to_csv(os.path.join(
+                result_folder + '_tmp', file_name), index = False)
+        os.replace(result_folder + '_tmp', result_folder)
+    return result_folder
+
+
+def setup_clean_test_results(scale):
+    '''Cleans every file within the winter result folder (as
+    reformat_results() does within data_cleaning.ipynb), then keeps only
+    each student's latest result.'''
+    from ingestion_functions import (_read_result_file,
+    parse_result_folder_name)
+    result_folder = _scaled_result_folder(scale)
+    period, starting_year = parse_result_folder_name(result_folder)
+    file_paths = [os.path.join(result_folder, file_name)
+    for file_name in sorted(os.listdir(result_folder))]
+    def run():
+        df_results = pd.concat([_read_result_file(
+            file_path, period, starting_year)[0] for file_path in file_paths])
+        return df_results.sort_values('Test_Day').drop_duplicates(
+            subset = 'Student_ID', keep = 'last').reset_index(drop = True)
+    return run
+
+
+# SQLite reads
+
+def _scaled_database(scale):
+    '''Returns a database whose tables are scale times larger than those
+    of network_database.db. Like that database, it contains one year of
+    fall and spring results, so test_results grows by the same factor as
+    curr_enrollment.'''
+    if scale == 1:
+        return database_path
+    from database_generator import generate_database
+    scaled_database_path = os.path.join(_scaled_folder(scale),
+    'network_database_1_year.db') # (The file name reflects the
+    # generation settings so that databases created with other settings
+    # won't get reused.)
+    if not os.path.exists(scaled_database_path):
+        generate_database(scaled_database_path, students = 4000 * scale,
+        years = 1, periods = ('Fall', 'Spring'))
+    return scaled_database_path
+
+
+def setup_read_database(scale):
+    '''Reads entire tables, a filtered subset of test_results, and a
+    selection of columns from curr_enrollment.'''
+    from db_access import ensure_indexes, get_engine, read_table
+    indexed_database_path = _scaled_database(scale)
+    if scale == 1:
+        # Indexing a copy of network_database.db keeps this scenario from
+        # modifying the database that the rest of the project uses.
+        indexed_database_path = os.path.join(_scaled_folder(scale),
+        'network_database_indexed.db')
+        shutil.copyfile(database_path, indexed_database_path)
+    engine = get_engine(indexed_database_path)
+    # (Creating the indexes here, during setup, keeps their one-time cost
+    # out of the timed runs.)
+    ensure_indexes(engine)
+    def run():
+        return [read_table('test_results', engine = engine),
+        read_table('test_results', filters = [('School', '==', 'CA'),
+        ('Period', '==', 'Spring')], engine = engine),
+        read_table('curr_enrollment', columns = ['Student_ID', 'School',
+        'Grade', 'Lat', 'Lon'], engine = engine),
+        read_table('grad_outcomes', engine = engine)]
+    return run
+
+
+# Sheets export (using the local worksheet stand-in rather than Google
+# Sheets itself)
+#
+# LocalWorksheet stores values in memory within the benchmark process, so
+# these scenarios measure the time spent comparing the table to its
+# snapshot, converting values into cells, and planning requests. The time
+# that gspread would spend serializing those requests and sending them
+# over HTTP (along with any batching or rate limiting by the Sheets API)
+# is outside the scope of these benchmarks.
+
+def _enrollment_table(scale):
+    from db_access import get_engine, read_table
+    return read_table('curr_enrollment', compact = False,
+    engine = get_engine(_scaled_database(scale)))
+
+
+def setup_sheets_full_export(scale):
+    '''Uploads the entire enrollment table to a LocalWorksheet. (No HTTP
+    requests are made; see the note above.)'''
+    from sheets_functions import LocalWorksheet, sync_dataframe_to_worksheet
+    df_enrollment = _enrollment_table(scale)
+    worksheet = LocalWorksheet('Current Enrollment')
+    return lambda: sync_dataframe_to_worksheet(worksheet, df_enrollment,
+    'Student_ID', snapshot_path = None, full_rewrite = True)
+
+
+def setup_sheets_incremental_sync(scale):
+    '''Uploads the enrollment table, changes 1% of its rows, and then
+    measures the time needed to sync those changes to a LocalWorksheet.
+    (No HTTP requests are made; see the note above.)'''
+    from sheets_functions import LocalWorksheet, sync_dataframe_to_worksheet
+    df_enrollment = _enrollment_table(scale)
+    worksheet = LocalWorksheet('Current Enrollment')
+    snapshot_path = os.path.join(_temporary_folder(), 'snapshot.json')
+    sync_dataframe_to_worksheet(worksheet, df_enrollment, 'Student_ID',
+    snapshot_path)
+    df_updated = df_enrollment.copy()
+    changed_rows = np.random.default_rng(0).choice(len(df_updated),
+    size = max(len(df_updated) // 100, 1), replace = False)
+    df_updated.loc[changed_rows, 'Grade_for_Sorting'] += 1
+    return lambda: sync_dataframe_to_worksheet(worksheet, df_updated,
+    'Student_ID', snapshot_path)
+
+
+scenarios = {
+'prepare_county_table':setup_prepare_county_table,
+'render_map':setup_render_map,
+'clean_test_results':setup_clean_test_results,
+'read_database':setup_read_database,
+'sheets_full_export':setup_sheets_full_export,
+'sheets_incremental_sync':setup_sheets_incremental_sync}
@@ -0,0 +1,305 @@
+# Ingestion Functions:
+# Functions for importing and cleaning per-school test result files
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# These functions are based on the reformat_results() code within
+# data_cleaning.ipynb. That notebook re-reads and cleans every result file
+# each time it runs; the functions below instead keep track of which files
+# have already been processed (within a 'manifest' file) so that only new
+# or modified files need to be read. These new files can also be processed
+# in parallel.
+
+import hashlib
+import io
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import sqlalchemy
+
+# The column order used within the test_results database table (plus
+# a Test_Day column, which is needed in order to remove duplicate results):
+result_columns = ['Student_ID', 'School', 'Grade', 'Starting_Year',
+'Period', 'Score', 'Test_Day']
+
+manifest_columns = ['path', 'size', 'mtime_ns', 'sha256', 'rows',
+'ingested_at']
+
+# Result files are expected to have names like 'CA Test Day 1 Results.csv'.
+result_file_pattern = re.compile(
+    r'^(?P<school>\S+) Test Day (?P<test_day>\d+) Results\.csv$')
+
+
+def parse_result_folder_name(result_folder):
+    '''Retrieves the testing period and starting year from a result folder
+    name (e.g. 'winter_2023_2024_test_results' becomes ('Winter', 2023)).'''
+    folder_name = os.path.basename(os.path.normpath(result_folder))
+    period = folder_name.split('_')[0].title()
+    starting_year = int(folder_name.split('_')[1])
+    return period, starting_year
+
+
+def clean_result_table(df_result, school, test_day, period, starting_year):
+    '''Converts a set of raw results into a format compatible with our
+    test_results table. Each step uses a vectorized pandas string operation,
+    so the cost of this function depends mostly on the number of rows
+    rather than on Python-level loops.'''
+    df_result = df_result.rename(columns = {
+        'Identification Code':'Student_ID', "Student's Grade":'Grade'})
+    df_result['Score'] = pd.to_numeric(
+        df_result['Score'].str.rstrip('%')).astype('int64')
+    # Extracting the leading number (or 'K', for 'Kindergarten') from each
+    # grade. (Keeping only the first character, as in data_cleaning.ipynb,
+    # would convert '10th Grade', '11th Grade', and '12th Grade' to '1'.)
+    df_result['Grade'] = df_result['Grade'].str.extract(
+        r'^(\d+|K)', expand = False)
+    # Removing all non-digit characters from the ID column:
+    df_result['Student_ID'] = df_result['Student_ID'].str.replace(
+        r'\D', '', regex = True).astype('int64')
+    df_result['School'] = school
+    df_result['Period'] = period
+    df_result['Starting_Year'] = starting_year
+    df_result['Test_Day'] = test_day
+    return df_result[result_columns].copy()
+
+
+def _read_result_file(file_path, period, starting_year):
+    '''Reads, hashes, and cleans a single result file. The file is read
+    into memory only once; the same bytes are used for both hashing
+    and parsing.
+
+    This function is defined at the top level of this module so that it
+    can be run within separate processes.'''
+    file_match = result_file_pattern.match(os.path.basename(file_path))
+    with open(file_path, 'rb') as result_file:
+        file_bytes = result_file.read()
+    df_result = pd.read_csv(io.BytesIO(file_bytes), dtype = str)
+    df_result = clean_result_table(df_result,
+    school = file_match.group('school'),
+    test_day = int(file_match.group('test_day')),
+    period = period, starting_year = starting_year)
+    return df_result, hashlib.sha256(file_bytes).hexdigest()
+
+
+def load_manifest(manifest_path):
+    '''Loads the list of files that have already been ingested (or an empty
+    manifest if none exists yet).'''
+    if not os.path.exists(manifest_path):
+        return pd.DataFrame(columns = manifest_columns)
+    return pd.read_csv(manifest_path, dtype = {'path':str, 'sha256':str})
+
+
+def _save_manifest(df_manifest, manifest_path):
+    temp_manifest_path = manifest_path + '.tmp'
+    df_manifest.to_csv(temp_manifest_path, index = False)
+    os.replace(temp_manifest_path, manifest_path)
+
+
+def _hash_file(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as result_file:
+        for block in iter(lambda: result_file.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def _cleaned_result_path(results_folder, relative_path):
+    '''Returns the path at which the cleaned copy of a given result file
+    will be stored. Each source file gets its own .parquet file, so
+    re-ingesting a modified file simply replaces its earlier output.'''
+    path_hash = hashlib.sha256(relative_path.encode()).hexdigest()[:16]
+    return os.path.join(results_folder, f'{path_hash}.parquet')
+
+
+def find_new_result_files(result_folder, df_manifest, manifest_folder):
+    '''Compares the result files within result_folder to the manifest and
+    returns a list of (file_path, relative_path, size, mtime_ns) tuples
+    for all files that are new or have been modified.
+
+    To keep re-runs fast, files whose size and modification time match
+    their manifest entries are skipped without being read. Files whose
+    modification time has changed (but whose size hasn't) are hashed;
+    if their hash still matches the manifest, they are skipped as well.
+    (In this case, the file's modification time is updated within
+    df_manifest so that it won't need to be hashed again.)'''
+    manifest_entries = {row['path']:(index, row) for index, row in
+    zip(df_manifest.index, df_manifest.to_dict('records'))}
+    new_files = []
+    for file_name in sorted(os.listdir(result_folder)):
+        if not file_name.endswith('.csv'):
+            continue
+        if result_file_pattern.match(file_name) is None:
+            raise ValueError(f"{file_name} doesn't match the expected \
+'[School] Test Day [Number] Results.csv' format.")
+        file_path = os.path.join(result_folder, file_name)
+        relative_path = os.path.relpath(file_path, manifest_folder).replace(
+            os.sep, '/')
+        file_stats = os.stat(file_path)
+        index, entry = manifest_entries.get(relative_path, (None, None))
+        if entry is not None and entry['size'] == file_stats.st_size:
+            if entry['mtime_ns'] == file_stats.st_mtime_ns:
+                continue
+            if entry['sha256'] == _hash_file(file_path):
+                df_manifest.at[index, 'mtime_ns'] = file_stats.st_mtime_ns
+                continue
+        new_files.append((file_path, relative_path, file_stats.st_size,
+        file_stats.st_mtime_ns))
+    return new_files
+
+
+def prepare_test_results_table(engine):
+    '''Adds a Test_Day column and a unique index on (Student_ID, 
+    Starting_Year, Period) to the test_results table if they aren't already
+    present. The index guarantees that each student has at most one result
+    per testing period, and it also allows upsert_test_results() to find
+    existing rows without scanning the whole table.
+
+    (Fall and spring results, which don't have test day information, will
+    have null Test_Day values.)'''
+    with engine.begin() as connection:
+        existing_columns = [row[1] for row in connection.exec_driver_sql(
+            "PRAGMA table_info(test_results)")]
+        if 'Test_Day' not in existing_columns:
+            connection.exec_driver_sql(
+                "ALTER TABLE test_results ADD COLUMN Test_Day BIGINT")
+        try:
+            connection.exec_driver_sql("""CREATE UNIQUE INDEX IF NOT EXISTS 
+            test_results_student_period ON test_results (Student_ID, 
+            Starting_Year, Period)""")
+        except sqlalchemy.exc.IntegrityError as error:
+            raise ValueError("test_results already contains multiple \
+results for the same student, year, and period. These duplicates will need \
+to be removed before the unique index can be created.") from error
+
+
+def upsert_test_results(df_results, engine):
+    '''Adds a batch of results to the test_results table. If a student
+    already has a result for the same starting year and period, the result
+    from the later test day will be kept. (Results without Test_Day values
+    will be replaced by any incoming result.)
+
+    Only the rows within df_results are read and written, so the cost of
+    this function depends on the size of the batch rather than on the size
+    of test_results. All rows are written within a single transaction;
+    therefore, if two cleaning runs take place at the same time, SQLite
+    will apply one batch after the other, and neither run will overwrite
+    the other's results.
+
+    Returns the number of rows in the deduplicated batch.'''
+    prepare_test_results_table(engine)
+    # Removing duplicates within the batch itself (which is much smaller
+    # than the full table) reduces the number of rows that need to be
+    # written. The ON CONFLICT clause below handles any conflicts with
+    # rows that are already in the database.
+    df_batch = df_results.sort_values('Test_Day', kind = 'stable'
+    ).drop_duplicates(subset = ['Student_ID', 'Starting_Year', 'Period'],
+    keep = 'last')[result_columns]
+    upsert_query = sqlalchemy.text("""INSERT INTO test_results (
+    Student_ID, School, Grade, Starting_Year, Period, Score, Test_Day)
+    VALUES (:Student_ID, :School, :Grade, :Starting_Year, :Period, :Score,
+    :Test_Day)
+    ON CONFLICT (Student_ID, Starting_Year, Period) DO UPDATE SET
+    School = excluded.School, Grade = excluded.Grade, Score = excluded.Score,
+    Test_Day = excluded.Test_Day
+    WHERE test_results.Test_Day IS NULL 
+    OR excluded.Test_Day >= test_results.Test_Day""")
+    with engine.begin() as connection:
+        connection.execute(upsert_query, df_batch.to_dict('records'))
+    return len(df_batch)
+
+
+def ingest_result_folder(result_folder, manifest_path, results_folder,
+    processes = 4, engine = None):
+    '''Cleans all new or modified result files within result_folder, then
+    saves their cleaned results within results_folder.
+
+    Variables:
+
+    result_folder: the folder containing the raw result files (e.g.
+    'winter_2023_2024_test_results'). The testing period and starting
+    year will be retrieved from this folder's name.
+
+    manifest_path: the path to a .csv file that lists each file that has
+    already been ingested, along with its size, modification time, and
+    SHA-256 hash. This file will be created if it doesn't exist. Files that
+    are already present within the manifest (and haven't changed since
+    they were ingested) will be skipped, so re-running this function after
+    a single new file arrives will only require that file to be processed.
+    To re-ingest all files, simply delete the manifest.
+
+    results_folder: the folder in which cleaned results will be stored
+    (as one .parquet file per source file). Use load_ingested_results()
+    to combine these files into a single DataFrame.
+
+    processes: the number of processes across which new files will be
+    read and cleaned. (If processes is 1, or only one file needs to be
+    ingested, all work will take place within the current process.)
+
+    engine: an optional SQLAlchemy engine. If provided, the new results
+    will also be added to the test_results table via upsert_test_results().
+
+    Returns a DataFrame containing the cleaned results from the newly
+    ingested files only. (These results are not deduplicated; a student
+    who took the test on multiple days will have multiple rows.)'''
+
+    period, starting_year = parse_result_folder_name(result_folder)
+    manifest_folder = os.path.dirname(os.path.abspath(manifest_path))
+    df_manifest = load_manifest(manifest_path)
+    new_files = find_new_result_files(result_folder, df_manifest,
+    manifest_folder)
+    os.makedirs(results_folder, exist_ok = True)
+    print(f"Found {len(new_files)} new or modified result files.")
+    if len(new_files) == 0:
+        _save_manifest(df_manifest, manifest_path)
+        return pd.DataFrame(columns = result_columns)
+
+    file_paths = [file_path for file_path, relative_path, size, mtime_ns
+    in new_files]
+    if processes > 1 and len(new_files) > 1:
+        with ProcessPoolExecutor(max_workers = min(
+            processes, len(new_files))) as executor:
+            parsed_files = list(executor.map(_read_result_file, file_paths,
+            [period] * len(file_paths), [starting_year] * len(file_paths)))
+    else:
+        parsed_files = [_read_result_file(file_path, period, starting_year)
+        for file_path in file_paths]
+
+    new_entries = []
+    for (file_path, relative_path, size, mtime_ns), (df_result, file_hash) \
+    in zip(new_files, parsed_files):
+        df_result.to_parquet(_cleaned_result_path(
+            results_folder, relative_path), index = False)
+        new_entries.append({'path':relative_path, 'size':size,
+        'mtime_ns':mtime_ns, 'sha256':file_hash, 'rows':len(df_result),
+        'ingested_at':time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    df_new_results = pd.concat([df_result for df_result, file_hash
+    in parsed_files], ignore_index = True)
+    if engine is not None:
+        upserted_rows = upsert_test_results(df_new_results, engine)
+        print(f"Added or updated {upserted_rows} rows within test_results.")
+
+    # The manifest is only updated after all cleaned results have been
+    # saved, so an interrupted run will simply re-ingest the same files
+    # the next time it runs. (Because upsert_test_results() keeps only one
+    # result per student and period, re-ingesting a file won't create
+    # duplicate rows.)
+    df_new_entries = pd.DataFrame(new_entries, columns = manifest_columns)
+    df_manifest = pd.concat([df_manifest[~df_manifest['path'].isin(
+        df_new_entries['path'])], df_new_entries], ignore_index = True)
+    _save_manifest(df_manifest, manifest_path)
+    return df_new_results
+
+
+def load_ingested_results(results_folder):
+    '''Combines all cleaned results within results_folder into a single
+    DataFrame.'''
+    result_paths = sorted(os.path.join(results_folder, file_name)
+    for file_name in os.listdir(results_folder)
+    if file_name.endswith('.parquet'))
+    if len(result_paths) == 0:
+        return pd.DataFrame(columns = result_columns)
+    return pd.concat([pd.read_parquet(result_path)
+    for result_path in result_paths], ignore_index = True)
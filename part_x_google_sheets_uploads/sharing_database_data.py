@@ -47,22 +47,33 @@
 # %%
 print("Starting program.")
 import time
+import os
 start_time = time.time() # Allows the program's runtime to be measured
 import pandas as pd
-import sqlalchemy
 import gspread
 from gspread_dataframe import set_with_dataframe
+from sheets_functions import (sync_dataframe_to_worksheet, export_tables,
+export_query_in_chunks)
 
 # %% [markdown]
 # ## Connecting to our database:
 # 
 # This local SQLite database was created using the database_generator.ipnyb code found in supplemental/db_generator. The steps for connecting to an online database are quite similar; for guidance on this process, visit the [app_functions_and_variables.py](https://github.com/kburchfiel/dash_school_dashboard/blob/main/dsd/app_functions_and_variables.py) file within my [Dash School Dashboard](https://github.com/kburchfiel/dash_school_dashboard) project.
 
+# %% [markdown]
+# The db_access.py script within supplemental/db_tools provides a shared engine for this database (so that each script doesn't need to create and configure its own). Its read_table() function also lets you specify columns and filters that will be applied within the database itself, and it stores the results using memory-efficient data types.
+
 # %%
-pfn_db_engine = sqlalchemy.create_engine(
-'sqlite:///'+'../data/network_database.db') 
-# Based on:
+import sys
+sys.path.append('../supplemental/db_tools')
+from db_access import ensure_indexes, get_engine, read_table
+
+pfn_db_engine = get_engine('../data/network_database.db') 
+# get_engine() calls sqlalchemy.create_engine() behind the scenes. See:
 #  https://docs.sqlalchemy.org/en/13/dialects/sqlite.html#connect-strings
+ensure_indexes(pfn_db_engine) # Adds indexes on commonly filtered columns
+# (if they aren't already present) so that any read_table() calls with
+# filters can skip rows that don't match them.
 
 pfn_db_engine
 
@@ -73,8 +84,7 @@ pfn_db_engine
 pd.read_sql("Select * from sqlite_schema", con = pfn_db_engine)
 
 # %%
-df_curr_enrollment = pd.read_sql("Select * from curr_enrollment", 
-con = pfn_db_engine)
+df_curr_enrollment = read_table('curr_enrollment', engine = pfn_db_engine)
 df_curr_enrollment
 
 # %% [markdown]
@@ -107,11 +117,95 @@ ws_name = 'Current Enrollment' # The name of the worksheet itself. One workbook
 
 wb = gc.open_by_key(wb_id)
 ws = wb.worksheet(ws_name)
-ws.clear()
-set_with_dataframe(ws, df_curr_enrollment) # This code uploads df_curr_enrollment
-# to the worksheet specified by ws. If this code doesn't work for you, make
-# sure that you have completed all of the prerequisites listed earlier 
-# in this notebook.
+
+# %% [markdown]
+# Clearing the worksheet and re-uploading the whole table each time this script runs can be slow (and can use up a significant portion of your Sheets API quota) for larger tables. Therefore, by default, this script only uploads the cells that have changed since the last run. It does so by storing a copy of the most recently uploaded data within a local snapshot file, then comparing the current table to that snapshot. (See sync_dataframe_to_worksheet() within sheets_functions.py for more details.) The first run will still upload the full table.
+# 
+# If you'd prefer to use the original clear-and-rewrite approach, set sync_mode to 'full'. You may also want to do so if the worksheet might have been edited by hand, since the snapshot won't reflect those edits.
+
+# %%
+sync_mode = 'incremental' # Set to 'full' to clear the worksheet and
+# re-upload the entire table.
+snapshot_path = 'curr_enrollment_snapshot.json' # Like the service key,
+# this file should be kept in a secure location, as it contains a full
+# copy of the uploaded table. (Snapshot files within this folder are
+# excluded from the project's Git repository via .gitignore.)
+
+if sync_mode == 'full':
+    ws.clear()
+    set_with_dataframe(ws, df_curr_enrollment) # This code uploads 
+    # df_curr_enrollment to the worksheet specified by ws. If this code 
+    # doesn't work for you, make sure that you have completed all of the 
+    # prerequisites listed earlier in this notebook.
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path) # The old snapshot no longer matches
+        # the worksheet's layout, so the next incremental run
+        # will need to start over with a full upload.
+else:
+    sync_dataframe_to_worksheet(ws, df_curr_enrollment, 
+    key_column = 'Student_ID', snapshot_path = snapshot_path)
+
+# %% [markdown]
+# ## Exporting additional tables:
+# 
+# The code above exports a single table. To export several tables (or query results) at once, you can use export_tables() within sheets_functions.py. This function accepts a list of export jobs, each of which specifies a query, a destination workbook, and a destination worksheet (which will be created if it doesn't already exist). It runs all of the queries at the same time, then combines the updates for each workbook into a small number of requests. It also paces those requests so as to stay within the Sheets API's rate limits, and it will retry requests that fail due to those limits. As a result, exporting all of the tables below should take only a bit longer than exporting the largest one on its own.
+
+# %% [markdown]
+# You can also export summary tables that store pre-calculated averages and enrollment totals. These tables are created (and kept up to date) by the summary_tables.py script within supplemental/db_tools. refresh_summary_tables() only recalculates the groups (e.g. school/grade pairs) whose underlying data has changed since its last run, so calling it before each export takes very little time.
+# 
+# Note, however, that the first call to refresh_summary_tables() will add these summary tables (along with the triggers that keep them up to date) to network_database.db. Therefore, these exports are turned off by default; set export_summary_tables to True to include them.
+
+# %%
+from summary_tables import refresh_summary_tables
+
+# %%
+export_additional_tables = False # Set to True to create (or update) the
+# worksheets below within your workbook. (These exports will also save
+# snapshot files within this folder.)
+export_summary_tables = False # Set to True to create (or refresh) the
+# summary tables within network_database.db and export them.
+
+export_jobs = [
+{'query':'Select * from test_results', 'workbook_id':wb_id,
+ 'worksheet':'Test Results', 'snapshot_path':'test_results_snapshot.json'},
+{'query':'Select * from grad_outcomes', 'workbook_id':wb_id,
+ 'worksheet':'Graduation Outcomes', 'key_column':'Student_ID',
+ 'snapshot_path':'grad_outcomes_snapshot.json'}]
+# (test_results doesn't contain a column that uniquely identifies each row,
+# so no key column is specified for it. Its worksheet will be rewritten
+# whenever its data changes.)
+
+summary_export_jobs = [
+{'query':'''Select School, Grade, Starting_Year, Period, 
+ Round(Average_Score, 2) as Average_Score, Score_Count as Students 
+ from summary_test_scores''',
+ 'workbook_id':wb_id, 'worksheet':'Average Scores',
+ 'snapshot_path':'average_scores_snapshot.json'},
+{'query':'''Select School, Grade, Students from summary_enrollment
+ order by School, Grade_for_Sorting''',
+ 'workbook_id':wb_id, 'worksheet':'Enrollment by School and Grade',
+ 'snapshot_path':'enrollment_by_school_snapshot.json'}]
+
+if export_additional_tables == True:
+    if export_summary_tables == True:
+        refresh_summary_tables(pfn_db_engine)
+        export_jobs = export_jobs + summary_export_jobs
+    df_export_results = export_tables(export_jobs, engine = pfn_db_engine,
+    gc = gc, requests_per_minute = 60)
+    print(df_export_results)
+
+# %% [markdown]
+# ## Exporting very large tables:
+# 
+# The code above reads each table into memory before uploading it. This works fine for our 4,000-student dataset, but a table with millions of rows (such as several years' worth of test results) might not fit into memory. export_query_in_chunks() can handle these tables by reading and writing them a few thousand rows at a time. It can export data either to a worksheet or to a local .csv or .parquet file, and it will print out its progress every few seconds.
+
+# %%
+export_test_results_in_chunks = False # Set to True to try out this option
+
+if export_test_results_in_chunks == True:
+    export_query_in_chunks('Select * from test_results', 
+    engine = pfn_db_engine, destination = 'test_results_export.parquet',
+    chunk_size = 50000, dtype = {'Student_ID':'int64', 'Score':'float64'})
 
 # %%
 end_time = time.time()
@@ -0,0 +1,873 @@
+# Sheets Functions:
+# A set of functions for exporting database tables to Google Sheets
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# These functions build on the approach shown in sharing_database_data.py.
+# That script clears a worksheet and then re-uploads an entire table each
+# time it runs. The functions below instead keep a local snapshot of the
+# data that was last uploaded so that only the cells that have changed
+# since then need to be sent to Google Sheets.
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1, a1_to_rowcol, absolute_range_name
+
+
+def dataframe_to_cell_values(df):
+    '''Converts a DataFrame into a list of rows of strings (with missing
+    values represented as empty strings). This is the format in which the
+    data will be compared with earlier uploads and sent to Google Sheets.
+    (Because the data is sent with the 'USER_ENTERED' option, Google Sheets
+    will still convert numbers back into a numeric format.)'''
+    return df.astype(object).where(df.notna(), '').astype(str).values.tolist()
+
+
+def _fingerprint(columns, rows, key_position = None):
+    '''Returns a SHA-256 hash of a table's columns and rows. If two tables
+    have the same fingerprint, their contents are identical.
+
+    key_position: the position of the table's key column, if any. The rows
+    are sorted by this column before being hashed, so tables whose rows
+    are stored in different orders (such as a DataFrame and the worksheet
+    to which it was synced) will still have the same fingerprint.'''
+    if key_position is not None:
+        rows = sorted(rows, key = lambda row: row[key_position])
+    return hashlib.sha256(json.dumps([columns, rows]).encode()).hexdigest()
+
+
+def _load_snapshot(snapshot_path):
+    if snapshot_path is None or not os.path.exists(snapshot_path):
+        return None
+    with open(snapshot_path) as snapshot_file:
+        return json.load(snapshot_file)
+
+
+def _save_snapshot(snapshot_path, snapshot):
+    if snapshot_path is None:
+        return
+    # Writing to a temporary file, then renaming it, ensures that a failed
+    # run won't leave behind a partially-written snapshot.
+    temp_snapshot_path = snapshot_path + '.tmp'
+    with open(temp_snapshot_path, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temp_snapshot_path, snapshot_path)
+
+
+def _changed_ranges(old_rows, new_rows, column_count):
+    '''Compares two equally-sized lists of rows and returns a list of
+    (first_row, last_row, first_column, last_column) rectangles (with
+    0-based, inclusive positions) that together cover all changed cells.
+
+    Changed cells within the same row are first grouped into runs of
+    adjacent columns; runs that cover the same columns within consecutive
+    rows are then combined into a single rectangle. This keeps the number
+    of ranges (and thus the size of the update request) small.'''
+    if len(new_rows) == 0:
+        return []
+    changed = np.array(old_rows, dtype = object).reshape(
+        -1, column_count) != np.array(new_rows, dtype = object).reshape(
+        -1, column_count)
+    rectangles = []
+    open_rectangles = {} # Maps (first_column, last_column) runs to the
+    # rectangles that they can extend
+    for row_index in np.flatnonzero(changed.any(axis = 1)):
+        changed_columns = np.flatnonzero(changed[row_index])
+        # Splitting the changed columns into runs of adjacent columns:
+        run_starts = np.concatenate([[0],
+        np.flatnonzero(np.diff(changed_columns) > 1) + 1])
+        run_ends = np.concatenate([run_starts[1:] - 1,
+        [len(changed_columns) - 1]])
+        for run_start, run_end in zip(run_starts, run_ends):
+            run = (changed_columns[run_start], changed_columns[run_end])
+            rectangle = open_rectangles.get(run)
+            if rectangle is not None and rectangle[1] == row_index - 1:
+                rectangle[1] = row_index
+            else:
+                rectangle = [row_index, row_index, run[0], run[1]]
+                rectangles.append(rectangle)
+                open_rectangles[run] = rectangle
+    return [tuple(int(value) for value in rectangle)
+    for rectangle in rectangles]
+
+
+def _assign_row_slots(old_keys, new_keys):
+    '''Determines the row (within the worksheet) in which each key in
+    new_keys should be stored. Rows whose keys are still present stay where
+    they are; new keys fill the rows left behind by removed keys before
+    being added to the end of the sheet. If more keys were removed than
+    added, rows from the bottom of the sheet get moved into the remaining
+    gaps so that the sheet doesn't contain any blank rows.
+
+    Returns a list of keys in their new worksheet order.'''
+    new_key_set = set(new_keys)
+    layout = [key if key in new_key_set else None for key in old_keys]
+    old_key_set = set(old_keys)
+    added_keys = [key for key in new_keys if key not in old_key_set]
+    free_slots = [i for i, key in enumerate(layout) if key is None]
+    for slot, key in zip(free_slots, added_keys):
+        layout[slot] = key
+    layout.extend(added_keys[len(free_slots):])
+    # Filling any remaining gaps with rows from the end of the sheet:
+    for slot in free_slots[len(added_keys):]:
+        while len(layout) > 0 and layout[-1] is None:
+            layout.pop()
+        if slot >= len(layout):
+            break
+        layout[slot] = layout.pop()
+    while len(layout) > 0 and layout[-1] is None:
+        layout.pop()
+    return layout
+
+
+def plan_worksheet_sync(df, key_column, snapshot_path, full_rewrite = False):
+    '''Compares df with the snapshot stored at snapshot_path and determines
+    which requests will be needed in order to bring the corresponding
+    worksheet up to date. No requests are actually sent; instead, this
+    function returns a dictionary (a 'plan') with the following items:
+
+    'full_rewrite': True if the whole worksheet needs to be cleared and
+    rewritten; False if only certain cells need to be updated.
+    'update_data': a list of {'range':..., 'values':...} dictionaries
+    (in the format used by gspread's batch_update() function).
+    'clear_ranges': a list of ranges whose contents should be cleared.
+    'required_rows': the number of rows that the worksheet will need.
+    'changed_cells': the number of cells that will be updated.
+    'snapshot': the snapshot to save once the updates have been made.
+
+    This step is kept separate from sync_dataframe_to_worksheet() so that
+    the updates for multiple worksheets can be combined into a single
+    request (as shown in export_tables()). See
+    sync_dataframe_to_worksheet() for details on each variable. If
+    key_column is None, any change to the table will result in a full
+    rewrite.'''
+
+    if key_column is not None and df[key_column].duplicated().any():
+        raise ValueError(f"Error: {key_column} contains duplicate values, \
+so it can't be used as a key column.")
+    columns = [str(column) for column in df.columns]
+    key_position = columns.index(
+        str(key_column)) if key_column is not None else None
+    new_rows = dataframe_to_cell_values(df)
+    new_fingerprint = _fingerprint(columns, new_rows, key_position)
+    snapshot = None if full_rewrite == True else _load_snapshot(snapshot_path)
+    plan = {'full_rewrite':False, 'update_data':[], 'clear_ranges':[],
+    'required_rows':len(new_rows) + 1, 'changed_cells':0, 'snapshot':None}
+
+    if snapshot is not None and snapshot['fingerprint'] == new_fingerprint:
+        return plan
+
+    if (snapshot is None or snapshot['columns'] != columns
+    or key_column is None):
+        plan['full_rewrite'] = True
+        plan['update_data'] = [{'range':'A1', 'values':[columns] + new_rows}]
+        plan['changed_cells'] = (len(new_rows) + 1) * len(columns)
+        sheet_rows = new_rows
+    else:
+        old_rows = snapshot['rows']
+        old_keys = [row[key_position] for row in old_rows]
+        new_keys = [row[key_position] for row in new_rows]
+        rows_by_key = dict(zip(new_keys, new_rows))
+        sheet_keys = _assign_row_slots(old_keys, new_keys)
+        sheet_rows = [rows_by_key[key] for key in sheet_keys]
+
+        # Padding the old rows with blank rows (for newly-added rows at
+        # the bottom of the sheet) so that both tables have the same size:
+        blank_row = [''] * len(columns)
+        padded_old_rows = old_rows + [blank_row] * max(
+            len(sheet_rows) - len(old_rows), 0)
+        rectangles = _changed_ranges(padded_old_rows[:len(sheet_rows)],
+        sheet_rows, len(columns))
+        # (Row 1 of the worksheet contains the column names, so each
+        # table row is stored one row further down.)
+        plan['update_data'] = [{'range':rowcol_to_a1(
+            first_row + 2, first_column + 1) + ':' + rowcol_to_a1(
+            last_row + 2, last_column + 1),
+        'values':[row[first_column:last_column + 1]
+        for row in sheet_rows[first_row:last_row + 1]]}
+        for first_row, last_row, first_column, last_column in rectangles]
+        plan['changed_cells'] = sum((last_row - first_row + 1) *
+        (last_column - first_column + 1) for first_row, last_row,
+        first_column, last_column in rectangles)
+        if len(old_rows) > len(sheet_rows):
+            # Clearing rows that are no longer needed:
+            plan['clear_ranges'] = [rowcol_to_a1(len(sheet_rows) + 2, 1) + ':'
+            + rowcol_to_a1(len(old_rows) + 1, len(columns))]
+
+    # The snapshot stores the rows in the order in which they appear within
+    # the worksheet, so the next comparison will line up with the sheet.
+    # (Since the fingerprint is based on the key-sorted rows, it matches
+    # that of df even if the worksheet's rows are in a different order.)
+    plan['snapshot'] = {'columns':columns, 'rows':sheet_rows,
+    'fingerprint':new_fingerprint}
+    return plan
+
+
+def sync_dataframe_to_worksheet(ws, df, key_column, snapshot_path,
+    full_rewrite = False):
+    '''Updates a Google Sheets worksheet so that it matches df while sending
+    as little data as possible.
+
+    The first time this function runs (or whenever full_rewrite is True or
+    df's columns change), the worksheet is overwritten with the entire
+    table. A copy of the uploaded data is then saved to snapshot_path.
+    On later runs, the function compares df with this snapshot and only
+    uploads the cells that have changed, using a single batched request.
+    If nothing has changed, no requests are sent at all. Unlike the
+    ws.clear() approach in sharing_database_data.py, this also means that
+    the worksheet never appears empty while an update is in progress.
+
+    Variables:
+
+    ws: a gspread worksheet (e.g. wb.worksheet('Current Enrollment')), or
+    any object that provides the same update(), batch_update(),
+    batch_clear(), clear(), add_rows(), add_cols(), row_count, and
+    col_count members (such as LocalWorksheet below).
+
+    df: the DataFrame to upload.
+
+    key_column: a column that uniquely identifies each row (e.g.
+    'Student_ID'). Rows are matched to their earlier versions using this
+    column, so each row's position within the worksheet will stay the same
+    from one run to the next. (As a result, the worksheet's row order may
+    differ from df's; new rows are placed in the gaps left by removed rows
+    or at the bottom of the sheet.)
+
+    snapshot_path: the path to the .json file in which the snapshot will be
+    stored. Note that this file will contain a full copy of the data, so
+    it should be stored as securely as the database itself.
+
+    full_rewrite: set to True to overwrite the entire worksheet regardless
+    of whether a snapshot exists. This is useful if the worksheet may have
+    been edited by hand.
+
+    Returns a dictionary with the number of changed cells, ranges, and
+    requests, which can be useful for monitoring.'''
+
+    plan = plan_worksheet_sync(df, key_column, snapshot_path,
+    full_rewrite = full_rewrite)
+    stats = {'changed_cells':plan['changed_cells'],
+    'ranges':len(plan['update_data']), 'requests':0}
+    if plan['snapshot'] is None:
+        print("No changes found; the worksheet is already up to date.")
+        return stats
+
+    if plan['full_rewrite'] == True:
+        print("Uploading the full table:")
+        ws.clear()
+        stats['requests'] += 1
+    if ws.row_count < plan['required_rows']:
+        ws.add_rows(plan['required_rows'] - ws.row_count)
+        stats['requests'] += 1
+    if ws.col_count < len(df.columns):
+        ws.add_cols(len(df.columns) - ws.col_count)
+        stats['requests'] += 1
+    if len(plan['update_data']) > 0:
+        ws.batch_update(plan['update_data'],
+        value_input_option = 'USER_ENTERED')
+        stats['requests'] += 1
+    if len(plan['clear_ranges']) > 0:
+        ws.batch_clear(plan['clear_ranges'])
+        stats['requests'] += 1
+    if plan['full_rewrite'] == False:
+        print(f"Updated {stats['changed_cells']} cells within \
+{stats['ranges']} ranges.")
+
+    _save_snapshot(snapshot_path, plan['snapshot'])
+    return stats
+
+
+class TokenBucket:
+    '''Limits the rate at which requests are sent to the Google Sheets API.
+    
+    The bucket starts out with 'burst' tokens and gains new tokens at a rate
+    of requests_per_minute / 60 per second (up to a maximum of 'burst'
+    tokens). Each request uses up one token; if no tokens are available,
+    acquire() waits until one becomes available. A single TokenBucket can be
+    shared by multiple threads so that their combined request rate stays
+    within your quota. (As of 2024, the default Sheets API quota was 60
+    requests per minute per user and 300 requests per minute per project.)'''
+
+    def __init__(self, requests_per_minute = 60, burst = None):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst if burst is not None else max(
+            1, requests_per_minute // 6)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (
+                    now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def call_with_backoff(request, token_bucket = None, max_retries = 6,
+    max_delay = 64, retry_codes = (429, 500, 502, 503)):
+    '''Calls request (a function that takes no arguments, such as
+    lambda: ws.update(...)) and returns its result. If the Sheets API
+    responds with a rate-limit error (code 429) or a temporary server error,
+    the request will be retried after an exponentially increasing delay
+    (1, 2, 4, 8... seconds, plus a random amount of 'jitter' so that
+    multiple threads don't retry at the same time). This approach is
+    based on the truncated exponential backoff algorithm recommended within
+    the Sheets API documentation.
+
+    If token_bucket is provided, a token will be acquired before each
+    attempt.'''
+    for attempt in range(max_retries + 1):
+        if token_bucket is not None:
+            token_bucket.acquire()
+        try:
+            return request()
+        except APIError as error:
+            if error.code not in retry_codes or attempt == max_retries:
+                raise
+            delay = min(2 ** attempt + random.random(), max_delay)
+            retry_after = error.response.headers.get('Retry-After')
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            print(f"Received error code {error.code}; retrying in \
+{round(delay, 1)} seconds.")
+            time.sleep(delay)
+
+
+def _split_update_data(update_data, max_cells_per_request):
+    '''Splits a list of {'range':..., 'values':...} entries into batches
+    that each contain no more than (roughly) max_cells_per_request cells.
+    Entries that are too large to fit within a single batch are split
+    into groups of rows. (Ranges may include a worksheet name, as in
+    "'Test Results'!A1".)'''
+    batches = [[]]
+    batch_cells = 0
+    for entry in update_data:
+        sheet_prefix, cell_range = entry['range'].rpartition('!')[::2]
+        sheet_prefix = sheet_prefix + '!' if sheet_prefix else ''
+        start_row, start_col = a1_to_rowcol(cell_range.split(':')[0])
+        values = entry['values']
+        row_width = max(max((len(row) for row in values), default = 1), 1)
+        rows_per_piece = max(1, max_cells_per_request // row_width)
+        if len(values) <= rows_per_piece:
+            pieces = [entry]
+        else:
+            pieces = [{'range':sheet_prefix + rowcol_to_a1(
+                start_row + offset, start_col),
+            'values':values[offset:offset + rows_per_piece]}
+            for offset in range(0, len(values), rows_per_piece)]
+        for piece in pieces:
+            piece_cells = len(piece['values']) * row_width
+            if (batch_cells + piece_cells > max_cells_per_request
+            and len(batches[-1]) > 0):
+                batches.append([])
+                batch_cells = 0
+            batches[-1].append(piece)
+            batch_cells += piece_cells
+    return [batch for batch in batches if len(batch) > 0]
+
+
+def _export_workbook(gc, workbook_id, workbook_jobs, read_futures,
+    token_bucket, max_cells_per_request):
+    '''Writes all of the tables destined for a given workbook. The updates
+    for all of this workbook's worksheets are combined into as few requests
+    as possible: one to add any missing rows or columns, one to clear
+    outdated ranges, and one or more to upload new values.'''
+    wb = call_with_backoff(lambda: gc.open_by_key(workbook_id), token_bucket)
+    existing_worksheets = {ws.title:ws for ws in call_with_backoff(
+        wb.worksheets, token_bucket)}
+    request_count = 2
+    plans = []
+    for job, read_future in zip(workbook_jobs, read_futures):
+        df, read_time = read_future.result()
+        ws = existing_worksheets.get(job['worksheet'])
+        # If the worksheet is missing (e.g. because it was deleted or
+        # renamed), its snapshot no longer describes its contents, so the
+        # whole table needs to be written to the new worksheet.
+        plan = plan_worksheet_sync(df, job.get('key_column'),
+        job.get('snapshot_path'),
+        full_rewrite = job.get('full_rewrite', False) or ws is None)
+        if ws is None:
+            ws = call_with_backoff(lambda: wb.add_worksheet(
+                title = job['worksheet'], rows = plan['required_rows'],
+                cols = len(df.columns)), token_bucket)
+            request_count += 1
+        plans.append((job, df, read_time, ws, plan))
+
+    resize_requests = []
+    clear_ranges = []
+    update_data = []
+    for job, df, read_time, ws, plan in plans:
+        if plan['snapshot'] is None:
+            continue
+        for dimension, current_size, required_size in [
+            ('ROWS', ws.row_count, plan['required_rows']),
+            ('COLUMNS', ws.col_count, len(df.columns))]:
+            if current_size < required_size:
+                resize_requests.append({'appendDimension':{'sheetId':ws.id,
+                'dimension':dimension, 'length':required_size - current_size}})
+        if plan['full_rewrite'] == True:
+            clear_ranges.append(absolute_range_name(ws.title))
+        clear_ranges.extend(absolute_range_name(ws.title, range_name)
+        for range_name in plan['clear_ranges'])
+        update_data.extend({'range':absolute_range_name(ws.title,
+        entry['range'].split(':')[0]), 'values':entry['values']}
+        for entry in plan['update_data'])
+
+    if len(resize_requests) > 0:
+        call_with_backoff(lambda: wb.batch_update(
+            {'requests':resize_requests}), token_bucket)
+        request_count += 1
+    if len(clear_ranges) > 0:
+        call_with_backoff(lambda: wb.values_batch_clear(
+            body = {'ranges':clear_ranges}), token_bucket)
+        request_count += 1
+    for batch in _split_update_data(update_data, max_cells_per_request):
+        call_with_backoff(lambda: wb.values_batch_update(
+            body = {'valueInputOption':'USER_ENTERED', 'data':batch}),
+            token_bucket)
+        request_count += 1
+
+    results = []
+    for job, df, read_time, ws, plan in plans:
+        if plan['snapshot'] is not None:
+            _save_snapshot(job.get('snapshot_path'), plan['snapshot'])
+        results.append({'workbook_id':workbook_id,
+        'worksheet':job['worksheet'], 'rows':len(df),
+        'changed_cells':plan['changed_cells'],
+        'full_rewrite':plan['full_rewrite'],
+        'read_seconds':round(read_time, 3)})
+    for result in results:
+        result['workbook_requests'] = request_count
+    return results
+
+
+def _read_table(query, engine):
+    start_time = time.time()
+    df = pd.read_sql(query, con = engine)
+    return df, time.time() - start_time
+
+
+def export_tables(jobs, engine, gc, requests_per_minute = 60,
+    read_workers = 4, write_workers = 4, max_cells_per_request = 100000):
+    '''Exports multiple database tables (or query results) to multiple
+    Google Sheets worksheets within a single run.
+
+    All queries are run concurrently, and each workbook begins uploading
+    as soon as all of its own tables have been read. The updates for all
+    worksheets within the same workbook are combined into a small number of
+    batched requests (see _export_workbook()), and different workbooks are
+    updated in parallel. As a result, a run covering many tables should
+    take only slightly longer than the slowest individual export. All
+    requests share a single TokenBucket so that the run stays within
+    your Sheets API quota, and requests that encounter rate-limit errors
+    are retried via call_with_backoff().
+
+    Variables:
+
+    jobs: a list of dictionaries, each of which describes one export.
+    Each dictionary should contain the following keys:
+    'query': the SQL query whose results should be exported (e.g.
+    'Select * from curr_enrollment').
+    'workbook_id': the ID of the destination workbook.
+    'worksheet': the name of the destination worksheet. (This worksheet
+    will be created if it doesn't already exist.)
+    The following keys are optional:
+    'key_column' and 'snapshot_path': if both are provided, only changed
+    cells will be uploaded (as described within
+    sync_dataframe_to_worksheet()). If only snapshot_path is provided,
+    the worksheet will be rewritten only when the table has changed.
+    If neither is provided, the worksheet will be rewritten on every run.
+    'full_rewrite': set to True to rewrite the worksheet regardless of
+    its snapshot.
+
+    engine: a SQLAlchemy engine (e.g. pfn_db_engine within
+    sharing_database_data.py).
+
+    gc: a gspread client (e.g. the output of gspread.service_account()).
+
+    requests_per_minute: the maximum number of requests that will be sent
+    per minute (across all workbooks).
+
+    read_workers and write_workers: the number of queries and workbooks,
+    respectively, that will be processed at the same time.
+
+    max_cells_per_request: the maximum number of cells to include within
+    each values_batch_update() request. Larger requests reduce the number of
+    API calls, but Google recommends keeping each request's payload
+    under 2 MB.
+
+    Returns a DataFrame with one row per job.'''
+
+    token_bucket = TokenBucket(requests_per_minute = requests_per_minute)
+    jobs_by_workbook = {}
+    for job in jobs:
+        jobs_by_workbook.setdefault(job['workbook_id'], []).append(job)
+
+    with ThreadPoolExecutor(max_workers = read_workers) as read_executor, \
+    ThreadPoolExecutor(max_workers = write_workers) as write_executor:
+        read_futures = {id(job):read_executor.submit(
+            _read_table, job['query'], engine) for job in jobs}
+        write_futures = [write_executor.submit(_export_workbook, gc,
+        workbook_id, workbook_jobs,
+        [read_futures[id(job)] for job in workbook_jobs],
+        token_bucket, max_cells_per_request)
+        for workbook_id, workbook_jobs in jobs_by_workbook.items()]
+        results = [result for future in write_futures
+        for result in future.result()]
+    return pd.DataFrame(results)
+
+
+def _print_progress(stats):
+    elapsed = time.time() - stats['start_time']
+    print(f"Exported {stats['rows']:,} rows ({stats['chunks']} chunks) in \
+{round(elapsed, 1)} seconds ({round(stats['rows'] / max(elapsed, 1e-9)):,} \
+rows/second).")
+
+
+def export_query_in_chunks(query, engine, destination, chunk_size = 10000,
+    dtype = None, token_bucket = None, progress_interval = 5):
+    '''Exports the results of a query to a worksheet, a .csv file, or a
+    .parquet file without loading the entire table into memory.
+
+    The query results are read in chunks of chunk_size rows. Each chunk is
+    converted into the destination's format, written out, and then
+    discarded before the next chunk is read, so memory usage depends on
+    chunk_size rather than on the size of the table. This makes it possible
+    to export tables (such as historical test results) that wouldn't fit
+    into memory all at once.
+
+    Variables:
+
+    query: the SQL query whose results should be exported.
+
+    engine: a SQLAlchemy engine.
+
+    destination: either a gspread worksheet (or LocalWorksheet) or the path
+    to a .csv or .parquet file. Each chunk is written over the
+    worksheet's existing contents in a single request, and any rows (or
+    columns) left over from the previous version of the table are cleared
+    only after the last chunk has been written. As a result, the worksheet
+    never appears empty during the export, and an export that fails
+    partway through will leave the rest of the previous data in place.
+    (Note that Google Sheets workbooks are limited to 10 million cells,
+    so very large tables are better suited for .parquet files.)
+    Files are written to a temporary path first, then renamed once the
+    export finishes, so an interrupted export won't leave behind a
+    partial file.
+
+    chunk_size: the number of rows to read and write at a time.
+
+    dtype: an optional dictionary of column types (e.g.
+    {'Student_ID':'int64', 'Score':'float64'}) to pass to pd.read_sql().
+    Specifying these types ensures that each chunk will have the same
+    schema; otherwise, a column whose values happen to be missing within
+    one chunk could end up with a different type than in other chunks.
+    (This matters mainly for .parquet exports, which require a consistent
+    schema.)
+
+    token_bucket: an optional TokenBucket for pacing Sheets requests.
+
+    progress_interval: the minimum number of seconds between progress
+    updates. Set to None to disable these updates.
+
+    Returns a dictionary with the number of rows and chunks exported,
+    the total runtime, and the number of rows exported per second.'''
+
+    stats = {'rows':0, 'chunks':0, 'start_time':time.time()}
+    last_progress_time = stats['start_time']
+    is_file = isinstance(destination, str)
+    if is_file:
+        file_type = os.path.splitext(destination)[1].lower()
+        if file_type not in ['.csv', '.parquet']:
+            raise ValueError("destination must be a worksheet or a path \
+ending in .csv or .parquet.")
+        temp_path = destination + '.tmp'
+    parquet_writer = None
+    next_row = 1 # The worksheet row to which the next chunk will be written
+    column_count = 0
+
+    try:
+        with engine.connect().execution_options(
+            stream_results = True) as connection:
+            for chunk in pd.read_sql(query, con = connection,
+            chunksize = chunk_size, dtype = dtype):
+                if not is_file:
+                    values = dataframe_to_cell_values(chunk)
+                    if stats['chunks'] == 0:
+                        values = [[str(column) for column in chunk.columns]
+                        ] + values
+                        column_count = len(chunk.columns)
+                        if destination.col_count < column_count:
+                            call_with_backoff(lambda: destination.add_cols(
+                                column_count - destination.col_count),
+                                token_bucket)
+                    last_row = next_row + len(values) - 1
+                    if destination.row_count < last_row:
+                        call_with_backoff(lambda: destination.add_rows(
+                            last_row - destination.row_count), token_bucket)
+                    chunk_range = rowcol_to_a1(next_row, 1) + ':' + (
+                        rowcol_to_a1(last_row, column_count))
+                    call_with_backoff(lambda: destination.batch_update(
+                        [{'range':chunk_range, 'values':values}],
+                        value_input_option = 'USER_ENTERED'), token_bucket)
+                    next_row = last_row + 1
+                elif file_type == '.csv':
+                    chunk.to_csv(temp_path, index = False,
+                    mode = 'w' if stats['chunks'] == 0 else 'a',
+                    header = stats['chunks'] == 0)
+                else:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    table = pa.Table.from_pandas(chunk, preserve_index = False)
+                    if parquet_writer is None:
+                        parquet_writer = pq.ParquetWriter(
+                            temp_path, table.schema)
+                    parquet_writer.write_table(
+                        table.cast(parquet_writer.schema))
+                stats['rows'] += len(chunk)
+                stats['chunks'] += 1
+                if (progress_interval is not None and time.time() - 
+                last_progress_time >= progress_interval):
+                    _print_progress(stats)
+                    last_progress_time = time.time()
+        if parquet_writer is not None:
+            parquet_writer.close()
+            parquet_writer = None
+        if not is_file and stats['chunks'] > 0:
+            # Clearing any rows below (and columns to the right of) the
+            # newly written table:
+            leftover_ranges = []
+            if destination.row_count >= next_row:
+                leftover_ranges.append(rowcol_to_a1(next_row, 1) + ':' +
+                rowcol_to_a1(destination.row_count, destination.col_count))
+            if destination.col_count > column_count:
+                leftover_ranges.append(rowcol_to_a1(1, column_count + 1)
+                + ':' + rowcol_to_a1(next_row - 1, destination.col_count))
+            if len(leftover_ranges) > 0:
+                call_with_backoff(lambda: destination.batch_clear(
+                    leftover_ranges), token_bucket)
+        if is_file:
+            if stats['chunks'] == 0:
+                raise ValueError("The query didn't return any rows, so \
+no file was created.")
+            os.replace(temp_path, destination)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+        if is_file and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    if progress_interval is not None:
+        _print_progress(stats)
+    run_time = time.time() - stats.pop('start_time')
+    stats['seconds'] = round(run_time, 3)
+    stats['rows_per_second'] = round(stats['rows'] / max(run_time, 1e-9))
+    return stats
+
+
+class LocalWorksheet:
+    '''A stand-in for a gspread worksheet that stores its values in memory
+    (and, optionally, within a local .json file) rather than in Google
+    Sheets. This lets you test sync_dataframe_to_worksheet() and the other
+    functions in this file without a Google Cloud account or API quota.
+    It also records each request that it receives so that you can see how
+    many requests (and cells) an export would require.
+
+    Only the worksheet methods used within this file are supported.'''
+
+    def __init__(self, title = 'Sheet1', rows = 1000, cols = 26,
+    save_path = None, sheet_id = 0):
+        self.title = title
+        self.id = sheet_id
+        self.row_count = rows
+        self.col_count = cols
+        self.save_path = save_path
+        self.cells = {}
+        self.requests = []
+        if save_path is not None and os.path.exists(save_path):
+            with open(save_path) as save_file:
+                saved_data = json.load(save_file)
+            self.row_count = saved_data['row_count']
+            self.col_count = saved_data.get('col_count', cols)
+            self.cells = {tuple(int(value) for value in key.split(',')):cell
+            for key, cell in saved_data['cells'].items()}
+
+    def _save(self):
+        if self.save_path is not None:
+            with open(self.save_path, 'w') as save_file:
+                json.dump({'row_count':self.row_count,
+                'col_count':self.col_count,
+                'cells':{f'{row},{col}':value for (row, col), value
+                in self.cells.items()}}, save_file)
+
+    def _write(self, range_name, values):
+        start_cell = range_name.split(':')[0]
+        start_row, start_col = a1_to_rowcol(start_cell)
+        for row_offset, row in enumerate(values):
+            if (start_row + row_offset > self.row_count
+            or start_col + len(row) - 1 > self.col_count):
+                raise ValueError(f"Range {range_name} exceeds grid limits.")
+            for col_offset, value in enumerate(row):
+                self.cells[(start_row + row_offset,
+                start_col + col_offset)] = str(value)
+
+    def update(self, values = None, range_name = None, **kwargs):
+        self.requests.append(('update', range_name))
+        self._write(range_name or 'A1', values)
+        self._save()
+
+    def batch_update(self, data, **kwargs):
+        self.requests.append(('batch_update', len(data)))
+        for entry in data:
+            self._write(entry['range'], entry['values'])
+        self._save()
+
+    def _clear_range(self, range_name):
+        (first_row, first_col), (last_row, last_col) = [
+            a1_to_rowcol(cell) for cell in range_name.split(':')]
+        self.cells = {(row, col):value for (row, col), value in
+        self.cells.items() if not (first_row <= row <= last_row and
+        first_col <= col <= last_col)}
+
+    def batch_clear(self, ranges):
+        self.requests.append(('batch_clear', len(ranges)))
+        for range_name in ranges:
+            self._clear_range(range_name)
+        self._save()
+
+    def append_rows(self, values, table_range = None, **kwargs):
+        self.requests.append(('append_rows', len(values)))
+        next_row = max((row for row, col in self.cells), default = 0) + 1
+        if next_row + len(values) - 1 > self.row_count:
+            self.row_count = next_row + len(values) - 1
+        self._write(rowcol_to_a1(next_row, 1), values)
+        self._save()
+
+    def clear(self):
+        self.requests.append(('clear', None))
+        self.cells = {}
+        self._save()
+
+    def add_rows(self, rows):
+        self.requests.append(('add_rows', rows))
+        self.row_count += rows
+        self._save()
+
+    def add_cols(self, cols):
+        self.requests.append(('add_cols', cols))
+        self.col_count += cols
+        self._save()
+
+    def get_all_values(self):
+        '''Returns the worksheet's contents as a list of rows.'''
+        if len(self.cells) == 0:
+            return []
+        last_row = max(row for row, col in self.cells)
+        last_col = max(col for row, col in self.cells)
+        return [[self.cells.get((row, col), '') for col in range(
+            1, last_col + 1)] for row in range(1, last_row + 1)]
+
+
+class LocalWorkbook:
+    '''A stand-in for a gspread Spreadsheet (i.e. a workbook) that contains
+    LocalWorksheet objects. Along with LocalClient, this class lets you
+    try out export_tables() without connecting to Google Sheets.
+    
+    request_latency (in seconds) can be used to simulate the time that
+    each request would take to reach Google's servers, which is helpful
+    when evaluating how well a set of exports runs in parallel.'''
+
+    def __init__(self, workbook_id, request_latency = 0):
+        self.id = workbook_id
+        self.request_latency = request_latency
+        self.sheets = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def _record(self, request_type, detail = None):
+        time.sleep(self.request_latency)
+        with self.lock:
+            self.requests.append((request_type, detail))
+
+    def worksheets(self):
+        self._record('worksheets')
+        return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self._record('worksheet', title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows, cols, index = None):
+        self._record('add_worksheet', title)
+        ws = LocalWorksheet(title = title, rows = rows, cols = cols,
+        sheet_id = len(self.sheets))
+        self.sheets[title] = ws
+        return ws
+
+    def _split_range(self, range_name):
+        '''Splits a range such as "'Test Results'!A1:B5" into its
+        worksheet and cell range components.'''
+        if '!' in range_name:
+            title, cell_range = range_name.rsplit('!', 1)
+        else:
+            title, cell_range = range_name, None
+        return self.sheets[title.strip("'").replace("''", "'")], cell_range
+
+    def batch_update(self, body):
+        self._record('batch_update', len(body['requests']))
+        sheets_by_id = {ws.id:ws for ws in self.sheets.values()}
+        for request in body['requests']:
+            dimension_request = request['appendDimension']
+            ws = sheets_by_id[dimension_request['sheetId']]
+            if dimension_request['dimension'] == 'ROWS':
+                ws.row_count += dimension_request['length']
+            else:
+                ws.col_count += dimension_request['length']
+
+    def values_batch_clear(self, params = None, body = None):
+        self._record('values_batch_clear', len(body['ranges']))
+        for range_name in body['ranges']:
+            ws, cell_range = self._split_range(range_name)
+            if cell_range is None:
+                ws.cells = {}
+            else:
+                ws._clear_range(cell_range)
+
+    def values_batch_update(self, body = None):
+        self._record('values_batch_update', len(body['data']))
+        for entry in body['data']:
+            ws, cell_range = self._split_range(entry['range'])
+            ws._write(cell_range, entry['values'])
+
+
+class LocalClient:
+    '''A stand-in for a gspread client whose open_by_key() method returns
+    LocalWorkbook objects (creating them if needed).'''
+
+    def __init__(self, request_latency = 0):
+        self.request_latency = request_latency
+        self.workbooks = {}
+        self.lock = threading.Lock()
+
+    def open_by_key(self, key):
+        time.sleep(self.request_latency)
+        with self.lock:
+            if key not in self.workbooks:
+                self.workbooks[key] = LocalWorkbook(
+                    key, request_latency = self.request_latency)
+            return self.workbooks[key]
@@ -0,0 +1,146 @@
+# Tests for sheets_functions.py
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# These tests use the LocalWorksheet, LocalWorkbook, and LocalClient
+# classes within sheets_functions.py in place of Google Sheets, so they
+# can be run (from within part_x_google_sheets_uploads) without a
+# service account via:
+# python -m pytest test_sheets_functions.py
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from sheets_functions import (dataframe_to_cell_values, export_tables,
+plan_worksheet_sync, sync_dataframe_to_worksheet, LocalWorksheet,
+LocalClient)
+
+
+def _sheet_matches(ws, df, key_column = 'Student_ID'):
+    '''Checks whether the worksheet contains df's columns and rows. The
+    rows are compared by key, since the sync may store them in a
+    different order than df.'''
+    sheet_values = ws.get_all_values()
+    columns = [str(column) for column in df.columns]
+    expected_rows = dataframe_to_cell_values(df)
+    if len(expected_rows) == 0:
+        return sheet_values == [columns]
+    if sheet_values[0] != columns or len(sheet_values) - 1 != len(
+        expected_rows):
+        return False
+    key_position = columns.index(key_column)
+    return sorted(sheet_values[1:], key = lambda row: row[key_position]) == (
+        sorted(expected_rows, key = lambda row: row[key_position]))
+
+
+def _enrollment_table(student_count = 20):
+    return pd.DataFrame({'Student_ID':range(1000, 1000 + student_count),
+    'School':['Main' if i % 3 else 'North' for i in range(student_count)],
+    'Grade':[i % 12 + 1 for i in range(student_count)]})
+
+
+def test_sync_updates_changed_deleted_and_reordered_rows(tmp_path):
+    ws = LocalWorksheet(rows = 5, cols = 2)
+    snapshot_path = str(tmp_path / 'snapshot.json')
+    df = _enrollment_table()
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert _sheet_matches(ws, df)
+
+    # Changing a few values, removing some rows, adding new ones, and
+    # shuffling the table's row order:
+    df = df.copy()
+    df.loc[df['Student_ID'] == 1004, 'Grade'] = 99
+    df.loc[df['Student_ID'] == 1010, 'School'] = 'South'
+    df = df[~df['Student_ID'].isin([1001, 1002, 1015])]
+    df = pd.concat([df, pd.DataFrame({'Student_ID':[2000],
+    'School':['East'], 'Grade':[3]})])
+    df = df.sample(frac = 1, random_state = 0)
+    stats = sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert _sheet_matches(ws, df)
+    assert 0 < stats['changed_cells'] < len(df) * len(df.columns)
+
+    # Removing many rows at once should leave no stale rows behind:
+    df = df.iloc[:5]
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert _sheet_matches(ws, df)
+
+
+def test_sync_skips_unchanged_table_in_a_different_order(tmp_path):
+    ws = LocalWorksheet()
+    snapshot_path = str(tmp_path / 'snapshot.json')
+    df = _enrollment_table()
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    # Removing a row and adding another causes the worksheet's row order
+    # to differ from df's:
+    df = pd.concat([df.iloc[1:], pd.DataFrame({'Student_ID':[3000],
+    'School':['East'], 'Grade':[5]})])
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    request_count = len(ws.requests)
+
+    df = df.sample(frac = 1, random_state = 1)
+    # The table's fingerprint should match that of the snapshot, so no
+    # comparison (or snapshot update) should be needed.
+    assert plan_worksheet_sync(df, 'Student_ID',
+    snapshot_path)['snapshot'] is None
+    stats = sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert stats['requests'] == 0
+    assert len(ws.requests) == request_count
+    assert _sheet_matches(ws, df)
+
+
+def test_sync_handles_new_columns_and_missing_values(tmp_path):
+    ws = LocalWorksheet(rows = 5, cols = 2)
+    snapshot_path = str(tmp_path / 'snapshot.json')
+    df = _enrollment_table()
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+
+    df = df.copy()
+    for column in ['Lunch_Status', 'Attendance', 'Advisor']:
+        df[column] = np.where(df['Grade'] % 2 == 0, column, None)
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert ws.col_count >= len(df.columns)
+    assert _sheet_matches(ws, df)
+
+
+def test_sync_handles_empty_table(tmp_path):
+    ws = LocalWorksheet()
+    snapshot_path = str(tmp_path / 'snapshot.json')
+    df = _enrollment_table()
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+
+    df = df.iloc[0:0]
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert _sheet_matches(ws, df)
+
+    df = _enrollment_table(student_count = 3)
+    sync_dataframe_to_worksheet(ws, df, 'Student_ID', snapshot_path)
+    assert _sheet_matches(ws, df)
+
+
+def test_export_tables_recreates_missing_worksheet(tmp_path):
+    engine = sqlalchemy.create_engine(
+        'sqlite:///' + str(tmp_path / 'test.db'))
+    df = _enrollment_table()
+    df.to_sql('curr_enrollment', con = engine, index = False)
+    gc = LocalClient()
+    jobs = [{'query':'Select * from curr_enrollment',
+    'workbook_id':'test_workbook', 'worksheet':'Current Enrollment',
+    'key_column':'Student_ID',
+    'snapshot_path':str(tmp_path / 'snapshot.json')}]
+    export_tables(jobs, engine = engine, gc = gc,
+    requests_per_minute = 6000)
+    wb = gc.open_by_key('test_workbook')
+    assert _sheet_matches(wb.sheets['Current Enrollment'], df)
+
+    # If the worksheet is deleted, the next export should write the whole
+    # table to a new worksheet (rather than just the changed cells).
+    del wb.sheets['Current Enrollment']
+    pd.DataFrame({'Student_ID':[5000], 'School':['East'],
+    'Grade':[1]}).to_sql('curr_enrollment', con = engine, index = False,
+    if_exists = 'append')
+    df_results = export_tables(jobs, engine = engine, gc = gc,
+    requests_per_minute = 6000)
+    assert df_results.loc[0, 'full_rewrite'] == True
+    assert _sheet_matches(wb.sheets['Current Enrollment'],
+    pd.read_sql('Select * from curr_enrollment', con = engine))
@@ -0,0 +1,161 @@
+# Graph Export Functions:
+# Functions for saving many Plotly graphs at once
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# When a Plotly figure is saved via fig.write_html(), the entire plotly.js
+# library (around 3.5 MB) gets copied into the .html file by default.
+# That's why each .html file within part_x_graphing/Graphs is around
+# 3.6 MB even though the data for each chart only takes up a few kilobytes.
+# In addition, calling fig.write_image() separately for each figure can
+# require a new image export process to get launched for every chart.
+#
+# export_figures() instead:
+#
+# 1. Saves a single copy of plotly.js within the output folder, then has
+# each .html file load that copy. (Browsers will also cache this file, so
+# it only needs to be loaded once when viewing many charts.)
+# 2. Optionally combines multiple figures into a single page.
+# 3. Creates all .png (or other static) images within a single
+# plotly.io.write_images() call, which reuses one image export process
+# for every figure.
+
+import importlib.util
+import os
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+
+def write_plotlyjs_bundle(output_dir):
+    '''Saves a copy of plotly.js to output_dir (if it isn't already present)
+    and returns its file name. The file name includes the plotly.js version
+    so that graphs created with a newer version of Plotly won't load an
+    outdated copy of the library.'''
+    bundle_name = f'plotly-{get_plotlyjs_version()}.min.js'
+    bundle_path = os.path.join(output_dir, bundle_name)
+    if not os.path.exists(bundle_path):
+        # Writing to a temporary file first prevents a partially written
+        # bundle from being left behind if this process gets interrupted.
+        temp_path = bundle_path + '.tmp'
+        with open(temp_path, 'w', encoding = 'utf-8') as bundle_file:
+            bundle_file.write(get_plotlyjs())
+        os.replace(temp_path, bundle_path)
+    return bundle_name
+
+
+def _page_html(figures, page_title, bundle_name, html_config):
+    '''Creates an .html page that displays one or more figures, all of
+    which share a single reference to plotly.js.'''
+    figure_divs = '\n'.join(
+        '<div class="graph">' + pio.to_html(fig, config = html_config,
+        include_plotlyjs = False, full_html = False,
+        default_height = '600px') + '</div>' for fig in figures)
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8" />
+<title>{page_title}</title>
+<script src="{bundle_name}"></script>
+</head>
+<body>
+{figure_divs}
+</body>
+</html>
+'''
+
+
+def export_figures(figures, output_dir, pages = None,
+    image_format = None, image_scale = None, image_width = None,
+    image_height = None, html_config = None, save_html = True):
+    '''Saves many Plotly figures to output_dir.
+
+    Variables:
+
+    figures: a dictionary whose keys are file names (without extensions)
+    and whose values are Plotly figures. For example:
+    {'enrollment_by_grade':fig_enrollment_by_grade,
+    'enrollment_by_school':fig_enrollment_by_school}
+
+    output_dir: the folder in which all files will be saved. (It will be
+    created if it doesn't already exist.)
+
+    pages: an optional dictionary whose keys are page names and whose
+    values are lists of figure names. Each page will be saved as a single
+    .html file that displays all of its figures. For example:
+    {'enrollment_report':['enrollment_by_grade', 'enrollment_by_school']}
+
+    image_format: the static image format to create for each figure
+    ('png', 'jpg', 'svg', 'pdf', etc.). By default (None), no images will
+    be created. (Image export requires the kaleido package, which can be
+    installed via pip install kaleido.)
+
+    image_scale, image_width, and image_height: optional settings for
+    these static images. (See the documentation for
+    plotly.io.write_image().)
+
+    html_config: an optional Plotly config dictionary for the .html
+    files, such as {'displaylogo':False}.
+
+    save_html: set to False to only create static images.
+
+    Returns a dictionary listing the paths of all files that were
+    created.'''
+    # Checking these arguments before any files get written prevents
+    # a partial export from being left behind.
+    for page_name, figure_names in (pages or {}).items():
+        missing_figures = [figure_name for figure_name in figure_names
+        if figure_name not in figures]
+        if len(missing_figures) > 0:
+            raise ValueError(f"Error: the {page_name} page refers to \
+figures that aren't present within figures: {missing_figures}")
+    if (image_format is not None and len(figures) > 0
+    and importlib.util.find_spec('kaleido') is None):
+        raise ValueError(f"Error: creating {image_format} images requires \
+the kaleido package (pip install kaleido). Set image_format to None to \
+only create .html files.")
+
+    os.makedirs(output_dir, exist_ok = True)
+    exported_files = {'html':[], 'pages':[], 'images':[]}
+
+    if save_html == True or pages:
+        bundle_name = write_plotlyjs_bundle(output_dir)
+
+    if save_html == True:
+        for figure_name, fig in figures.items():
+            html_path = os.path.join(output_dir, figure_name + '.html')
+            # Passing a path ending in '.js' to include_plotlyjs causes
+            # the .html file to load plotly.js from that path rather than
+            # embedding a copy of it. See
+            # https://plotly.com/python-api-reference/generated/plotly.io.write_html.html
+            fig.write_html(html_path, include_plotlyjs = bundle_name,
+            config = html_config)
+            exported_files['html'].append(html_path)
+
+    for page_name, figure_names in (pages or {}).items():
+        page_path = os.path.join(output_dir, page_name + '.html')
+        with open(page_path, 'w', encoding = 'utf-8') as page_file:
+            page_file.write(_page_html(
+                [figures[figure_name] for figure_name in figure_names],
+                page_name, bundle_name, html_config))
+        exported_files['pages'].append(page_path)
+
+    if image_format is not None and len(figures) > 0:
+        image_paths = [os.path.join(output_dir, figure_name + '.'
+        + image_format) for figure_name in figures]
+        if hasattr(pio, 'write_images'):
+            # Plotly 6.1 and later can export a whole list of figures
+            # using a single Kaleido process.
+            pio.write_images(list(figures.values()), image_paths,
+            format = image_format, scale = image_scale,
+            width = image_width, height = image_height)
+        else:
+            # Earlier versions of Kaleido keep their image export process
+            # running between write_image() calls, so this loop will
+            # still only launch that process once.
+            for fig, image_path in zip(figures.values(), image_paths):
+                pio.write_image(fig, image_path, format = image_format,
+                scale = image_scale, width = image_width,
+                height = image_height)
+        exported_files['images'].extend(image_paths)
+
+    return exported_files
@@ -0,0 +1,514 @@
+# Map Worker:
+# A long-running process that renders maps on request
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# Each time a script that creates maps is run from scratch, it needs to
+# import geopandas and folium, read (or prepare) its shape table, and
+# (if .png copies are needed) launch a browser. These steps often take far
+# longer than rendering the map itself. The worker defined here performs
+# them once and then stays running, so later requests can reuse the
+# same libraries, tables, and browser.
+#
+# Starting the worker (from within part_x_mapping):
+# python map_worker.py serve --port 8765 --max-tables 4
+#
+# Requesting a map (from the command line):
+# python map_worker.py render --table maps/county_table.parquet
+# --shape-feature-name NAME --data-variable Median_Income
+# --feature-text County --map-name county_income --html-save-path maps
+#
+# If no worker is running, the render command will create the map within
+# its own process instead.
+#
+# Requesting a map (from Python):
+# submit_render_request({'table':'maps/county_table.parquet',
+# 'shape_feature_name':'NAME', 'data_variable':'Median_Income',
+# 'feature_text':'County', 'map_name':'county_income',
+# 'html_save_path':'maps'})
+#
+# HTTP API (the worker only accepts connections from this computer):
+# POST /render: renders the map described by a JSON request and returns
+# its file paths. Add ?wait=0 to return a job ID right away instead.
+# GET /jobs/<job_id>: returns the status (and, once finished, the result)
+# of a job. (Returns a 404 error if the job ID is unknown or if the job's
+# result has already been removed to make room for newer ones.)
+# GET /status: lists the tables currently held in memory, along with
+# the number of queued jobs.
+# POST /shutdown: stops the worker.
+#
+# Render requests are JSON objects containing:
+# 'table': either the path to a table saved via save_map_table() (which
+# will be read with read_map_table()) or a dictionary such as
+# {'function':'prepare_county_table', 'arguments':{...}} that names
+# a prepare_*_table function and the arguments to pass to it.
+# 'table_columns' (optional): the columns to read from a saved table.
+# All other items get passed to render_map() as keyword arguments
+# (e.g. 'data_variable', 'fill_color', 'bin_type', 'compact_output').
+# generate_image defaults to False within the worker, and
+# screenshot_save_path defaults to html_save_path.
+#
+# Requests with compact_output set to True render the fastest, since the
+# worker also keeps each table's geometry in memory as a serialized
+# TopoJSON topology and passes it to render_maps(). (These maps match the
+# ones that render_map() would create. Other requests are handled by
+# render_map(), which converts the geometry again for every map.)
+#
+# geopandas, folium, and mapping_functions itself are only imported once
+# a map actually needs to be rendered, so the client commands (and the
+# worker's own startup) finish almost immediately.
+
+import argparse
+import collections
+import inspect
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+default_port = 8765
+
+table_functions = ['prepare_zip_table', 'prepare_county_table',
+'prepare_state_table']
+
+# The render_map arguments that render_maps() accepts within each of its
+# variable_specs (rather than as separate arguments):
+batch_spec_arguments = ['data_variable', 'map_name', 'data_variable_text',
+'popup_variable_text', 'variable_decimals', 'fill_color', 'bin_type',
+'multiply_data_by']
+
+
+def _mapping_functions():
+    import mapping_functions
+    return mapping_functions
+
+
+class MapWorker:
+    '''Renders maps one at a time from a queue of requests while keeping
+    recently used tables in memory.
+
+    max_tables: the maximum number of tables to keep in memory. Once this
+    limit is reached, the least recently used table will be removed to
+    make room for a new one.
+
+    screenshot_browsers: the number of browsers that the worker's
+    MapScreenshotter will keep open. (This screenshotter is only created
+    once a request calls for a Selenium-based .png image.)
+
+    max_finished_jobs: the number of finished jobs whose results will be
+    kept (so that they can be retrieved via job_status()). Once this limit
+    is reached, the oldest finished job will be removed each time another
+    job finishes, so the worker's memory usage won't keep growing.'''
+
+    def __init__(self, max_tables = 4, screenshot_browsers = 1,
+        max_finished_jobs = 1000):
+        self.max_tables = max_tables
+        self.screenshot_browsers = screenshot_browsers
+        self.max_finished_jobs = max_finished_jobs
+        self._finished_jobs = collections.deque()
+        self.tables = collections.OrderedDict()
+        self.screenshotter = None
+        self.jobs = {}
+        self.job_queue = queue.Queue()
+        self._job_lock = threading.Lock()
+        self._table_lock = threading.Lock() # (status() reads self.tables
+        # from the HTTP server's threads.)
+        self._next_job_id = 1
+        self._thread = None
+
+    def _table_key(self, table_spec, table_columns):
+        return json.dumps([table_spec, table_columns], sort_keys = True)
+
+    def _load_table(self, table_spec, table_columns = None):
+        '''Returns the cache entry for the requested table (loading the
+        table if it isn't already in memory) along with whether the table
+        was already loaded. Each entry also stores the table's serialized
+        topology once a compact map has been created from it.'''
+        table_key = self._table_key(table_spec, table_columns)
+        with self._table_lock:
+            if table_key in self.tables:
+                self.tables.move_to_end(table_key) # Marks the table as
+                # recently used
+                return self.tables[table_key], True
+        mapping_functions = _mapping_functions()
+        if isinstance(table_spec, str):
+            table = mapping_functions.read_map_table(table_spec,
+            columns = table_columns)
+        elif table_spec.get('function') in table_functions:
+            table = getattr(mapping_functions, table_spec['function'])(
+                **table_spec.get('arguments', {}))
+        else:
+            raise ValueError(f"Error: table should be either a file path \
+or a dictionary whose 'function' item is one of {table_functions}.")
+        table_entry = {'table':table, 'topologies':{}}
+        with self._table_lock:
+            self.tables[table_key] = table_entry
+            while len(self.tables) > self.max_tables:
+                self.tables.popitem(last = False)
+        return table_entry, False
+
+    def get_table(self, table_spec, table_columns = None):
+        '''Returns the requested table, loading it if needed.'''
+        return self._load_table(table_spec, table_columns)[0]['table']
+
+    def _topology(self, table_entry, coordinate_decimals):
+        if coordinate_decimals not in table_entry['topologies']:
+            table_entry['topologies'][coordinate_decimals] = (
+                _mapping_functions().convert_geometry_to_topology(
+                    table_entry['table']['geometry'], coordinate_decimals))
+        return table_entry['topologies'][coordinate_decimals]
+
+    def preload(self, table_spec, table_columns = None,
+        coordinate_decimals = 4):
+        '''Loads a table and converts its geometry to a serialized topology
+        so that even the first compact map created from it will render
+        quickly.'''
+        table_entry = self._load_table(table_spec, table_columns)[0]
+        self._topology(table_entry, coordinate_decimals)
+
+    def render(self, request):
+        '''Renders a single map and returns a dictionary with its .html and
+        .png paths, the time the request took, and whether its table
+        was already in memory.
+
+        Compact maps are created via render_maps(), which can reuse the
+        serialized topology of the table's geometry that was stored in
+        memory by earlier requests. Other maps are created via 
+        render_map().'''
+        start_time = time.time()
+        request = dict(request)
+        table_spec = request.pop('table')
+        table_columns = request.pop('table_columns', None)
+        mapping_functions = _mapping_functions()
+        accepted_arguments = inspect.signature(
+            mapping_functions.render_map).parameters
+        unknown_arguments = [argument for argument in request
+        if argument not in accepted_arguments]
+        if len(unknown_arguments) > 0:
+            raise ValueError(f"Error: render_map doesn't accept the \
+following arguments: {unknown_arguments}")
+        missing_arguments = [argument for argument, parameter in
+        list(accepted_arguments.items())[1:] if parameter.default is
+        inspect.Parameter.empty and argument not in request
+        and argument != 'screenshot_save_path']
+        if len(missing_arguments) > 0:
+            raise ValueError(f"Error: the following arguments are \
+missing from this request: {missing_arguments}")
+        request.setdefault('generate_image', False)
+        request.setdefault('screenshot_save_path', request.get(
+            'html_save_path'))
+        if (request['generate_image'] == True and
+        request.get('image_backend', 'selenium') == 'selenium'):
+            if self.screenshotter is None:
+                self.screenshotter = mapping_functions.MapScreenshotter(
+                    browser_count = self.screenshot_browsers)
+            request['screenshotter'] = self.screenshotter
+
+        # Recording the output paths before any items are removed from
+        # the request:
+        html_path = None if request.get('delete_html_file') else (
+            os.path.join(request['html_save_path'],
+            request['map_name'] + '.html'))
+        image_path = os.path.join(request['screenshot_save_path'],
+        request['map_name'] + '.png') if request['generate_image'] else None
+
+        table_entry, table_was_cached = self._load_table(
+            table_spec, table_columns)
+        table = table_entry['table']
+        if (request.get('compact_output') == True
+        and request.get('rows_to_map', 0) == 0
+        and not request.get('delete_html_file')):
+            for argument in ['compact_output', 'rows_to_map',
+            'delete_html_file']:
+                request.pop(argument, None)
+            request.setdefault('coordinate_decimals', 4)
+            topology = self._topology(table_entry,
+            request['coordinate_decimals'])
+            variable_spec = {argument:request.pop(argument)
+            for argument in batch_spec_arguments if argument in request}
+            mapping_functions.render_maps(table,
+            variable_specs = [variable_spec], topology = topology,
+            **request)
+        else:
+            mapping_functions.render_map(table, **request)
+        return {'html_path':html_path, 'image_path':image_path,
+        'table_was_cached':table_was_cached,
+        'seconds':round(time.time() - start_time, 3)}
+
+    def submit(self, request):
+        '''Adds a request to the queue and returns its job ID.'''
+        with self._job_lock:
+            job_id = str(self._next_job_id)
+            self._next_job_id += 1
+            self.jobs[job_id] = {'status':'queued', 'done':threading.Event()}
+        self.job_queue.put((job_id, request))
+        return job_id
+
+    def job_status(self, job_id):
+        '''Returns the job's status (and, once it has finished, its result),
+        or None if the job is unknown or has already been removed to make
+        room for newer jobs.'''
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return {key:value for key, value in job.items() if key != 'done'}
+
+    def wait(self, job_id, timeout = None):
+        '''Waits for a job to finish, then returns the same output as
+        job_status() (including None for unknown or expired jobs).'''
+        job = self.jobs.get(job_id) # (Keeping a reference to the job 
+        # ensures that its result can still be returned even if it gets
+        # removed from self.jobs in the meantime.)
+        if job is None:
+            return None
+        job['done'].wait(timeout)
+        return {key:value for key, value in job.items() if key != 'done'}
+
+    def _process_jobs(self):
+        # All maps are rendered within this single thread, which keeps
+        # memory usage predictable and avoids sharing the browser (or
+        # folium objects) between threads.
+        while True:
+            job_id, request = self.job_queue.get()
+            if job_id is None:
+                break
+            job = self.jobs[job_id]
+            job['status'] = 'running'
+            try:
+                job['result'] = self.render(request)
+                job['status'] = 'done'
+            except Exception as error:
+                job['status'] = 'failed'
+                job['error'] = f'{type(error).__name__}: {error}'
+            job['done'].set()
+            with self._job_lock:
+                self._finished_jobs.append(job_id)
+                while len(self._finished_jobs) > self.max_finished_jobs:
+                    self.jobs.pop(self._finished_jobs.popleft(), None)
+
+    def start(self):
+        self._thread = threading.Thread(target = self._process_jobs,
+        daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        self.job_queue.put((None, None))
+        if self._thread is not None:
+            self._thread.join()
+        if self.screenshotter is not None:
+            self.screenshotter.close()
+
+    def status(self):
+        with self._table_lock:
+            table_keys = list(self.tables)
+        return {'tables':[json.loads(table_key)[0]
+        for table_key in table_keys],
+        'queued_jobs':self.job_queue.qsize(),
+        'max_tables':self.max_tables}
+
+
+class _WorkerRequestHandler(BaseHTTPRequestHandler):
+    # self.server.worker gets set within serve().
+
+    def _send_json(self, data, status = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        worker = self.server.worker
+        if self.path == '/status':
+            self._send_json(worker.status())
+        elif self.path.startswith('/jobs/'):
+            job_status = worker.job_status(self.path.split('/')[2])
+            if job_status is None:
+                self._send_json({'error':'Unknown or expired job'},
+                status = 404)
+            else:
+                self._send_json(job_status)
+        else:
+            self._send_json({'error':'Not found'}, status = 404)
+
+    def do_POST(self):
+        worker = self.server.worker
+        path, _, query = self.path.partition('?')
+        if path == '/shutdown':
+            self._send_json({'status':'stopping'})
+            threading.Thread(target = self.server.shutdown).start()
+        elif path == '/render':
+            try:
+                request = json.loads(self.rfile.read(
+                    int(self.headers.get('Content-Length', 0))))
+            except json.JSONDecodeError:
+                self._send_json({'error':'Invalid JSON'}, status = 400)
+                return
+            if not isinstance(request, dict) or 'table' not in request:
+                self._send_json({'error':"Requests must be JSON objects \
+with a 'table' item."}, status = 400)
+                return
+            job_id = worker.submit(request)
+            if 'wait=0' in query.split('&'):
+                self._send_json({'job_id':job_id, 'status':'queued'},
+                status = 202)
+            else:
+                job_status = worker.wait(job_id)
+                if job_status is None:
+                    self._send_json({'job_id':job_id, 'status':'failed',
+                    'error':'Unknown or expired job'}, status = 404)
+                    return
+                self._send_json({'job_id':job_id, **job_status},
+                status = 200 if job_status['status'] == 'done' else 500)
+        else:
+            self._send_json({'error':'Not found'}, status = 404)
+
+    def log_message(self, format, *args):
+        pass # Keeps the console free of per-request log lines
+
+
+def serve(port = default_port, max_tables = 4, screenshot_browsers = 1,
+    preload_tables = []):
+    '''Starts a worker and serves its HTTP API at 127.0.0.1:port until a
+    /shutdown request is received (or the process is interrupted).
+
+    preload_tables: a list of table paths to load (and convert to
+    serialized topologies) before accepting requests.'''
+    worker = MapWorker(max_tables = max_tables,
+    screenshot_browsers = screenshot_browsers)
+    for table_path in preload_tables:
+        print(f"Loading {table_path}:")
+        worker.preload(table_path)
+    worker.start()
+    server = ThreadingHTTPServer(('127.0.0.1', port), _WorkerRequestHandler)
+    server.worker = worker
+    print(f"Map worker is listening at http://127.0.0.1:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker.stop()
+    print("Map worker stopped.")
+
+
+# The errors that indicate that no worker could be reached (e.g. because
+# none is running, or because the connection was reset or timed out):
+worker_connection_errors = (urllib.error.URLError, TimeoutError,
+ConnectionError)
+
+
+def _call_worker(path, data = None, port = default_port, timeout = 600):
+    '''Sends a request to a running worker and returns its JSON response.
+    Raises urllib.error.URLError (or ConnectionError/TimeoutError) if no
+    worker is running or the worker can't be reached.'''
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}',
+    data = json.dumps(data).encode() if data is not None else None,
+    method = 'POST' if data is not None or path == '/shutdown' else 'GET',
+    headers = {'Content-Type':'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout = timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        # Failed jobs are returned with an error status, but their
+        # responses still contain useful details. (Errors that didn't
+        # come from the worker itself, such as those returned by a proxy
+        # or by another program listening on this port, might not contain
+        # JSON, in which case the raw response is returned instead.)
+        error_body = error.read()
+        try:
+            return json.loads(error_body)
+        except ValueError:
+            return {'status':'failed', 'error':f"HTTP {error.code}: \
+{error_body.decode(errors = 'replace')[:500]}"}
+
+
+def submit_render_request(request, port = default_port,
+    fall_back_to_local = True):
+    '''Sends a render request to the worker listening on port and returns
+    its result. If no worker is running and fall_back_to_local is True,
+    the map will be rendered within the current process instead.
+
+    Either way, the response will contain a 'status' item ('done' or
+    'failed') along with either a 'result' or an 'error' item.'''
+    try:
+        return _call_worker('/render', request, port = port)
+    except worker_connection_errors:
+        if fall_back_to_local == False:
+            raise
+    worker = MapWorker(max_tables = 1)
+    worker.start()
+    try:
+        job_id = worker.submit(request)
+        return {'job_id':job_id, **worker.wait(job_id)}
+    finally:
+        worker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Runs (or sends \
+requests to) a long-running map rendering worker.")
+    parser.add_argument('--port', type = int, default = default_port)
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--max-tables', type = int, default = 4)
+    serve_parser.add_argument('--screenshot-browsers', type = int,
+    default = 1)
+    serve_parser.add_argument('--preload', nargs = '*', default = [],
+    help = "Paths to tables that should be loaded at startup.")
+
+    render_parser = subparsers.add_parser('render')
+    render_parser.add_argument('--table', required = True)
+    render_parser.add_argument('--shape-feature-name', required = True)
+    render_parser.add_argument('--data-variable', required = True)
+    render_parser.add_argument('--feature-text', required = True)
+    render_parser.add_argument('--map-name', required = True)
+    render_parser.add_argument('--html-save-path', required = True)
+    render_parser.add_argument('--screenshot-save-path', default = None)
+    render_parser.add_argument('--generate-image', action = 'store_true')
+    render_parser.add_argument('--options', default = '{}', help = "A JSON \
+object containing any other render_map() arguments, such as \
+'{\"fill_color\":\"RdYlGn\", \"compact_output\":true}'.")
+    render_parser.add_argument('--no-local-fallback', action = 'store_true')
+
+    subparsers.add_parser('status')
+    subparsers.add_parser('shutdown')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(port = args.port, max_tables = args.max_tables,
+        screenshot_browsers = args.screenshot_browsers,
+        preload_tables = args.preload)
+    elif args.command == 'render':
+        request = {'table':args.table,
+        'shape_feature_name':args.shape_feature_name,
+        'data_variable':args.data_variable,
+        'feature_text':args.feature_text, 'map_name':args.map_name,
+        'html_save_path':args.html_save_path,
+        'screenshot_save_path':args.screenshot_save_path
+        or args.html_save_path, 'generate_image':args.generate_image,
+        **json.loads(args.options)}
+        response = submit_render_request(request, port = args.port,
+        fall_back_to_local = not args.no_local_fallback)
+        print(json.dumps(response, indent = 2))
+        if response.get('status') != 'done':
+            sys.exit(1)
+    elif args.command in ['status', 'shutdown']:
+        try:
+            print(json.dumps(_call_worker('/' + args.command,
+            port = args.port), indent = 2))
+        except worker_connection_errors:
+            print(f"No map worker is running on port {args.port}.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,15 +17,592 @@ import geopandas
 import folium
 import pandas as pd
 import time
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import numpy as np
 import os
+import shapely
+from branca.utilities import color_brewer
+from branca.colormap import StepColormap
+from branca.element import MacroElement, Template
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+import re
+import sqlite3
+import gzip
+import hashlib
+import json
+import pathlib
+import queue
+import sys
+import threading
+import contextlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Bumping this value will cause all previously cached geometries to be
+# ignored (e.g. after changing the way in which shapes get normalized).
+GEOMETRY_CACHE_VERSION = 1
+
+
+# Stage instrumentation:
+# The prepare_*_table functions and render_map divide their work into 
+# stages (reading shapes, simplifying them, merging tables, saving the
+# map, etc.). Whenever a stage finishes, a dictionary describing it is 
+# passed to every function registered via add_instrumentation_sink().
+# Each of these 'events' contains the following items:
+#
+# 'stage' and 'function': the name of the stage and the function in
+# which it took place (e.g. 'simplify' and '_read_simplified_shapes').
+# 'started_at': the time at which the stage began (in seconds since the
+# epoch, as returned by time.time()).
+# 'elapsed_seconds': the stage's duration.
+# 'rows_in' and 'rows_out': the number of rows that the stage received
+# and produced (or None when not applicable).
+# 'peak_rss_delta_mb': the amount (in megabytes) by which the stage raised
+# the process's peak memory usage. A value of 0 means that the stage
+# didn't use more memory than an earlier stage had already used. (This
+# value is None on Windows, where the resource module isn't available.)
+# 'output_bytes': the size of any file written by the stage.
+# 'succeeded': False if the stage raised an exception.
+#
+# When no sinks have been registered, stages aren't measured at all.
+# Note that sinks registered within one process won't receive events from
+# the worker processes created by render_maps() or simplify_geometry().
+
+_instrumentation_sinks = []
+
+
+def add_instrumentation_sink(sink):
+    '''Registers a sink that will receive each stage event. A sink can be
+    any function that accepts a single dictionary, such as 
+    StageEventCollector(), JSONLinesSink(path), or logging_sink().
+    Returns the sink so that it can later be passed to 
+    remove_instrumentation_sink().'''
+    _instrumentation_sinks.append(sink)
+    return sink
+
+
+def remove_instrumentation_sink(sink):
+    if sink in _instrumentation_sinks:
+        _instrumentation_sinks.remove(sink)
+
+
+class StageEventCollector:
+    '''A sink that stores events in memory. This is useful within
+    notebooks and tests:
+
+    collector = add_instrumentation_sink(StageEventCollector())
+    prepare_county_table(...)
+    collector.to_dataframe()'''
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.events)
+
+
+class JSONLinesSink:
+    '''A sink that appends each event to a .jsonl file (one JSON object per
+    line). Such files can be read via pd.read_json(path, lines = True).'''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            with open(self.path, 'a') as event_file:
+                event_file.write(json.dumps(event) + '\n')
+
+
+def logging_sink(logger = None, level = logging.INFO):
+    '''Returns a sink that writes each event to a logger (by default,
+    one named 'mapping_functions').'''
+    logger = logger or logging.getLogger('mapping_functions')
+    def sink(event):
+        logger.log(level, json.dumps(event))
+    return sink
+
+
+def _peak_rss_mb():
+    '''Returns the process's peak resident memory usage in megabytes (or
+    None if this can't be determined).'''
+    try:
+        import resource
+    except ImportError: # The resource module isn't available on Windows.
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS but in kilobytes on Linux.
+    return peak_rss / 1e6 if sys.platform == 'darwin' else peak_rss / 1e3
+
+
+@contextlib.contextmanager
+def _stage(stage, function, rows_in = None):
+    '''Measures a block of code and sends the resulting event to all
+    registered sinks. The block can add 'rows_out' and 'output_bytes' 
+    values to the dictionary that this context manager yields.'''
+    details = {'rows_in':rows_in, 'rows_out':None, 'output_bytes':None}
+    if len(_instrumentation_sinks) == 0:
+        yield details
+        return
+    started_at = time.time()
+    start_time = time.perf_counter()
+    start_peak_rss = _peak_rss_mb()
+    succeeded = False
+    try:
+        yield details
+        succeeded = True
+    finally:
+        end_peak_rss = _peak_rss_mb()
+        event = {'stage':stage, 'function':function, 
+        'started_at':round(started_at, 3),
+        'elapsed_seconds':round(time.perf_counter() - start_time, 6),
+        'rows_in':details['rows_in'], 'rows_out':details['rows_out'],
+        'peak_rss_delta_mb':round(end_peak_rss - start_peak_rss, 3) 
+        if start_peak_rss is not None else None,
+        'output_bytes':details['output_bytes'], 'succeeded':succeeded}
+        for sink in list(_instrumentation_sinks):
+            sink(event)
+
+
+def _shapefile_components(shapefile_path):
+    '''Returns the paths of the .shp file and any sidecar files (.shx, .dbf,
+    .prj, .cpg) that share its name, since changes to any of these files
+    will affect the GeoDataFrame returned by geopandas.read_file().'''
+    base_path = os.path.splitext(shapefile_path)[0]
+    return [(extension, base_path + extension) for extension in 
+    ['.shp', '.shx', '.dbf', '.prj', '.cpg'] 
+    if os.path.exists(base_path + extension)]
+
+
+def _hash_shapefile(shapefile_path, cache_dir = None):
+    '''Returns a SHA-256 hash of a shapefile's contents (including its
+    sidecar files).
+
+    cache_dir: if specified, each hash will be stored (within 
+    shapefile_hashes.json) alongside the size and modification time of
+    each file that it covers. As with the manifest used within
+    ingestion_functions.py, the files will only be read and hashed again
+    if any of these values have changed, so cache hits don't require
+    reading large shapefiles in full.'''
+    components = _shapefile_components(shapefile_path)
+    file_stats = [[extension, os.stat(component_path).st_size, 
+    os.stat(component_path).st_mtime_ns] 
+    for extension, component_path in components]
+    if cache_dir is not None:
+        hash_index_path = os.path.join(cache_dir, 'shapefile_hashes.json')
+        hash_index = {}
+        if os.path.exists(hash_index_path):
+            with open(hash_index_path) as hash_index_file:
+                hash_index = json.load(hash_index_file)
+        index_key = os.path.abspath(shapefile_path)
+        entry = hash_index.get(index_key)
+        if entry is not None and entry['files'] == file_stats:
+            return entry['sha256']
+
+    file_hash = hashlib.sha256()
+    for extension, component_path in components:
+        file_hash.update(extension.encode())
+        with open(component_path, 'rb') as component_file:
+            # Reading the file in 1 MB chunks keeps memory usage low
+            # for large shapefiles.
+            for chunk in iter(lambda: component_file.read(1024*1024), b''):
+                file_hash.update(chunk)
+    shapefile_hash = file_hash.hexdigest()
+
+    if cache_dir is not None:
+        hash_index[index_key] = {'files':file_stats, 
+        'sha256':shapefile_hash}
+        os.makedirs(cache_dir, exist_ok = True)
+        # Writing to a temporary file first ensures that an interrupted
+        # write won't leave a corrupted index behind.
+        temp_index_path = hash_index_path + '.tmp'
+        with open(temp_index_path, 'w') as hash_index_file:
+            json.dump(hash_index, hash_index_file)
+        os.replace(temp_index_path, hash_index_path)
+    return shapefile_hash
+
+
+def _normalize_shape_keys(shape_data, key_normalization, key_columns):
+    '''Applies the key-column cleanup steps used by the prepare_*_table
+    functions to shape_data. key_normalization can be 'zip' (which pads
+    zip codes with leading zeroes), 'county' (which renames the 'NAME'
+    column to 'SHORT_NAME' and converts state and county codes to integers),
+    or None (which leaves the table unchanged).'''
+    if key_normalization == 'zip':
+        for column in key_columns:
+            shape_data[column] = shape_data[column].astype(str).str.pad(
+                5, fillchar = '0')
+    elif key_normalization == 'county':
+        shape_data.rename(columns={'NAME':'SHORT_NAME'}, inplace = True)
+        for column in key_columns:
+            shape_data[column] = shape_data[column].astype(int)
+    elif key_normalization is not None:
+        raise ValueError("Error: key_normalization should be either 'zip', \
+'county', or None.")
+    return shape_data
+
+
+def _evict_geometry_cache(cache_dir, max_cache_size_mb):
+    '''Deletes the least recently used cache files within cache_dir until
+    the total size of the cache is no larger than max_cache_size_mb.'''
+    cache_files = [os.path.join(cache_dir, file_name) for file_name in 
+    os.listdir(cache_dir) if file_name.endswith('.parquet')]
+    # Cache files get their modification times updated whenever they are
+    # read (see _read_simplified_shapes), so sorting by mtime places the
+    # least recently used files first.
+    cache_files.sort(key = os.path.getmtime)
+    total_size = sum(os.path.getsize(file_path) for file_path in cache_files)
+    max_size = max_cache_size_mb * 1024 * 1024
+    for file_path in cache_files:
+        if total_size <= max_size:
+            break
+        total_size -= os.path.getsize(file_path)
+        os.remove(file_path)
+
+
+def _simplify_chunk(geometry_chunk, tolerances):
+    '''Simplifies an array of geometries at each of the tolerances in 
+    tolerances (which should be sorted from smallest to largest). Each 
+    level is derived from the previous, more detailed level rather than 
+    from the original geometry, which makes the coarser levels much faster
+    to compute.'''
+    simplified_levels = []
+    current_level = geometry_chunk
+    for tolerance in tolerances:
+        current_level = shapely.simplify(current_level, tolerance, 
+        preserve_topology = True)
+        simplified_levels.append(current_level)
+    return simplified_levels
+
+
+def _simplify_coverage(geometry, tolerance):
+    '''Simplifies an entire set of polygons at once while keeping the 
+    borders that they share identical.'''
+    return shapely.coverage_simplify(geometry, tolerance)
+
+
+def _executor_context(executor, processes):
+    '''Returns a context manager that yields executor (leaving it open
+    afterwards) if one was provided, or a new ProcessPoolExecutor with
+    the specified number of processes otherwise.'''
+    if executor is not None:
+        return contextlib.nullcontext(executor)
+    return ProcessPoolExecutor(max_workers = processes)
+
+
+def simplify_geometry(geometry, tolerances, preserve_shared_borders = False,
+    processes = 1, executor = None):
+    '''Simplifies a GeoSeries at one or more tolerance levels.
 
+    Variables:
+
+    geometry: the GeoSeries to simplify (e.g. shape_data['geometry']).
+
+    tolerances: a list of tolerances (e.g. [0.005, 0.05] for a detailed
+    level and an overview level). 
+
+    preserve_shared_borders: when this is False (the default), each shape 
+    is simplified separately, as with GeoSeries.simplify(). Because 
+    neighboring shapes don't get simplified in the same way, small gaps and
+    overlaps ('slivers') can appear along their shared borders. Setting
+    this argument to True uses shapely.coverage_simplify() instead, which
+    simplifies each shared border only once. (This option requires the
+    shapes to be non-overlapping and to share identical vertices along
+    their borders, which is the case for the Census cartographic boundary
+    files. Note also that coverage_simplify uses a different algorithm,
+    so a given tolerance will produce somewhat different results.)
+    See https://shapely.readthedocs.io/en/stable/reference/shapely.coverage_simplify.html
+
+    processes: the number of processes to use. When preserve_shared_borders
+    is False, the shapes are split into chunks that get simplified in 
+    parallel. When it is True, the shapes can't be split up (as doing so
+    would separate neighboring shapes), so each tolerance level gets
+    simplified within its own process instead.
+
+    executor: an optional ProcessPoolExecutor to use instead of creating
+    a new one. Code that simplifies many batches of shapes (such as the
+    streaming mode of _read_simplified_shapes) can pass the same executor
+    to each call so that the processes only need to be started once.
+    processes should still be set to the executor's number of workers,
+    since it determines how many chunks the shapes get split into.
+
+    Returns a dictionary whose keys are the tolerances and whose values are
+    the corresponding simplified GeoSeries.'''
+    sorted_tolerances = sorted(set(tolerances))
+    geometry_values = geometry.values
+
+    if preserve_shared_borders == True:
+        if ((processes > 1 or executor is not None) 
+        and len(sorted_tolerances) > 1):
+            with _executor_context(executor, processes) as pool:
+                simplified_levels = list(pool.map(_simplify_coverage, 
+                [geometry_values] * len(sorted_tolerances), sorted_tolerances))
+        else:
+            simplified_levels = [_simplify_coverage(geometry_values, tolerance)
+            for tolerance in sorted_tolerances]
+    else:
+        if processes > 1 or executor is not None:
+            # Creating a few chunks per process helps balance the work
+            # when some chunks contain more complex shapes than others.
+            geometry_chunks = np.array_split(geometry_values, 
+            min(processes * 4, max(len(geometry_values), 1)))
+            with _executor_context(executor, processes) as pool:
+                chunk_results = list(pool.map(_simplify_chunk, 
+                geometry_chunks, [sorted_tolerances] * len(geometry_chunks)))
+            simplified_levels = [np.concatenate([chunk_result[i] 
+            for chunk_result in chunk_results]) 
+            for i in range(len(sorted_tolerances))]
+        else:
+            simplified_levels = _simplify_chunk(
+                geometry_values, sorted_tolerances)
+
+    return {tolerance:geopandas.GeoSeries(simplified_level, 
+    index = geometry.index, crs = geometry.crs) 
+    for tolerance, simplified_level in zip(
+        sorted_tolerances, simplified_levels)}
+
+
+def _geometry_cache_path(cache_dir, shapefile_hash, tolerance, 
+    key_normalization, key_columns, preserve_shared_borders, 
+    read_filters = None):
+    '''Returns the path at which a given simplified geometry table will be
+    cached.'''
+    cache_key = hashlib.sha256(json.dumps({
+        'version':GEOMETRY_CACHE_VERSION, 'shapefile':shapefile_hash,
+        'tolerance':tolerance, 'key_normalization':key_normalization,
+        'key_columns':list(key_columns), 
+        'preserve_shared_borders':preserve_shared_borders,
+        'read_filters':read_filters}, 
+        sort_keys = True).encode()).hexdigest()
+    # Starting each file name with part of the shapefile's hash allows
+    # clear_geometry_cache() to remove all entries for a given shapefile.
+    return os.path.join(
+        cache_dir, shapefile_hash[:16]+'_'+cache_key[:16]+'.parquet')
+
+
+def _stream_shapefile(shapefile_path, bbox = None, mask = None, 
+    columns = None, chunk_size = 65536):
+    '''Reads a shapefile in chunks of chunk_size rows, yielding each chunk as
+    a GeoDataFrame. The bbox, mask, and columns filters are applied by
+    GDAL while the file is being read, so shapes that fall outside of the 
+    area of interest (and columns that aren't needed) never get loaded
+    into memory. See
+    https://pyogrio.readthedocs.io/en/latest/api.html#pyogrio.open_arrow'''
+    import pyogrio # Imported here since only this function uses
+    # pyogrio directly (geopandas also relies on it to read files).
+    with pyogrio.open_arrow(shapefile_path, bbox = bbox, mask = mask,
+    columns = columns, batch_size = chunk_size, 
+    use_pyarrow = True) as (metadata, reader):
+        geometry_name = metadata['geometry_name'] or 'wkb_geometry'
+        for batch in reader:
+            chunk = batch.to_pandas()
+            yield geopandas.GeoDataFrame(chunk.drop(columns = geometry_name),
+            geometry = shapely.from_wkb(chunk[geometry_name].to_numpy()),
+            crs = metadata['crs'])
+
+
+def _read_simplified_shapes(shapefile_path, tolerance, key_normalization = None,
+    key_columns = [], cache_dir = None, max_cache_size_mb = 500,
+    additional_tolerances = [], simplify_processes = 1, 
+    preserve_shared_borders = False, bbox = None, mask = None, 
+    key_whitelist = None, shape_columns = None, chunk_size = None):
+    '''Reads the shapefile stored at shapefile_path, normalizes its key 
+    columns, and simplifies its geometry. 
+    
+    If cache_dir is specified, the resulting GeoDataFrame will be stored
+    within that folder as a GeoParquet file whose name is derived from
+    the shapefile's contents, the tolerance, and the key normalization 
+    settings. Later calls with the same arguments will then load this
+    file (which is much faster than re-reading and re-simplifying the 
+    original shapefile). If the shapefile changes, its hash will change
+    as well, so outdated cache entries will no longer get used.
+    
+    max_cache_size_mb: the maximum size of cache_dir in megabytes. Once
+    this size is exceeded, the least recently used cache entries will get
+    deleted.
+
+    additional_tolerances: other tolerance levels to compute at the same
+    time as tolerance. These levels get saved to the cache (if cache_dir
+    is specified) so that later calls that use them won't need to 
+    re-simplify the shapefile.
+
+    See simplify_geometry() for simplify_processes and 
+    preserve_shared_borders.
+
+    bbox, mask, key_whitelist, shape_columns, and chunk_size allow only part
+    of the shapefile to be read; see prepare_zip_table's documentation for
+    more information. When any of these are specified, the shapefile is 
+    read in chunks, and each chunk is filtered and simplified before the 
+    next one is read.'''
+
+    streaming = any(argument is not None for argument in [
+        bbox, mask, key_whitelist, shape_columns, chunk_size])
+    if shape_columns is not None:
+        # The key columns need to be read in order for the merge to work.
+        shape_columns = list(dict.fromkeys(
+            list(shape_columns) + list(key_columns)))
+    if key_whitelist is not None:
+        key_whitelist = set(key_whitelist)
+    read_filters = {'bbox':list(bbox) if bbox is not None else None,
+    'mask':hashlib.sha256(shapely.to_wkb(mask)).hexdigest() 
+    if mask is not None else None, 
+    'key_whitelist':hashlib.sha256(json.dumps(sorted(
+        str(key) for key in key_whitelist)).encode()).hexdigest() 
+    if key_whitelist is not None else None,
+    'shape_columns':sorted(shape_columns) 
+    if shape_columns is not None else None} if streaming else None
+
+    if cache_dir is not None:
+        shapefile_hash = _hash_shapefile(shapefile_path, cache_dir)
+        cache_path = _geometry_cache_path(cache_dir, shapefile_hash, 
+        tolerance, key_normalization, key_columns, preserve_shared_borders,
+        read_filters)
+        if os.path.exists(cache_path):
+            print("Reading cached shape data:")
+            with _stage('read_cache', '_read_simplified_shapes') as details:
+                shape_data = geopandas.read_parquet(cache_path)
+                details['rows_out'] = len(shape_data)
+            os.utime(cache_path) # Marks this entry as recently used
+            return shape_data
+
+    tolerances = [tolerance] + list(additional_tolerances)
+    if streaming:
+        print("Reading and simplifying shape data in chunks:")
+        # (Since each chunk is read, normalized, and simplified before the
+        # next one is read, these steps are reported as a single 
+        # 'read_and_simplify' stage.)
+        with _stage('read_and_simplify', 
+        '_read_simplified_shapes') as stream_details:
+            # A single process pool is shared by all chunks (rather than
+            # being created and shut down for each one).
+            with (ProcessPoolExecutor(max_workers = simplify_processes)
+            if simplify_processes > 1 else contextlib.nullcontext()) as executor:
+                shape_chunks = []
+                level_chunks = {level_tolerance:[] 
+                for level_tolerance in tolerances}
+                for shape_chunk in _stream_shapefile(shapefile_path, bbox = bbox,
+                mask = mask, columns = shape_columns, 
+                chunk_size = chunk_size if chunk_size is not None else 65536):
+                    shape_chunk = _normalize_shape_keys(
+                        shape_chunk, key_normalization, key_columns)
+                    if key_whitelist is not None:
+                        # Keeping only shapes whose (normalized) keys appear
+                        # within key_whitelist:
+                        shape_chunk = shape_chunk[shape_chunk[
+                            key_columns[0]].isin(key_whitelist)]
+                    if preserve_shared_borders == False:
+                        # Simplifying each chunk as it arrives and discarding 
+                        # its original geometry keeps memory usage low. (Shapes
+                        # along the edges of different chunks can't be 
+                        # simplified separately when their shared borders need
+                        # to be preserved, so in that case, simplification 
+                        # takes place after all chunks have been read.)
+                        for level_tolerance, simplified_geometry in \
+                        simplify_geometry(shape_chunk['geometry'], tolerances, 
+                        processes = simplify_processes, 
+                        executor = executor).items():
+                            level_chunks[level_tolerance].append(
+                                simplified_geometry)
+                        shape_chunk['geometry'] = level_chunks[tolerance][-1]
+                    shape_chunks.append(shape_chunk)
+                if len(shape_chunks) == 0:
+                    raise ValueError("Error: no shapes matched the bbox, mask, \
+and key_whitelist filters.")
+                shape_data = pd.concat(shape_chunks, ignore_index = True)
+                if preserve_shared_borders == False:
+                    simplified_levels = {level_tolerance:geopandas.GeoSeries(
+                        pd.concat(level_chunks[level_tolerance]).values, 
+                        crs = shape_data.crs) 
+                        for level_tolerance in set(tolerances)}
+                else:
+                    simplified_levels = simplify_geometry(
+                        shape_data['geometry'], tolerances, 
+                        preserve_shared_borders = True, 
+                        processes = simplify_processes, executor = executor)
+                stream_details['rows_out'] = len(shape_data)
+        print("Length of shape table is",len(shape_data))
+
+    else:
+        print("Reading shape data:")
+        with _stage('read', '_read_simplified_shapes') as details:
+            shape_data = geopandas.read_file(shapefile_path)
+            details['rows_out'] = len(shape_data)
+        with _stage('key_normalization', '_read_simplified_shapes', 
+        rows_in = len(shape_data)) as details:
+            shape_data = _normalize_shape_keys(
+                shape_data, key_normalization, key_columns)
+            details['rows_out'] = len(shape_data)
+        # To reduce the time needed to produce the choropleth map and to 
+        # decrease its file size, the function next uses shapely's simplify()
+        # function (via simplify_geometry()) to reduce the complexity of the 
+        # shape coordinates stored in the geometry column. See
+        # https://geopandas.org/en/stable/docs/reference/api/geopandas.GeoSeries.simplify.html
+        # and (for more detail)
+        # https://shapely.readthedocs.io/en/latest/manual.html#object.simplify .
+        print("Simplifying shape data:") # This can take a little while
+        with _stage('simplify', '_read_simplified_shapes', 
+        rows_in = len(shape_data)) as details:
+            simplified_levels = simplify_geometry(shape_data['geometry'], 
+            tolerances, preserve_shared_borders = preserve_shared_borders,
+            processes = simplify_processes)
+            details['rows_out'] = len(simplified_levels[tolerance])
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+        with _stage('cache_write', '_read_simplified_shapes', 
+        rows_in = len(shape_data)) as details:
+            details['output_bytes'] = 0
+            for level_tolerance, simplified_geometry in \
+            simplified_levels.items():
+                level_path = _geometry_cache_path(cache_dir, shapefile_hash,
+                level_tolerance, key_normalization, key_columns, 
+                preserve_shared_borders, read_filters)
+                level_data = shape_data.copy()
+                level_data['geometry'] = simplified_geometry
+                # Writing to a temporary file, then renaming it, prevents
+                # other processes from reading a partially-written cache
+                # entry.
+                temp_cache_path = level_path + '.' + str(os.getpid()) + '.tmp'
+                level_data.to_parquet(temp_cache_path)
+                details['output_bytes'] += os.path.getsize(temp_cache_path)
+                os.replace(temp_cache_path, level_path)
+        _evict_geometry_cache(cache_dir, max_cache_size_mb)
+
+    shape_data['geometry'] = simplified_levels[tolerance]
+    return shape_data
+
+
+def clear_geometry_cache(cache_dir, shapefile_path = None):
+    '''Deletes cached geometries created by the prepare_*_table functions.
+    
+    cache_dir: the folder passed to the cache_dir argument of those
+    functions.
+    
+    shapefile_path: if specified, only cache entries derived from this 
+    shapefile will be removed. Otherwise, the entire cache will be cleared.
+    
+    Returns the number of cache entries that were deleted.'''
+    if not os.path.exists(cache_dir):
+        return 0
+    prefix = _hash_shapefile(shapefile_path, 
+        cache_dir)[:16] if shapefile_path is not None else ''
+    deleted_entries = 0
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith('.parquet') and file_name.startswith(prefix):
+            os.remove(os.path.join(cache_dir, file_name))
+            deleted_entries += 1
+    return deleted_entries
 
 def prepare_zip_table(shapefile_path, shape_feature_name, 
 data_path, data_feature_name, tolerance = 0.005, dropna_geometry = True,
-data_csv_encoding = None):
+data_csv_encoding = None, cache_dir = None, max_cache_size_mb = 500,
+additional_tolerances = [], simplify_processes = 1,
+preserve_shared_borders = False, bbox = None, mask = None,
+filter_to_data_keys = False, shape_columns = None, chunk_size = None):
     '''This function merges US Census zip code shapefile data with
     Census zip-code-level demographic data in order to create a DataFrame 
     that can be used to generate choropleth maps.
@@ -61,43 +638,98 @@ data_csv_encoding = None):
     data into the function. (The default encoding sometimes results in an
     error.)
 
-    '''
+    cache_dir: an optional folder in which simplified shape data will be
+    cached. Reading, normalizing, and simplifying a large shapefile can take
+    quite a while, so if you'll be creating many maps from the same 
+    shapefile, specifying a cache_dir will save a good deal of time. 
+    The cache is keyed by the contents of the shapefile, the tolerance,
+    and the key columns, so it will automatically get refreshed if any
+    of these change. You can also delete it via clear_geometry_cache().
 
-    print("Reading shape data:")
-    shape_data = geopandas.read_file(shapefile_path)
-    shape_data[shape_feature_name] = shape_data[
-        shape_feature_name].astype(str).str.pad(5, fillchar = '0')
-    # The above line converts the zip code values into strings (if they were 
-    # not already in that format), then adds extra 0s via str.pad to any
-    # zip codes with fewer than 5 digits. This prevents data merging errors
-    # related to zip codes with leading zeroes. For instance, if a shapefile
-    # represented the zip 05753 as 5753, but a data file represented it as
-    # 05753, the two zip codes would not merge. Adding in str.pad prevents
-    # this issue.
+    max_cache_size_mb: the maximum size (in megabytes) that cache_dir can
+    reach before its least recently used entries get deleted.
+
+    additional_tolerances: a list of other tolerances at which to simplify 
+    the shapes while the shapefile is already loaded. For instance, if you
+    plan to make both detailed and overview maps, you could pass 
+    tolerance = 0.005 and additional_tolerances = [0.05]. These extra levels
+    are only useful when cache_dir is specified, since they get stored 
+    within the cache (rather than returned by this function).
+
+    simplify_processes: the number of processes across which the 
+    simplification step will be split. 
+
+    preserve_shared_borders: set to True to simplify the shapes in a way 
+    that keeps neighboring shapes' borders aligned (thus preventing slivers
+    and gaps between them). See simplify_geometry() for more details.
+
+    The following arguments allow you to read only part of the shapefile,
+    which can save a great deal of time and memory when mapping a single
+    state or metro area:
+
+    bbox: a (minx, miny, maxx, maxy) tuple (in the shapefile's coordinate
+    system). Only shapes that intersect this box will be read.
 
-    # To reduce the time needed to produce the choropleth map and to 
-    # decrease its file size, the function next uses  Geopandas' simplify()
-    # function to reduce the complexity of the shape coordinates stored in the
-    # geometry column. See
-    # https://geopandas.org/en/stable/docs/reference/api/geopandas.GeoSeries.simplify.html
-    # and (for more detail)
-    # https://shapely.readthedocs.io/en/latest/manual.html#object.simplify .
-    print("Simplifying shape data:") # This can take a little while
-    shape_data['geometry'] = shape_data.simplify(tolerance = tolerance)
-    # The function next imports census data.
+    mask: a shapely geometry (e.g. a state's boundary). Only shapes that
+    intersect this geometry will be read.
+
+    filter_to_data_keys: set to True to keep only those shapes whose zip
+    codes also appear within the data file.
+
+    shape_columns: a list of the shapefile columns to read. (The 
+    shape_feature_name column will always be included.) 
+
+    chunk_size: the number of shapes to read at a time. Each chunk gets 
+    filtered and simplified before the next one is read, which limits the
+    amount of memory needed to process large shapefiles. If any of the
+    above filters are specified, a default chunk size of 65,536 is used.
+
+    '''
+
+    # The function first imports census data. (This data gets read before
+    # the shapefile so that its zip codes can be used to filter the 
+    # shapefile when filter_to_data_keys is True.)
     print("Reading census data:")
-    census_data = pd.read_csv(data_path)
+    with _stage('csv_read', 'prepare_zip_table') as details:
+        census_data = pd.read_csv(data_path)
+        details['rows_out'] = len(census_data)
     census_data[data_feature_name] = census_data[data_feature_name].astype(
         str).str.pad(5, fillchar = '0')
     # Since the zip codes in the shapefile data are in string format, the 
     # zip codes in the data file also need to be in string format.
     # Str.pad is used to ensure that all zip codes contain five digits, which
     # will help with the merging process. (str.zfill(5) would also work.)
+
+    shape_data = _read_simplified_shapes(shapefile_path, tolerance,
+    key_normalization = 'zip', key_columns = [shape_feature_name],
+    cache_dir = cache_dir, max_cache_size_mb = max_cache_size_mb,
+    additional_tolerances = additional_tolerances, 
+    simplify_processes = simplify_processes,
+    preserve_shared_borders = preserve_shared_borders, bbox = bbox,
+    mask = mask, key_whitelist = census_data[data_feature_name].unique() 
+    if filter_to_data_keys == True else None, 
+    shape_columns = shape_columns, chunk_size = chunk_size)
+    # The zip normalization step converts the zip code values into strings
+    # (if they were not already in that format), then adds extra 0s via 
+    # str.pad to any
+    # zip codes with fewer than 5 digits. This prevents data merging errors
+    # related to zip codes with leading zeroes. For instance, if a shapefile
+    # represented the zip 05753 as 5753, but a data file represented it as
+    # 05753, the two zip codes would not merge. Adding in str.pad prevents
+    # this issue.
+
+    # _read_simplified_shapes() also simplifies the shapes' geometry
+    # in order to reduce the time needed to produce the choropleth map
+    # and to decrease its file size.
     # Next, to make it easier to create choropleth maps, the function merges
     # the shapefile and census data tables.
     print("Merging shape and data tables:")
-    merged_shape_data_table = pd.merge(shape_data, census_data, 
-    left_on = shape_feature_name, right_on = data_feature_name, how = 'outer')
+    with _stage('merge', 'prepare_zip_table', 
+    rows_in = len(shape_data)) as details:
+        merged_shape_data_table = pd.merge(shape_data, census_data, 
+        left_on = shape_feature_name, right_on = data_feature_name, 
+        how = 'outer')
+        details['rows_out'] = len(merged_shape_data_table)
 
     # An outer join is used so that the table can remain compatible with
     # additional datasets that are merged into this table. If an inner join
@@ -110,7 +742,9 @@ data_csv_encoding = None):
 
 def prepare_county_table(shapefile_path, shape_state_code_column, 
 shape_county_code_column, tolerance, data_path, data_state_code_column, 
-data_county_code_column, dropna_geometry = True, data_csv_encoding = None):
+data_county_code_column, dropna_geometry = True, data_csv_encoding = None,
+cache_dir = None, max_cache_size_mb = 500, additional_tolerances = [],
+simplify_processes = 1, preserve_shared_borders = False):
     '''This function merges US Census county shapefile data with
     Census county-level demographic data in order to create a DataFrame 
     that can be used to generate choropleth maps.
@@ -125,8 +759,13 @@ data_county_code_column, dropna_geometry = True, data_csv_encoding = None):
     See the documentation for prepare_zip_table for more information on
     this function.'''
 
-    print("Reading shape data:")
-    shape_data = geopandas.read_file(shapefile_path)
+    shape_data = _read_simplified_shapes(shapefile_path, tolerance,
+    key_normalization = 'county', key_columns = [
+        shape_state_code_column, shape_county_code_column],
+    cache_dir = cache_dir, max_cache_size_mb = max_cache_size_mb,
+    additional_tolerances = additional_tolerances, 
+    simplify_processes = simplify_processes,
+    preserve_shared_borders = preserve_shared_borders)
     # The merge process for county-level data is based on state and county
     # codes because the 'NAME' value for the data and shape DataFrames
     # differs (see below). 
@@ -134,35 +773,38 @@ data_county_code_column, dropna_geometry = True, data_csv_encoding = None):
     # shapefiles and county-level demographic data that I downloaded.
     # To help ensure that the merge process is successful, this function
     # converts the state and county codes for both tables into integer format.
-    shape_data.rename(columns={'NAME':'SHORT_NAME'}, inplace = True) 
+    # (The shapefile's codes get converted within _read_simplified_shapes().)
     # The 'NAME' column in the Census .shp file contains only the name of
     # the county (e.g. "Fairfax", whereas the 'NAME' column from the Census
     # data table also includes the state name (e.g. "Fairfax County,
-    # Virginia"). Therefore, this column gets renamed above so that both
-    # can exist within the merged DataFrame as distinct variables.
-    shape_data[shape_state_code_column] = shape_data[
-        shape_state_code_column].astype(int)
-    shape_data[shape_county_code_column] = shape_data[
-        shape_county_code_column].astype(int)
-    print("Simplifying shape data:") 
-    shape_data['geometry'] = shape_data.simplify(tolerance = tolerance)
+    # Virginia"). Therefore, _read_simplified_shapes() renames this column
+    # to 'SHORT_NAME' so that both can exist within the merged DataFrame 
+    # as distinct variables.
     print("Reading census data:")
-    census_data = pd.read_csv(data_path, encoding = data_csv_encoding)
+    with _stage('csv_read', 'prepare_county_table') as details:
+        census_data = pd.read_csv(data_path, encoding = data_csv_encoding)
+        details['rows_out'] = len(census_data)
     census_data[data_state_code_column] = census_data[
         data_state_code_column].astype(int)
     census_data[data_county_code_column] = census_data[
         data_county_code_column].astype(int)
     print("Merging shape and data tables:")
-    merged_shape_data_table = pd.merge(shape_data, census_data, left_on = [
-        shape_state_code_column, shape_county_code_column], right_on = [
-            data_state_code_column, data_county_code_column], how = 'outer')
+    with _stage('merge', 'prepare_county_table', 
+    rows_in = len(shape_data)) as details:
+        merged_shape_data_table = pd.merge(shape_data, census_data, 
+        left_on = [shape_state_code_column, shape_county_code_column], 
+        right_on = [data_state_code_column, data_county_code_column], 
+        how = 'outer')
+        details['rows_out'] = len(merged_shape_data_table)
     if dropna_geometry == True:
         merged_shape_data_table.dropna(subset = 'geometry', inplace = True)
     return merged_shape_data_table
 
 
 def prepare_state_table(shapefile_path, shape_feature_name, tolerance,
-data_path, data_feature_name, dropna_geometry = True, data_csv_encoding = None):
+data_path, data_feature_name, dropna_geometry = True, data_csv_encoding = None,
+cache_dir = None, max_cache_size_mb = 500, additional_tolerances = [],
+simplify_processes = 1, preserve_shared_borders = False):
     '''This function merges US Census state shapefile data with
     Census state-level demographic data in order to create a DataFrame 
     that can be used to generate choropleth maps.
@@ -170,20 +812,608 @@ data_path, data_feature_name, dropna_geometry = True, data_csv_encoding = None):
     See the documentation for prepare_zip_table for more information on
     this function.'''
     
-    print("Reading shape data:")
-    shape_data = geopandas.read_file(shapefile_path)
-    print("Simplifying shape data:")
-    shape_data['geometry'] = shape_data.simplify(tolerance = tolerance)
+    shape_data = _read_simplified_shapes(shapefile_path, tolerance,
+    cache_dir = cache_dir, max_cache_size_mb = max_cache_size_mb,
+    additional_tolerances = additional_tolerances, 
+    simplify_processes = simplify_processes,
+    preserve_shared_borders = preserve_shared_borders)
     print("Reading census data:")
-    census_data = pd.read_csv(data_path)
+    with _stage('csv_read', 'prepare_state_table') as details:
+        census_data = pd.read_csv(data_path)
+        details['rows_out'] = len(census_data)
     print("Merging shape and data tables:")
-    merged_shape_data_table = pd.merge(shape_data, census_data, 
-    left_on = shape_feature_name, right_on = data_feature_name, how = 'outer')
+    with _stage('merge', 'prepare_state_table', 
+    rows_in = len(shape_data)) as details:
+        merged_shape_data_table = pd.merge(shape_data, census_data, 
+        left_on = shape_feature_name, right_on = data_feature_name, 
+        how = 'outer')
+        details['rows_out'] = len(merged_shape_data_table)
     if dropna_geometry == True:
         merged_shape_data_table.dropna(subset = 'geometry', inplace = True)
     return merged_shape_data_table
 
 
+# This JavaScript snippet returns true once a Folium map has finished
+# loading: the page itself has loaded, every Leaflet tile image has been
+# downloaded, and at least one GeoJSON shape has been drawn. (Leaflet adds
+# the 'leaflet-tile-loaded' class to each tile once it finishes loading,
+# and GeoJSON features are drawn as 'leaflet-interactive' SVG paths. Maps
+# created by render_point_map instead draw their markers on a <canvas>
+# element or display them as '.marker-cluster' icons.)
+MAP_READY_SCRIPT = """
+if (document.readyState !== 'complete') {return false;}
+var tiles = document.querySelectorAll('img.leaflet-tile');
+for (var i = 0; i < tiles.length; i++) {
+    if (!tiles[i].complete &&
+    !tiles[i].classList.contains('leaflet-tile-error')) {return false;}
+}
+return document.querySelectorAll('path.leaflet-interactive, \
+.leaflet-overlay-pane canvas, .marker-cluster').length > 0;
+"""
+
+
+class MapScreenshotter:
+    '''This class keeps one or more headless Chrome browsers open so that
+    they can be reused to create .png copies of many maps. Launching a new
+    browser for each map (as render_map does when no screenshotter is
+    passed to it) takes a few seconds, so reusing browsers can greatly
+    reduce the runtime of scripts that create many maps.
+
+    Rather than waiting a fixed amount of time before taking each screenshot,
+    this class waits until all map tiles and shapes have been rendered 
+    (see MAP_READY_SCRIPT above). This prevents half-rendered screenshots
+    of large maps while also avoiding unnecessary waiting for small ones.
+
+    Variables:
+
+    browser_count: The number of browsers to keep open. capture_many() will
+    take screenshots in parallel across all of these browsers.
+
+    window_width: The width of each browser window in pixels. The height
+    will be set to 9/16 of this value.
+
+    timeout: The maximum number of seconds to wait for a map to finish 
+    rendering. If this limit is reached, a screenshot will be taken anyway
+    (and a warning will be printed).
+
+    Example:
+
+    with MapScreenshotter(browser_count = 2) as screenshotter:
+        for variable in variable_list:
+            render_map(..., screenshotter = screenshotter)
+    
+    (Using a 'with' statement ensures that the browsers will get closed
+    once you're done with them.)
+    '''
+
+    def __init__(self, browser_count = 1, window_width = 5500, timeout = 30):
+        self.window_width = window_width
+        self.timeout = timeout
+        self.browser_count = browser_count
+        self.available_drivers = queue.Queue()
+        for i in range(browser_count):
+            self.available_drivers.put(self._launch_driver())
+
+    def _launch_driver(self):
+        # Selenium is imported here (rather than at the top of this file)
+        # so that scripts that only create .html maps don't need to 
+        # spend time loading it.
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        # This section uses code from https://www.selenium.dev/documentation/webdriver/drivers/options/ 
+        options = Options() 
+        # The following line comes from user 'undetected Selenium' at:
+        # # Based on https://stackoverflow.com/a/55016352/13097194
+        options.add_argument("--headless") # This ended up being necessary
+        # in order to set the width and height (as verified by 
+        # get_window_size()) equal to window_width and window_height. Without
+        # headless mode, the window ended up being significantly smaller.)
+        seldriver = webdriver.Chrome(options=options)
+        # See https://www.selenium.dev/documentation/webdriver/getting_started/open_browser/
+        # For more information on using Selenium to get screenshots of .html 
+        # files, see my get_screenshots.ipynb file within my route_maps_builder
+        # program, available here:
+        # https://github.com/kburchfiel/route_maps_builder/blob/master/get_screenshots.ipynb
+        seldriver.set_window_size(self.window_width,
+        self.window_width*(9/16)) # Creates a window with an HD/4K/8K 
+        # aspect ratio. A large window can better capture small details 
+        # (such as zip code shapefiles).
+        return seldriver
+
+    def _capture_with_driver(self, seldriver, html_path, screenshot_path):
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import TimeoutException
+        # Relative paths don't work with seldriver.get(), so they will 
+        # get converted to absolute file:// URIs here.
+        if '://' not in html_path:
+            html_path = pathlib.Path(html_path).resolve().as_uri()
+        seldriver.get(html_path)
+        # See https://www.selenium.dev/documentation/webdriver/browser/navigation/
+        try:
+            WebDriverWait(seldriver, self.timeout, poll_frequency = 0.1).until(
+                lambda driver: driver.execute_script(MAP_READY_SCRIPT))
+            # See https://www.selenium.dev/documentation/webdriver/waits/
+        except TimeoutException:
+            print(f"Warning: {html_path} did not finish rendering within \
+{self.timeout} seconds; its screenshot may be incomplete.")
+        seldriver.get_screenshot_as_file(screenshot_path) 
+        # Based on:
+        # https://www.selenium.dev/selenium/docs/api/java/org/openqa/selenium/TakesScreenshot.html
+
+    def capture(self, html_path, screenshot_path):
+        '''Saves a screenshot of the map stored at html_path to 
+        screenshot_path using the next available browser.'''
+        from selenium.common.exceptions import WebDriverException
+        seldriver = self.available_drivers.get()
+        try:
+            if seldriver is None: # (A browser that failed to relaunch
+                # earlier will be launched again here.)
+                seldriver = self._launch_driver()
+            self._capture_with_driver(seldriver, html_path, screenshot_path)
+        except WebDriverException:
+            # If the browser crashed, it will get replaced with a new one
+            # so that later screenshots can still be taken. A broken 
+            # browser never gets returned to the pool; if the new one 
+            # can't be launched, None is returned in its place so that
+            # the next capture() call can try again.
+            broken_driver, seldriver = seldriver, None
+            try:
+                if broken_driver is not None:
+                    broken_driver.quit()
+            except Exception:
+                pass
+            try:
+                seldriver = self._launch_driver()
+            except Exception as launch_error:
+                print(f"Warning: a replacement browser could not be \
+launched ({launch_error}).")
+            raise
+        finally:
+            self.available_drivers.put(seldriver)
+        return screenshot_path
+
+    def capture_many(self, path_pairs):
+        '''Takes screenshots of many maps in parallel.
+        
+        path_pairs: a list of (html_path, screenshot_path) tuples.
+        
+        Returns a list of the screenshot paths that were created.'''
+        with ThreadPoolExecutor(max_workers = self.browser_count) as executor:
+            return list(executor.map(
+                lambda path_pair: self.capture(*path_pair), path_pairs))
+
+    def close(self):
+        '''Closes all browsers managed by this screenshotter.'''
+        while not self.available_drivers.empty():
+            seldriver = self.available_drivers.get()
+            if seldriver is not None:
+                seldriver.quit()
+            # Based on: https://www.selenium.dev/documentation/webdriver/browser/windows/
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+def _bin_indices(values, bins, color_count):
+    '''Returns the index of the bin in which each value falls.'''
+    bin_edges = np.asarray(bins, dtype = float)
+    # As in folium.Choropleth, the final bin edge gets increased by a tiny
+    # amount so that the maximum value falls within the last bin rather
+    # than outside of it.
+    digitize_edges = bin_edges.copy()
+    digitize_edges[-1] = np.nextafter(digitize_edges[-1], np.inf)
+    bin_indices = np.digitize(np.asarray(values, dtype = float), 
+    digitize_edges, right = False) - 1
+    return np.clip(bin_indices, 0, color_count - 1)
+
+
+def _assign_bin_colors(values, bins, fill_color):
+    '''Determines the ColorBrewer color that each value should receive
+    based on the bins in which it falls. This mirrors the approach used
+    within folium.Choropleth so that maps created without that class
+    will still have the same colors.
+    
+    Returns a tuple containing (1) the list of colors used for the bins and
+    (2) an array with each value's color.'''
+    color_range = color_brewer(fill_color, n = len(bins) - 1)
+    color_indices = _bin_indices(values, bins, len(color_range))
+    return color_range, np.array(color_range)[color_indices]
+
+
+def _quantize_geometry(geometry, coordinate_decimals):
+    '''Rounds all coordinates within a GeoSeries to coordinate_decimals
+    decimal places. 4 decimal places corresponds to a precision of around
+    11 meters, which is more than enough for choropleth maps, and removes
+    many characters from each coordinate within the map's GeoJSON data.'''
+    return geopandas.GeoSeries(shapely.transform(
+        geometry.values, lambda coords: np.round(coords, coordinate_decimals)),
+        index = geometry.index, crs = geometry.crs)
+    # See https://shapely.readthedocs.io/en/stable/reference/shapely.transform.html
+
+
+def _encode_topology(geometry, coordinate_decimals):
+    '''Converts a GeoSeries of polygons and multipolygons into a TopoJSON
+    topology (see https://github.com/topojson/topojson-specification).
+    Coordinates are stored as integers on a grid whose spacing equals
+    coordinate_decimals decimal places, and each point after the first
+    within an arc is stored as the difference from the previous point.
+    In addition, borders shared by neighboring shapes (such as two
+    counties) are stored only once. Together, these steps make the
+    topology far smaller than the equivalent GeoJSON data.
+
+    The topology's 'shapes' object contains one geometry per row of
+    geometry, in the same order. (Shapes that are missing, empty, or
+    too small to survive quantization get a null geometry.)'''
+    scale = 10.0 ** -coordinate_decimals
+    translate = np.floor(geometry.total_bounds[:2] / scale) * scale
+
+    # Quantizing each ring. (Rings are stored without their closing
+    # points, and repeated points are removed.)
+    rings = []
+    shape_polygons = [] # Lists of each shape's polygons' ring numbers
+    for shape in geometry.values:
+        polygons = []
+        if shape is not None and not shape.is_empty:
+            for polygon in shapely.get_parts(shape):
+                if not isinstance(polygon, shapely.Polygon):
+                    continue
+                ring_numbers = []
+                for ring in [polygon.exterior, *polygon.interiors]:
+                    points = np.round((shapely.get_coordinates(ring)[:-1]
+                    - translate) / scale).astype(np.int64)
+                    points = points[(points != np.roll(
+                        points, 1, axis = 0)).any(axis = 1)]
+                    if len(points) < 3:
+                        if len(ring_numbers) == 0: # The exterior ring
+                            # collapsed, so the whole polygon is skipped.
+                            break
+                        continue
+                    ring_numbers.append(len(rings))
+                    rings.append(points)
+                if len(ring_numbers) > 0:
+                    polygons.append(ring_numbers)
+        shape_polygons.append(polygons)
+
+    # Finding junctions: points at which a ring meets a different set of
+    # neighboring shapes. These are the points where shared borders begin
+    # and end, so each ring is split into arcs at these points. (A point
+    # is a junction if it's connected to more than two other points across
+    # all rings.)
+    ring_junctions = []
+    if len(rings) > 0:
+        ring_lengths = np.array([len(points) for points in rings])
+        ring_starts = np.repeat(np.cumsum(ring_lengths) - ring_lengths,
+        ring_lengths)
+        ring_offsets = np.arange(ring_lengths.sum()) - ring_starts
+        ring_sizes = np.repeat(ring_lengths, ring_lengths)
+        point_ids = np.unique(np.concatenate(rings), axis = 0,
+        return_inverse = True)[1].ravel()
+        neighbor_ids = np.concatenate([
+            point_ids[ring_starts + (ring_offsets - 1) % ring_sizes],
+            point_ids[ring_starts + (ring_offsets + 1) % ring_sizes]])
+        connections = np.unique(np.column_stack(
+            [np.tile(point_ids, 2), neighbor_ids]), axis = 0)
+        is_junction = (np.bincount(connections[:, 0]) > 2)[point_ids]
+        ring_junctions = np.split(is_junction, np.cumsum(ring_lengths)[:-1])
+
+    arcs = []
+    arc_numbers = {}
+    def add_arc(points):
+        # Returns the arc's number, reusing an existing arc if the same
+        # points were already stored. (Arcs traversed in the opposite
+        # direction are referenced as ~number, per the TopoJSON spec.)
+        key = points.tobytes()
+        if key in arc_numbers:
+            return arc_numbers[key]
+        reverse_key = points[::-1].tobytes()
+        if reverse_key in arc_numbers:
+            return ~arc_numbers[reverse_key]
+        arc_numbers[key] = len(arcs)
+        arcs.append(points)
+        return len(arcs) - 1
+
+    # Splitting each ring into pieces at its junctions, then counting the
+    # rings in which each piece appears (in either direction):
+    ring_pieces = []
+    piece_counts = {}
+    def piece_key(piece):
+        return min(piece.tobytes(), piece[::-1].tobytes())
+    for points, junctions in zip(rings, ring_junctions):
+        junction_positions = np.flatnonzero(junctions)
+        if len(junction_positions) == 0:
+            # Rings that don't touch any other rings become a single piece
+            # that starts at their lowest point. (This allows a ring that
+            # exactly matches another shape's hole to share its arc.)
+            points = np.roll(points, -np.lexsort(
+                (points[:, 1], points[:, 0]))[0], axis = 0)
+            pieces = [np.vstack([points, points[:1]])]
+        else:
+            points = np.roll(points, -junction_positions[0], axis = 0)
+            closed_points = np.vstack([points, points[:1]])
+            cuts = list(junction_positions - junction_positions[0]) + [
+                len(points)]
+            pieces = [closed_points[start:end + 1]
+            for start, end in zip(cuts[:-1], cuts[1:])]
+        for piece in pieces:
+            piece_counts[piece_key(piece)] = piece_counts.get(
+                piece_key(piece), 0) + 1
+        ring_pieces.append(pieces)
+
+    # Shared pieces become their own arcs, but all other consecutive pieces
+    # are joined back together. Pieces with fewer than 4 points are
+    # treated as unshared, since storing them as separate arcs would take
+    # up more space than it saves. (Simplified boundary files often have
+    # junctions at nearly every point.)
+    def join_pieces(pieces):
+        # (Each piece starts with the previous piece's final point.)
+        return np.vstack([pieces[0]] + [piece[1:] for piece in pieces[1:]])
+
+    ring_arcs = []
+    for pieces in ring_pieces:
+        is_shared = [piece_counts[piece_key(piece)] > 1 and len(piece) >= 4
+        for piece in pieces]
+        if True in is_shared:
+            # Starting at a shared piece ensures that the unshared pieces
+            # at the beginning and end of the ring get joined together.
+            first_shared = is_shared.index(True)
+            pieces = pieces[first_shared:] + pieces[:first_shared]
+            is_shared = is_shared[first_shared:] + is_shared[:first_shared]
+        arc_list = []
+        unshared_pieces = []
+        for piece, piece_is_shared in zip(pieces, is_shared):
+            if piece_is_shared == False:
+                unshared_pieces.append(piece)
+                continue
+            if len(unshared_pieces) > 0:
+                arc_list.append(add_arc(join_pieces(unshared_pieces)))
+                unshared_pieces = []
+            arc_list.append(add_arc(piece))
+        if len(unshared_pieces) > 0:
+            arc_list.append(add_arc(join_pieces(unshared_pieces)))
+        ring_arcs.append(arc_list)
+
+    geometries = []
+    for polygons in shape_polygons:
+        polygon_arcs = [[ring_arcs[ring_number] for ring_number in
+        ring_numbers] for ring_numbers in polygons]
+        if len(polygon_arcs) == 0:
+            geometries.append({'type':None})
+        elif len(polygon_arcs) == 1:
+            geometries.append({'type':'Polygon', 'arcs':polygon_arcs[0]})
+        else:
+            geometries.append({'type':'MultiPolygon', 'arcs':polygon_arcs})
+
+    return {'type':'Topology',
+    'transform':{'scale':[scale, scale], 'translate':translate.tolist()},
+    'objects':{'shapes':{'type':'GeometryCollection',
+    'geometries':geometries}},
+    'arcs':[np.vstack([points[:1], np.diff(points, axis = 0)]).tolist()
+    for points in arcs]}
+
+
+def _topology_to_json(topology):
+    # The topology only contains numbers and fixed strings, so it can
+    # be written without the extra spaces that tojson would add.
+    return json.dumps(topology, separators = (',', ':'))
+
+
+def convert_geometry_to_topology(geometry, coordinate_decimals = 4):
+    '''Converts a GeoSeries into the serialized TopoJSON topology that
+    compact maps store within their .html files. render_maps() calls this
+    function once per batch, but its output can also be saved and passed
+    back to render_maps() via the topology argument.'''
+    return _topology_to_json(_encode_topology(geometry, coordinate_decimals))
+
+
+# This JavaScript function escapes tooltip values and aliases before they
+# get added to a tooltip's HTML (so that a shape name like 'A&M <Main>'
+# is displayed as is rather than being interpreted as markup). It's
+# shared by the templates of _CompactChoroplethLayer and
+# _VectorTileTooltip.
+ESCAPE_HTML_SCRIPT = """
+function escapeHtml(value) {
+    return String(value).replace(/&/g, '&amp;').replace(
+        /</g, '&lt;').replace(/>/g, '&gt;');
+}
+"""
+
+
+class _CompactChoroplethLayer(JSCSSMixin, Layer):
+    '''Displays a choropleth layer whose shapes are stored as a TopoJSON
+    topology (created by _encode_topology()). Rather than being stored
+    within every shape, the tooltip values and colors are stored as
+    separate lists (one entry per shape) that the JavaScript code below
+    attaches to the shapes once they've been decoded. Shapes whose color
+    index is None are left off the map.'''
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = (function() {
+            var topology = {{ this.topology_json }};
+            var tooltipFields = {{ this.tooltip_fields|tojson }};
+            var tooltipAliases = {{ this.tooltip_aliases|tojson }};
+            var tooltipValues = {{ this.tooltip_values|tojson }};
+            var colorIndices = {{ this.color_indices|tojson }};
+            var colors = {{ this.colors|tojson }};
+
+            var features = topojson.feature(topology,
+                topology.objects.shapes).features;
+            features.forEach(function(feature, featureIndex) {
+                feature.properties = {
+                    fill_color: colors[colorIndices[featureIndex]]};
+                tooltipFields.forEach(function(field, fieldIndex) {
+                    feature.properties[field] = tooltipValues[fieldIndex][
+                        featureIndex];
+                });
+            });
+            // Shapes whose values are missing (and thus have no color)
+            // aren't displayed, as in render_map.
+            features = features.filter(function(feature, featureIndex) {
+                return colorIndices[featureIndex] !== null;
+            });
+
+            """ + ESCAPE_HTML_SCRIPT + """
+
+            var layer = L.geoJson(features, {
+                style: function(feature) {
+                    return {fillColor: feature.properties.fill_color,
+                        color: '#000000', fillOpacity: 0.75, opacity: 0.2,
+                        weight: 1};
+                },
+                onEachFeature: function(feature, featureLayer) {
+                    featureLayer.on({
+                        mouseover: function(e) {
+                            e.target.setStyle({fillColor: '#000000',
+                                color: '#000000', fillOpacity: 0.50,
+                                weight: 0.1});
+                        },
+                        mouseout: function(e) {
+                            layer.resetStyle(e.target);
+                        }
+                    });
+                }
+            });
+            // (This tooltip matches the one created by
+            // folium.features.GeoJsonTooltip within render_map.)
+            layer.bindTooltip(function(featureLayer) {
+                var properties = featureLayer.feature.properties;
+                return '<div style="background-color: white; color: ' +
+                    '#333333; font-family: arial; font-size: 12px; ' +
+                    'padding: 10px;"><table>' + tooltipFields.map(
+                    function(field, fieldIndex) {
+                        return '<tr style="text-align: left;"><th style=' +
+                            '"padding: 2px; padding-right: 8px;">' +
+                            escapeHtml(tooltipAliases[fieldIndex]) +
+                            '</th><td>' + escapeHtml(properties[field]) +
+                            '</td></tr>';
+                    }).join('') + '</table></div>';
+            }, {sticky: true});
+            return layer;
+        })().addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """)
+
+    # (folium.features.TopoJson loads the same library.)
+    default_js = [('topojson',
+    'https://cdnjs.cloudflare.com/ajax/libs/topojson/1.6.9/topojson.min.js')]
+
+    def __init__(self, topology, tooltip_fields, tooltip_aliases,
+    tooltip_values, color_indices, colors, name = 'choropleth'):
+        super().__init__(name = name, overlay = True)
+        self._name = 'CompactChoroplethLayer'
+        # topology can also be a string returned by 
+        # convert_geometry_to_topology(), in which case it gets written
+        # to the page as is.
+        self.topology_json = topology if isinstance(topology, str) else (
+            _topology_to_json(topology))
+        self.tooltip_fields = tooltip_fields
+        self.tooltip_aliases = tooltip_aliases
+        self.tooltip_values = tooltip_values
+        self.color_indices = color_indices
+        self.colors = colors
+
+
+def _add_compact_choropleth_layer(m, merged_data_table, shape_feature_name,
+    data_variable, bins, fill_color, legend_name, tooltip_fields, 
+    tooltip_aliases, coordinate_decimals = 4, topology = None):
+    '''Adds a choropleth layer to the map m that stores each shape only
+    once. (render_map's default approach adds shapes to the map twice: once
+    for the choropleth and once for the tooltip overlay.) The shapes are
+    stored as a TopoJSON topology whose coordinates are quantized to
+    coordinate_decimals decimal places, and only the columns needed for
+    the tooltip are retained, which greatly reduces the size of the map's
+    .html file.
+
+    topology: an optional topology (or serialized topology) of 
+    merged_data_table's geometry that was encoded ahead of time. When it's
+    provided, merged_data_table doesn't need a geometry column.'''
+    color_range = color_brewer(fill_color, n = len(bins) - 1)
+    # Rows whose data_variable values are missing receive a color index of
+    # None, which keeps them off the map.
+    color_indices = [int(color_index) if has_value else None
+    for color_index, has_value in zip(_bin_indices(
+        merged_data_table[data_variable], bins, len(color_range)),
+        merged_data_table[data_variable].notna())]
+    # Removing any duplicate tooltip columns (while preserving their order
+    # and their aliases):
+    tooltip_columns = {}
+    for field, alias in zip(tooltip_fields, tooltip_aliases):
+        tooltip_columns.setdefault(field, alias)
+    tooltip_fields = list(tooltip_columns)
+    tooltip_aliases = list(tooltip_columns.values())
+    tooltip_values = [merged_data_table[column].astype(object).where(
+        merged_data_table[column].notna(), None).tolist()
+        for column in tooltip_fields]
+    if topology is None:
+        topology = _encode_topology(merged_data_table['geometry'],
+        coordinate_decimals)
+    m.add_child(_CompactChoroplethLayer(topology,
+        tooltip_fields, tooltip_aliases, tooltip_values,
+        color_indices, color_range))
+    # Adding a legend that resembles the one created by folium.Choropleth:
+    StepColormap(color_range, index = list(bins), vmin = bins[0],
+    vmax = bins[-1], caption = legend_name).add_to(m)
+    return m
+
+
+def _save_static_map_image(merged_data_table, data_variable, bins,
+    fill_color, legend_name, image_path, image_width = 5500,
+    fill_opacity = 0.75, line_opacity = 0.2):
+    '''Creates a .png version of a choropleth map using Matplotlib rather
+    than a web browser. This is much faster than taking a screenshot of the
+    .html version of the map, and it doesn't require Chrome or Selenium
+    to be installed. However, the resulting image won't include any 
+    background map tiles.
+
+    The colors assigned to each shape, along with the bins shown in the 
+    legend, match those used by folium.Choropleth (which also relies on 
+    branca's color_brewer() function to retrieve its colors).
+
+    merged_data_table: the table to map. Rows with missing data_variable
+    values should already have been removed.
+
+    image_width: the width of the image in pixels. The height will be set
+    to 9/16 of this value (matching the screenshots created by
+    MapScreenshotter).
+    '''
+    # Matplotlib is only needed for this function, so it gets imported here
+    # rather than at the top of the file.
+    from matplotlib.figure import Figure
+    from matplotlib.colors import ListedColormap, BoundaryNorm
+    from matplotlib.colorbar import ColorbarBase
+
+    bin_edges = np.asarray(bins, dtype = float)
+    color_range, shape_colors = _assign_bin_colors(
+        merged_data_table[data_variable], bin_edges, fill_color)
+
+    # Using Figure directly (rather than matplotlib.pyplot) avoids opening
+    # a GUI window and keeps this function safe to call from scripts
+    # running on servers. See
+    # https://matplotlib.org/stable/gallery/user_interfaces/web_application_server_sgskip.html
+    dpi = 200
+    fig = Figure(figsize = (image_width / dpi, image_width * (9/16) / dpi),
+    dpi = dpi)
+    ax = fig.add_axes([0, 0, 1, 0.88]) # The top of the figure is reserved
+    # for the legend so that it won't cover any shapes.
+    merged_data_table.plot(ax = ax, color = shape_colors, alpha = fill_opacity,
+    edgecolor = (0, 0, 0, line_opacity), linewidth = 0.5)
+    ax.set_axis_off()
+
+    # Adding a legend whose layout resembles the one that folium.Choropleth
+    # places in the top right corner of the map:
+    legend_ax = fig.add_axes([0.62, 0.92, 0.35, 0.025])
+    ColorbarBase(legend_ax, cmap = ListedColormap(color_range), 
+    norm = BoundaryNorm(bin_edges, len(color_range)), 
+    orientation = 'horizontal', ticks = bin_edges, 
+    label = legend_name, alpha = fill_opacity)
+    legend_ax.xaxis.set_label_position('top')
+    legend_ax.tick_params(labelsize = 6)
+
+    fig.savefig(image_path, dpi = dpi)
+    return image_path
 
 
 def render_map(merged_data_table, shape_feature_name, 
@@ -193,7 +1423,9 @@ def render_map(merged_data_table, shape_feature_name,
     fill_color = 'Blues', rows_to_map = 0, bin_type = 'percentiles', 
     tiles = 'OpenStreetMap', generate_image = True, multiply_data_by = 1,
     additional_tooltip_cols = [], additional_popup_variable_strings = [],
-    zoom_start = 7, delete_html_file = False):
+    zoom_start = 7, delete_html_file = False, screenshotter = None,
+    image_backend = 'selenium', compact_output = False, 
+    coordinate_decimals = 4):
     '''
     (This code derives from old_generate_map within census_folium_viewer.py,
     available at https://github.com/kburchfiel/census_folium_tutorial .)
@@ -301,6 +1533,35 @@ def render_map(merged_data_table, shape_feature_name,
     an alternative version of the map purely for screenshot generation
     purposes and don't need to keep the HTML file on which it was based.
 
+    screenshotter: An optional MapScreenshotter instance that will be used
+    to create the .png version of the map. Passing the same screenshotter to
+    many render_map calls allows its browsers to be reused, which is much
+    faster than launching a new browser for each map. If no screenshotter
+    is provided, a temporary one will be created (and then closed).
+
+    image_backend: The method used to create the .png version of the map.
+    'selenium' (the default) takes a screenshot of the .html map within 
+    Chrome. 'matplotlib' instead draws the shapes, colors, and legend 
+    directly within Python via _save_static_map_image(). The 'matplotlib'
+    option is much faster and doesn't require a browser, but its
+    images won't include map tiles; it's a good fit for maps that will be 
+    placed in PDFs or slides.
+
+    compact_output: Set to True to create a much smaller .html file. In this
+    mode, each shape is stored only once (rather than once for the 
+    choropleth and once for the tooltip overlay) within a TopoJSON 
+    topology, which stores coordinates as small integers and stores 
+    borders shared by neighboring shapes only once. In addition, only the
+    shape name, data variable, and additional_tooltip_cols columns are 
+    included. This is especially helpful for county and zip code maps, 
+    whose .html files can otherwise be quite large. (For a 3,144-row 
+    county table, this option reduced the .html file's size from 6.3 MB 
+    to 1.1 MB.)
+
+    coordinate_decimals: The number of decimal places to which coordinates
+    will be rounded when compact_output is True. (4 decimal places 
+    correspond to around 11 meters.)
+
     Note: a sizeable portion of the following code, particularly the custom 
     choropleth mapping function and the code for the interactive overlay, 
     came from Amodiovalerio Verde's excellent interactive
@@ -316,7 +1577,12 @@ def render_map(merged_data_table, shape_feature_name,
     
     '''
     
-
+    # Checking image_backend before any work is done (so that an invalid
+    # value won't cause the function to fail after the .html file has
+    # already been saved):
+    if image_backend not in ['selenium', 'matplotlib']:
+        raise ValueError("Error: image_backend should be either \
+'selenium' or 'matplotlib'.")
 
     # The function will first drop rows in the table 
     # whose data variable column value is missing.
@@ -343,30 +1609,12 @@ def render_map(merged_data_table, shape_feature_name,
         merged_data_table_copy = merged_data_table_copy.copy()[0:rows_to_map]
     print("Length of table is",len(merged_data_table_copy))
 
-    if bin_type == 'percentiles':
-    # This option creates bins that correspond to different percentiles
-    # within the data.
-        bins = np.percentile(merged_data_table_copy[data_variable].dropna(), 
-        [0, 12.5, 25, 37.5, 50, 62.5, 75, 87.5, 100])
-        # https://numpy.org/doc/stable/reference/generated/numpy.percentile.html
-
-
-
-    elif bin_type == 'equally_spaced':
-        min_val = merged_data_table_copy[data_variable].min()
-        max_val = merged_data_table_copy[data_variable].max()
-        increment = (max_val - min_val)/8
-        bins = list(np.arange(min_val, max_val, increment))
-        bins.append(max_val)
-        print(bins)
-    # This option creates equally spaced bins. If outliers are skewing the 
-    # data, this option may not be as ideal as the percentiles one.
-
-
-    else:
-        raise TypeError("Error: bin type not recognized. Bin type should be \
-either 'percentiles' or 'equally spaced.'")
-
+    with _stage('binning', 'render_map', 
+    rows_in = len(merged_data_table_copy)):
+        # The bins are calculated by calculate_bins() so that they will
+        # match those created by render_maps() for the same variable.
+        bins = calculate_bins(merged_data_table_copy[
+            [data_variable]].to_numpy(dtype = float), [bin_type])[0]
 
     # The function will now map the data:
 
@@ -375,126 +1623,1542 @@ either 'percentiles' or 'equally spaced.'")
     # The latitude and longitude were chosen so that, when a screenshot of 
     # the map was taken within Firefox via the code below, the legend and 
     # data labels would be on a relatively light surface within Candada.
-    folium.Choropleth(
-        geo_data=merged_data_table_copy,
-        name="choropleth",
-        data=merged_data_table_copy,
-        columns=[shape_feature_name, data_variable],
-        key_on="feature.properties."+shape_feature_name,
-        # See the following page for more information on folium.Choropleth
-        # and other folium features:
-        # https://github.com/python-visualization/folium/blob/main/folium/features.py)        
-        # I believe that the values stored in the list passed to the key_on 
-        # parameter must equal those stored in the first entry within the 
-        # columns parameter. That's why shape_feature_name is used for 
-        # both entries here.
-        fill_color = fill_color,
-        bins = bins,
-        fill_opacity=0.75, # Allows city names to be read underneath zip codes
-        line_opacity=0.2, # Without outlines, it's harder to distinguish terrain 
-        # from zip codes.
-        legend_name=data_variable_text
-    ).add_to(m)
+    tooltip_fields = [shape_feature_name, data_variable
+    ] + additional_tooltip_cols
+    tooltip_aliases = [feature_text, popup_variable_text
+    ] + additional_popup_variable_strings
+
+    with _stage('geojson_serialization', 'render_map', 
+    rows_in = len(merged_data_table_copy)):
+        if compact_output == True:
+            _add_compact_choropleth_layer(m, merged_data_table_copy, 
+            shape_feature_name, data_variable, bins, fill_color,
+            data_variable_text, tooltip_fields, tooltip_aliases,
+            coordinate_decimals = coordinate_decimals)
+            folium.LayerControl().add_to(m)
+
+        else:
+            folium.Choropleth(
+                geo_data=merged_data_table_copy,
+                name="choropleth",
+                data=merged_data_table_copy,
+                columns=[shape_feature_name, data_variable],
+                key_on="feature.properties."+shape_feature_name,
+                # See the following page for more information on folium.Choropleth
+                # and other folium features:
+                # https://github.com/python-visualization/folium/blob/main/folium/features.py)        
+                # I believe that the values stored in the list passed to the key_on 
+                # parameter must equal those stored in the first entry within the 
+                # columns parameter. That's why shape_feature_name is used for 
+                # both entries here.
+                fill_color = fill_color,
+                bins = bins,
+                fill_opacity=0.75, # Allows city names to be read underneath zip codes
+                line_opacity=0.2, # Without outlines, it's harder to distinguish terrain 
+                # from zip codes.
+                legend_name=data_variable_text
+            ).add_to(m)
+
+            folium.LayerControl().add_to(m)
+
+            # Next, I'll add overlays that display the name of the shape and its
+            # value when the user hovers over it. 
+
+            # The following code came from Amodiovalerio Verde's excellent interactive
+            # choropleth tutorial at
+            # https://vverde.github.io/blob/interactivechoropleth.html .
+            # Amodiovalerio informed me via email that there are "no specific
+            # licences for the code of interactivechoropleth. 
+            # You're free to use the code. A mention/link will be appreciated."
+            # Thank you, Amodiovalerio!
+
+
+            style_function = lambda x: {'fillColor': '#ffffff', 
+                                        'color':'#000000', 
+                                        'fillOpacity': 0.1, 
+                                        'weight': 0.1}
+            highlight_function = lambda x: {'fillColor': '#000000', 
+                                            'color':'#000000', 
+                                            'fillOpacity': 0.50, 
+                                            'weight': 0.1}
+            data_popup = folium.features.GeoJson(
+                merged_data_table_copy,
+                style_function=style_function, 
+                control=False,
+                highlight_function=highlight_function, 
+                tooltip=folium.features.GeoJsonTooltip(
+                    fields=tooltip_fields,
+                    aliases=tooltip_aliases,
+                    style=("background-color: white; color: #333333; font-family: \
+                    arial; font-size: 12px; padding: 10px;") 
+                )
+            )
+            m.add_child(data_popup)
+            m.keep_in_front(data_popup)
+
+    # Note: A simpler means of adding a tooltip to the map would look something like the following. [I haven't tested out this code within this function, however.]
+
+    #     tooltip = folium.features.GeoJsonTooltip(fields = [shape_feature_name, data_variable], aliases = [feature_text, popup_variable_text)
+    # # Based on https://python-visualization.github.io/folium/modules.html#folium.features.GeoJsonTooltip
 
+    # folium.features.GeoJson(data = merged_data_table_copy, tooltip=tooltip, style_function = lambda x:{'opacity':0, 'fillOpacity':0}).add_to(m)
+
+    # # Style function parameters come from https://leafletjs.com/SlavaUkraini/reference.html#path ; the format of style_function is based on one of the examples on https://python-visualization.github.io/folium/modules.html#folium.features.GeoJsonTooltip
+
+    map_file_path = html_save_path+'/'+map_name+'.html'
+    with _stage('html_save', 'render_map') as details:
+        m.save(map_file_path)
+        details['output_bytes'] = os.path.getsize(map_file_path)
+
+
+    # Finally, the function uses the Selenium library to create a screenshot 
+    # of the map so that it can be shared as a .png file.
+    # See https://www.selenium.dev/documentation/ for more information on 
+    # Selenium. Note that some setup work is required for the Selenium code
+    # to run correctly; if you don't have time right now to complete this 
+    # setup, you can skip the screenshot generation process.
+
+
+    if generate_image == True:
+        screenshot_file_path = screenshot_save_path+'/'+map_name+'.png'
+        with _stage('screenshot', 'render_map') as details:
+            if image_backend == 'matplotlib':
+                _save_static_map_image(merged_data_table_copy, data_variable,
+                bins, fill_color, data_variable_text, screenshot_file_path)
+            elif screenshotter is not None:
+                screenshotter.capture(map_file_path, screenshot_file_path)
+            else:
+                with MapScreenshotter() as temporary_screenshotter:
+                    temporary_screenshotter.capture(
+                        map_file_path, screenshot_file_path)
+            details['output_bytes'] = os.path.getsize(screenshot_file_path)
+
+    if delete_html_file == True:
+        os.remove(map_file_path)
+
+    return m
+
+
+def calculate_bins(value_matrix, bin_types):
+    '''Calculates choropleth bins for many variables at once.
+
+    value_matrix: a 2D NumPy array with one row per shape and one column
+    per variable. Missing values should be stored as NaN.
+
+    bin_types: a list containing the bin type ('percentiles' or 
+    'equally_spaced') to use for each column in value_matrix. See
+    render_map's documentation for more information on these options.
+
+    Returns a list of bin arrays (one per column). Rather than calculating
+    each variable's bins separately, this function calculates all 
+    percentile-based bins within a single np.nanpercentile() call and all
+    equally spaced bins within a single set of array operations.'''
+    value_matrix = np.asarray(value_matrix, dtype = float)
+    bins_list = [None] * value_matrix.shape[1]
+    for bin_type in set(bin_types):
+        if bin_type not in ['percentiles', 'equally_spaced']:
+            raise TypeError("Error: bin type not recognized. Bin type should \
+be either 'percentiles' or 'equally spaced.'")
+
+    percentile_columns = [i for i, bin_type in enumerate(bin_types) 
+    if bin_type == 'percentiles']
+    if len(percentile_columns) > 0:
+        # The result of this call has one row per percentile and one 
+        # column per variable.
+        percentile_bins = np.nanpercentile(
+            value_matrix[:, percentile_columns], 
+            [0, 12.5, 25, 37.5, 50, 62.5, 75, 87.5, 100], axis = 0)
+        # https://numpy.org/doc/stable/reference/generated/numpy.nanpercentile.html
+        for i, column in enumerate(percentile_columns):
+            bins_list[column] = percentile_bins[:, i]
+
+    equally_spaced_columns = [i for i, bin_type in enumerate(bin_types) 
+    if bin_type == 'equally_spaced']
+    if len(equally_spaced_columns) > 0:
+        min_vals = np.nanmin(value_matrix[:, equally_spaced_columns], axis = 0)
+        max_vals = np.nanmax(value_matrix[:, equally_spaced_columns], axis = 0)
+        # Creating 9 equally spaced bin edges (and thus 8 bins) for
+        # each variable:
+        spaced_bins = min_vals + np.outer(
+            np.linspace(0, 1, 9), max_vals - min_vals)
+        for i, column in enumerate(equally_spaced_columns):
+            bins_list[column] = spaced_bins[:, i]
+
+    return bins_list
+
+
+# This dictionary stores the data that each batch map process will use 
+# for all of its maps. It gets populated by _init_batch_map_worker().
+_batch_map_state = {}
+
+
+def _init_batch_map_worker(state):
+    '''Stores the shared geometry and tooltip data used by 
+    _render_batch_map(). When render_maps() uses a process pool, this
+    function runs once within each process, so the shared data only needs
+    to be sent to each process once (rather than once per map).'''
+    _batch_map_state.clear()
+    _batch_map_state.update(state)
+
+
+def _render_batch_map(job):
+    '''Creates the .html (and, optionally, Matplotlib-based .png) version
+    of a single map within a render_maps() batch.'''
+    state = _batch_map_state
+    spec = job['spec']
+    data_variable = spec['data_variable']
+    # The serialized topology that was created ahead of time gets written
+    # to every map, so only each map's colors and tooltip values need to
+    # be converted to JSON. Rows whose data_variable values are missing
+    # stay within the topology, but they receive null colors and are
+    # therefore left off the map (as in render_map).
+    map_table = state['tooltip_table'].copy()
+    map_table[data_variable] = job['values'].astype(np.int64) if (
+        job['integer_values']) else job['values']
+
+    m = folium.Map(location=[38.7, -95], zoom_start=state['zoom_start'], 
+    tiles=state['tiles'])
+    _add_compact_choropleth_layer(m, map_table, state['shape_feature_name'],
+    data_variable, job['bins'], spec['fill_color'], 
+    spec['data_variable_text'], 
+    [state['shape_feature_name'], data_variable] + state['tooltip_cols'],
+    [state['feature_text'], spec['popup_variable_text']] 
+    + state['tooltip_aliases'], topology = state['topology'])
     folium.LayerControl().add_to(m)
+    map_file_path = state['html_save_path']+'/'+spec['map_name']+'.html'
+    m.save(map_file_path)
+
+    if state['image_backend'] == 'matplotlib':
+        row_positions = np.flatnonzero(~np.isnan(job['values']))
+        values = job['values'][row_positions]
+        image_table = geopandas.GeoDataFrame({data_variable:values},
+        geometry = state['geometry'].iloc[row_positions].values,
+        crs = state['geometry'].crs)
+        _save_static_map_image(image_table, data_variable, job['bins'],
+        spec['fill_color'], spec['data_variable_text'], 
+        state['screenshot_save_path']+'/'+spec['map_name']+'.png')
+
+    return map_file_path
+
+
+def render_maps(merged_data_table, shape_feature_name, variable_specs,
+    feature_text, html_save_path, screenshot_save_path, 
+    tiles = 'OpenStreetMap', generate_image = True, 
+    image_backend = 'selenium', additional_tooltip_cols = [], 
+    additional_popup_variable_strings = [], zoom_start = 7,
+    coordinate_decimals = 4, processes = 1, screenshotter = None,
+    topology = None):
+    '''Creates maps for many variables within the same merged data table.
+    This is much faster than calling render_map once per variable, as the
+    table's geometry only gets converted into a serialized TopoJSON 
+    topology once, and the bins for all variables are calculated together
+    via calculate_bins(). The maps match those created by render_map's
+    compact_output option. (The one difference is that shapes whose 
+    values are missing remain within each map's topology, though they
+    aren't displayed, so that every map can reuse the same topology.)
+
+    Variables:
+
+    variable_specs: a list of dictionaries, each of which describes one map.
+    Each dictionary must contain a 'data_variable' key; it may also contain
+    the following keys (whose meanings match those of the render_map 
+    arguments with the same names): 'map_name', 'data_variable_text', 
+    'popup_variable_text', 'variable_decimals', 'fill_color', 'bin_type', 
+    and 'multiply_data_by'. For example:
+    
+    variable_specs = [{'data_variable':'POPESTIMATE2022', 
+    'data_variable_text':'2022 Population Estimate', 'fill_color':'Blues'},
+    {'data_variable':'NPOPCHG2022', 'multiply_data_by':0.001, 
+    'data_variable_text':'2022 Population Change (Thousands)'}]
+
+    processes: the number of processes across which the maps will be
+    created. If this is greater than 1, the maps will be created in parallel
+    via a process pool. (On Windows, scripts that use this option should
+    place their code within an "if __name__ == '__main__':" block.)
+
+    screenshotter: an optional MapScreenshotter that will be used to create
+    .png copies of the maps when image_backend is 'selenium'. If none is 
+    passed, a temporary screenshotter with one browser per process will be
+    created.
+
+    topology: an optional serialized topology of the table's geometry, as
+    returned by convert_geometry_to_topology(). Code that maps the same
+    table many times (such as map_worker.py) can pass this topology to 
+    skip the conversion step. It should have been created with the same
+    coordinate_decimals value.
+
+    See render_map's documentation for the remaining arguments.
+
+    Returns a list of the paths to the .html files that were created.'''
+    
+    default_spec = {'variable_decimals':4, 'fill_color':'Blues', 
+    'bin_type':'percentiles', 'multiply_data_by':1, 
+    'data_variable_text':'Value', 'popup_variable_text':'Value'}
+    specs = []
+    for variable_spec in variable_specs:
+        spec = default_spec.copy()
+        spec['map_name'] = variable_spec['data_variable']
+        spec.update(variable_spec)
+        specs.append(spec)
+    if image_backend not in ['selenium', 'matplotlib']:
+        raise ValueError("Error: image_backend should be either \
+'selenium' or 'matplotlib'.")
+
+    # Creating a matrix that contains the multiplied and rounded values
+    # of every variable to be mapped. (No copy of the full table is made.)
+    value_matrix = np.column_stack([
+        np.round(merged_data_table[spec['data_variable']].to_numpy(
+            dtype = float) * spec['multiply_data_by'], 
+            spec['variable_decimals']) for spec in specs])
+    print("Calculating bins:")
+    bins_list = calculate_bins(value_matrix, 
+    [spec['bin_type'] for spec in specs])
+
+    # Serializing the table's geometry once so that it can be written
+    # to every map:
+    if topology is None:
+        print("Converting geometry to TopoJSON:")
+        topology = convert_geometry_to_topology(
+            merged_data_table['geometry'], coordinate_decimals)
+
+    state = {'shape_feature_name':shape_feature_name, 
+    'tooltip_table':pd.DataFrame(merged_data_table[list(dict.fromkeys(
+        [shape_feature_name] + list(additional_tooltip_cols)))]),
+    'topology':topology, 'geometry':merged_data_table['geometry'],
+    'tooltip_cols':list(additional_tooltip_cols),
+    'tooltip_aliases':list(additional_popup_variable_strings),
+    'feature_text':feature_text, 'tiles':tiles, 'zoom_start':zoom_start,
+    'html_save_path':html_save_path, 
+    'screenshot_save_path':screenshot_save_path,
+    'image_backend':image_backend if generate_image == True else None}
+
+    # Integer columns that are multiplied by integers keep their integer
+    # values (as they would within render_map), so their tooltips won't
+    # show a trailing '.0'.
+    jobs = [{'spec':spec, 'values':value_matrix[:, i], 'bins':bins_list[i],
+    'integer_values':pd.api.types.is_integer_dtype(
+        merged_data_table[spec['data_variable']]) and isinstance(
+        spec['multiply_data_by'], (int, np.integer))}
+    for i, spec in enumerate(specs)]
+
+    print(f"Rendering {len(jobs)} maps:")
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers = processes, 
+        initializer = _init_batch_map_worker, 
+        initargs = (state,)) as executor:
+            map_file_paths = list(executor.map(_render_batch_map, jobs))
+    else:
+        _init_batch_map_worker(state)
+        map_file_paths = [_render_batch_map(job) for job in jobs]
+    _batch_map_state.clear()
+
+    if generate_image == True and image_backend == 'selenium':
+        path_pairs = [(map_file_path, 
+        screenshot_save_path+'/'+spec['map_name']+'.png') 
+        for map_file_path, spec in zip(map_file_paths, specs)]
+        if screenshotter is not None:
+            screenshotter.capture_many(path_pairs)
+        else:
+            with MapScreenshotter(
+                browser_count = processes) as temporary_screenshotter:
+                temporary_screenshotter.capture_many(path_pairs)
+
+    return map_file_paths
+
+
+def load_census_panel(data_path, id_columns, variable_prefixes,
+    data_csv_encoding = None):
+    '''Reads a wide Census table (such as co-est2023-alldata.csv, which 
+    contains one column per year for each variable) and converts it into a
+    'long' panel with one row per shape per year.
+
+    Variables:
+
+    data_path: the path to the Census .csv file.
 
-    # Next, I'll add overlays that display the name of the shape and its
-    # value when the user hovers over it. 
+    id_columns: the columns that identify each shape (e.g. ['STATE',
+    'COUNTY', 'CTYNAME']). These will be repeated for each year.
 
-    # The following code came from Amodiovalerio Verde's excellent interactive
-    # choropleth tutorial at
-    # https://vverde.github.io/blob/interactivechoropleth.html .
-    # Amodiovalerio informed me via email that there are "no specific
-    # licences for the code of interactivechoropleth. 
-    # You're free to use the code. A mention/link will be appreciated."
-    # Thank you, Amodiovalerio!
+    variable_prefixes: the names of the variables to include, minus their
+    years. For instance, passing ['POPESTIMATE', 'NPOPCHG'] will 
+    retrieve the POPESTIMATE2020, POPESTIMATE2021, etc. and NPOPCHG2020,
+    NPOPCHG2021, etc. columns.
 
+    data_csv_encoding: the encoding to use when reading the .csv file. 
+    (co-est2023-alldata.csv requires 'latin-1'.)
 
-    style_function = lambda x: {'fillColor': '#ffffff', 
-                                'color':'#000000', 
-                                'fillOpacity': 0.1, 
-                                'weight': 0.1}
+    The output will contain the id_columns, a 'Year' column (stored as a 
+    16-bit integer), and one column per variable prefix. Only the needed
+    columns are read from the .csv file, and each variable's values are 
+    reshaped via NumPy rather than by copying the table once per year.'''
+    
+    year_column_pattern = re.compile(
+        '^(' + '|'.join(re.escape(prefix) for prefix in variable_prefixes)
+        + r')(\d{4})$')
+    header = pd.read_csv(data_path, nrows = 0, 
+    encoding = data_csv_encoding).columns
+    year_columns = [column for column in header 
+    if year_column_pattern.match(column)]
+    census_data = pd.read_csv(data_path, encoding = data_csv_encoding,
+    usecols = list(id_columns) + year_columns)
+
+    years = sorted({int(year_column_pattern.match(column).group(2)) 
+    for column in year_columns})
+    row_count = len(census_data)
+    panel = pd.DataFrame({column:np.tile(census_data[column].to_numpy(), 
+    len(years)) for column in id_columns})
+    panel['Year'] = np.repeat(np.array(years, dtype = 'int16'), row_count)
+    for prefix in variable_prefixes:
+        # reindex() adds empty columns for any years in which this variable
+        # is missing. Ravelling the values in column-major ('F') order 
+        # places all of the first year's rows first, followed by all of
+        # the second year's rows, and so on (matching the Year column).
+        prefix_table = census_data.reindex(columns = [
+            prefix + str(year) for year in years])
+        prefix_values = prefix_table.to_numpy().ravel(order = 'F')
+        if prefix_table.notna().all().all():
+            # Storing complete integer columns (such as population counts)
+            # in the smallest integer type that can hold them:
+            panel[prefix] = pd.to_numeric(prefix_values, downcast = 'integer')
+        else:
+            panel[prefix] = prefix_values.astype(float)
+    return panel
+
+
+class _TimeSliderControl(MacroElement):
+    '''Adds a year slider to a map created by render_time_slider_map. When
+    the slider moves, the JavaScript below restyles each shape using a 
+    compact table of color indices (one row per year) and updates the 
+    value shown in each shape's tooltip.'''
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var layer = {{ this.geojson.get_name() }};
+            var years = {{ this.years|tojson }};
+            var values = {{ this.values|tojson }};
+            var colorIndices = {{ this.color_indices|tojson }};
+            var colors = {{ this.colors|tojson }};
+            var valueProperty = {{ this.value_property|tojson }};
+            var currentYear = years.length - 1;
+
+            function styleFeature(feature) {
+                var colorIndex = colorIndices[currentYear][
+                    feature.properties.feature_index];
+                return {fillColor: colorIndex < 0 ? '#000000' : 
+                    colors[colorIndex], fillOpacity: colorIndex < 0 ? 0 : 0.75,
+                    color: '#000000', opacity: 0.2, weight: 1};
+            }
+            // resetStyle() (which runs after a shape is highlighted) also
+            // uses this function, so highlighted shapes will return to 
+            // the current year's colors.
+            layer.options.style = styleFeature;
+
+            var control = L.control({position: 'bottomleft'});
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '6px 10px';
+                div.innerHTML = '<b>' + {{ this.caption|tojson }} + 
+                ': <span></span></b><br><input type="range" min="0" max="' + 
+                (years.length - 1) + '" value="' + currentYear + '">';
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+                var label = div.querySelector('span');
+                var slider = div.querySelector('input');
+                function showYear(yearIndex) {
+                    currentYear = yearIndex;
+                    label.innerHTML = years[yearIndex];
+                    layer.eachLayer(function(featureLayer) {
+                        var properties = featureLayer.feature.properties;
+                        properties[valueProperty] = values[yearIndex][
+                            properties.feature_index];
+                    });
+                    layer.setStyle(styleFeature);
+                }
+                slider.addEventListener('input', function() {
+                    showYear(parseInt(slider.value));
+                });
+                showYear(currentYear);
+                return div;
+            };
+            control.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, geojson, years, values, color_indices, colors, 
+    value_property, caption):
+        super().__init__()
+        self._name = 'TimeSliderControl'
+        self.geojson = geojson
+        self.years = years
+        self.values = values
+        self.color_indices = color_indices
+        self.colors = colors
+        self.value_property = value_property
+        self.caption = caption
+
+
+def render_time_slider_map(merged_data_table, shape_feature_name, 
+    year_columns, feature_text, map_name, html_save_path, 
+    data_variable_text = 'Value', popup_variable_text = 'Value',
+    variable_decimals = 4, fill_color = 'Blues', bin_type = 'percentiles',
+    tiles = 'OpenStreetMap', multiply_data_by = 1, zoom_start = 7,
+    coordinate_decimals = 4, slider_caption = 'Year'):
+    '''Creates a single interactive choropleth map that contains a slider
+    for switching between years. The map's geometry is stored only once; 
+    each year's values and colors are stored in compact tables that
+    the map's JavaScript code uses to restyle the shapes when the slider 
+    moves. This produces a much smaller file than creating one render_map
+    .html file per year.
+
+    year_columns: a dictionary whose keys are the years (or other labels) 
+    to show on the slider and whose values are the columns that contain
+    the data for those years. For example:
+    year_columns = {year:'POPESTIMATE'+str(year) for year in range(2020, 2024)}
+
+    The bins are calculated using the values for all years, which allows 
+    colors to be compared across years.
+
+    slider_caption: the text to display next to the current year.
+
+    See render_map's documentation for the remaining arguments.'''
+
+    years = list(year_columns.keys())
+    value_matrix = np.round(np.column_stack([merged_data_table[
+        year_columns[year]].to_numpy(dtype = float) 
+        for year in years]) * multiply_data_by, variable_decimals)
+    # Rows without data for any year are excluded from the map.
+    has_data = ~np.isnan(value_matrix).all(axis = 1)
+    value_matrix = value_matrix[has_data]
+    print("Length of table is",len(value_matrix))
+
+    bins = calculate_bins(value_matrix.reshape(-1, 1), [bin_type])[0]
+    color_range = color_brewer(fill_color, n = len(bins) - 1)
+    color_indices = np.where(np.isnan(value_matrix), -1, 
+    _bin_indices(value_matrix, bins, len(color_range)))
+
+    # The current year's value is stored within a 'slider_value' property.
+    # (Naming this property after data_variable_text, which is display
+    # text, could overwrite shape_feature_name if the two matched.)
+    compact_table = geopandas.GeoDataFrame({
+        shape_feature_name:merged_data_table[shape_feature_name].to_numpy()[
+            has_data],
+        'feature_index':np.arange(len(value_matrix)),
+        'slider_value':value_matrix[:, -1],
+        'geometry':_quantize_geometry(merged_data_table['geometry'], 
+        coordinate_decimals).values[has_data]}, crs = merged_data_table.crs)
+
+    m = folium.Map(location=[38.7, -95], zoom_start=zoom_start, tiles=tiles)
     highlight_function = lambda x: {'fillColor': '#000000', 
                                     'color':'#000000', 
                                     'fillOpacity': 0.50, 
                                     'weight': 0.1}
-    data_popup = folium.features.GeoJson(
-        merged_data_table_copy,
-        style_function=style_function, 
-        control=False,
+    choropleth_layer = folium.features.GeoJson(
+        compact_table,
+        name = 'choropleth',
+        # The initial style gets replaced by _TimeSliderControl's
+        # styleFeature() function once the map loads.
+        style_function=lambda x: {'fillOpacity': 0, 'weight': 1}, 
         highlight_function=highlight_function, 
         tooltip=folium.features.GeoJsonTooltip(
-            fields=[shape_feature_name, data_variable]
-            + additional_tooltip_cols,
-            aliases=[feature_text, popup_variable_text] +
-            additional_popup_variable_strings,
+            fields=[shape_feature_name, 'slider_value'],
+            aliases=[feature_text, popup_variable_text],
             style=("background-color: white; color: #333333; font-family: \
             arial; font-size: 12px; padding: 10px;") 
         )
     )
-    m.add_child(data_popup)
-    m.keep_in_front(data_popup)
-
-    # Note: A simpler means of adding a tooltip to the map would look something like the following. [I haven't tested out this code within this function, however.]
+    m.add_child(choropleth_layer)
+    StepColormap(color_range, index = list(bins), vmin = bins[0], 
+    vmax = bins[-1], caption = data_variable_text).add_to(m)
+    # The per-year tables are stored with one row per year so that the
+    # JavaScript code can switch years by selecting a single row.
+    m.add_child(_TimeSliderControl(choropleth_layer, years, 
+        [[None if np.isnan(value) else value for value in year_values] 
+        for year_values in value_matrix.T.tolist()],
+        color_indices.T.tolist(), color_range, 'slider_value',
+        slider_caption))
+    folium.LayerControl().add_to(m)
 
-    #     tooltip = folium.features.GeoJsonTooltip(fields = [shape_feature_name, data_variable], aliases = [feature_text, popup_variable_text)
-    # # Based on https://python-visualization.github.io/folium/modules.html#folium.features.GeoJsonTooltip
+    map_file_path = html_save_path+'/'+map_name+'.html'
+    m.save(map_file_path)
+    return m
+
+
+# Half of the width of the Web Mercator (EPSG:3857) world in meters. 
+# This value is used to convert between Web Mercator coordinates and
+# tile numbers. See https://wiki.openstreetmap.org/wiki/Slippy_map_tilenames
+WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+
+
+def _tile_ranges(bounds, zoom):
+    '''Returns the range of tile columns (x) and rows (y) overlapped by
+    each set of Web Mercator bounds (minx, miny, maxx, maxy) at the given
+    zoom level. Rows are numbered from the top of the map, as in Leaflet.'''
+    tile_count = 2 ** zoom
+    tile_width = 2 * WEB_MERCATOR_HALF_WIDTH / tile_count
+    def to_tile(values):
+        return np.clip(np.floor(values / tile_width).astype(int), 
+        0, tile_count - 1)
+    x_min = to_tile(bounds[:, 0] + WEB_MERCATOR_HALF_WIDTH)
+    x_max = to_tile(bounds[:, 2] + WEB_MERCATOR_HALF_WIDTH)
+    y_min = to_tile(WEB_MERCATOR_HALF_WIDTH - bounds[:, 3])
+    y_max = to_tile(WEB_MERCATOR_HALF_WIDTH - bounds[:, 1])
+    return x_min, x_max, y_min, y_max
+
+
+def _generate_vector_tiles(geometries, properties_list, layer_name,
+    min_zoom, max_zoom, buffer_pixels):
+    '''Yields a (zoom, x, y, tile_data) tuple for each non-empty vector
+    tile between min_zoom and max_zoom. (This allows export_vector_tiles()
+    to write the tiles to either a folder or an .mbtiles file.)'''
+    import mapbox_vector_tile
+    for zoom in range(min_zoom, max_zoom + 1):
+        tile_width = 2 * WEB_MERCATOR_HALF_WIDTH / 2 ** zoom
+        pixel_width = tile_width / 256
+        # Simplifying the shapes to the resolution of this zoom level 
+        # (i.e. about one pixel) greatly reduces the size of low-zoom tiles.
+        # Shapes that become empty at this resolution are skipped.
+        zoom_geometries = shapely.simplify(geometries, pixel_width, 
+        preserve_topology = True)
+        zoom_bounds = shapely.bounds(zoom_geometries)
+        x_min, x_max, y_min, y_max = _tile_ranges(zoom_bounds, zoom)
+
+        # Determining which shapes overlap each tile:
+        tile_features = {}
+        for feature_index in np.flatnonzero(
+            ~shapely.is_empty(zoom_geometries)):
+            for x in range(x_min[feature_index], x_max[feature_index] + 1):
+                for y in range(y_min[feature_index], y_max[feature_index] + 1):
+                    tile_features.setdefault((x, y), []).append(feature_index)
+
+        print(f"Creating {len(tile_features)} tiles for zoom level {zoom}:")
+        buffer = pixel_width * buffer_pixels
+        for (x, y), feature_indices in tile_features.items():
+            tile_bounds = (-WEB_MERCATOR_HALF_WIDTH + x * tile_width,
+            WEB_MERCATOR_HALF_WIDTH - (y + 1) * tile_width,
+            -WEB_MERCATOR_HALF_WIDTH + (x + 1) * tile_width,
+            WEB_MERCATOR_HALF_WIDTH - y * tile_width)
+            clipped_geometries = shapely.clip_by_rect(
+                zoom_geometries[feature_indices], tile_bounds[0] - buffer,
+                tile_bounds[1] - buffer, tile_bounds[2] + buffer, 
+                tile_bounds[3] + buffer)
+            features = [{'geometry':clipped_geometry, 
+            'properties':properties_list[feature_index]} 
+            for clipped_geometry, feature_index in zip(
+                clipped_geometries, feature_indices) 
+                if not clipped_geometry.is_empty]
+            if len(features) == 0:
+                continue
+            tile_data = mapbox_vector_tile.encode(
+                [{'name':layer_name, 'features':features}],
+                default_options = {'quantize_bounds':tile_bounds,
+                'extents':4096})
+            yield zoom, x, y, tile_data
+
+
+def export_vector_tiles(merged_data_table, shape_feature_name, data_variable,
+    output_path, min_zoom = 0, max_zoom = 10, output_format = 'directory',
+    variable_decimals = 4, fill_color = 'Blues', bin_type = 'percentiles',
+    multiply_data_by = 1, additional_property_cols = [], 
+    layer_name = 'shapes', buffer_pixels = 8):
+    '''Converts a merged data table into a pyramid of Mapbox Vector Tiles.
+    Maps with many shapes (such as national zip code maps) can crash a 
+    browser when all of their shapes are stored within a single .html file.
+    Vector tiles, in contrast, allow the browser to load only the shapes
+    that are visible, and only at the level of detail needed for the current
+    zoom level. The tiles can be viewed using render_vector_tile_map().
+    
+    This function requires the mapbox_vector_tile library 
+    (pip install mapbox-vector-tile).
 
-    # folium.features.GeoJson(data = merged_data_table_copy, tooltip=tooltip, style_function = lambda x:{'opacity':0, 'fillOpacity':0}).add_to(m)
+    Variables:
 
-    # # Style function parameters come from https://leafletjs.com/SlavaUkraini/reference.html#path ; the format of style_function is based on one of the examples on https://python-visualization.github.io/folium/modules.html#folium.features.GeoJsonTooltip
+    output_path: the folder (if output_format is 'directory') or .mbtiles
+    file (if output_format is 'mbtiles') in which the tiles will be stored.
+    The 'directory' option saves each tile as output_path/{z}/{x}/{y}.pbf, 
+    which can be viewed in a browser once the folder is hosted by a web 
+    server (e.g. by running python -m http.server within the folder that 
+    contains your map). The 'mbtiles' option stores all tiles within a 
+    single SQLite database that follows the MBTiles specification
+    (https://github.com/mapbox/mbtiles-spec). Web servers can't serve 
+    these tiles directly, so use serve_vector_tiles() (or another MBTiles
+    tile server) to view them.
+
+    min_zoom and max_zoom: the range of zoom levels for which to create tiles.
+    Each zoom level has four times as many tiles as the previous one, so
+    high max_zoom values can take a while to process. Leaflet can still 
+    display the max_zoom tiles at higher zoom levels.
+
+    additional_property_cols: a list of additional columns to store within
+    each tile (e.g. for display within tooltips).
+
+    layer_name: the name of the tile layer that will store the shapes.
+
+    buffer_pixels: the number of pixels by which each tile's shapes will
+    extend past its edges. This prevents thin gaps from appearing at the
+    edges of tiles.
+
+    See render_map's documentation for the remaining arguments.
+
+    Returns a dictionary with information about the tiles (including their
+    bins and colors) that can be passed to render_vector_tile_map().'''
+
+    import mapbox_vector_tile # Imported here since it's only needed
+    # for vector tiles
+    # See https://github.com/tilezen/mapbox-vector-tile
+
+    values = np.round(merged_data_table[data_variable].to_numpy(
+        dtype = float) * multiply_data_by, variable_decimals)
+    has_data = ~np.isnan(values)
+    values = values[has_data]
+    bins = calculate_bins(values.reshape(-1, 1), [bin_type])[0]
+    color_range, shape_colors = _assign_bin_colors(values, bins, fill_color)
+
+    # Web Mercator coordinates are used because they map directly onto
+    # the square tiles used by Leaflet.
+    geometries = merged_data_table['geometry'][has_data].to_crs(
+        epsg = 3857).values
+    property_table = merged_data_table[has_data]
+    properties_list = [{shape_feature_name:shape_name, data_variable:value,
+    'fill_color':shape_color} for shape_name, value, shape_color in zip(
+        property_table[shape_feature_name].tolist(), values.tolist(),
+        shape_colors.tolist())]
+    for column in additional_property_cols:
+        for properties, column_value in zip(properties_list, 
+        property_table[column].astype(object).where(
+            property_table[column].notna(), None).tolist()):
+            properties[column] = column_value
+
+    tile_info = {'layer_name':layer_name, 'shape_feature_name':
+    shape_feature_name, 'data_variable':data_variable, 
+    'bins':[float(edge) for edge in bins], 'colors':list(color_range), 
+    'min_zoom':min_zoom, 'max_zoom':max_zoom, 
+    'additional_property_cols':list(additional_property_cols),
+    'bounds':[float(bound) for bound in 
+    merged_data_table[has_data].to_crs(epsg = 4326).total_bounds]}
+    tiles = _generate_vector_tiles(geometries, properties_list, layer_name,
+    min_zoom, max_zoom, buffer_pixels)
+
+    tile_total = 0
+    if output_format == 'directory':
+        os.makedirs(output_path, exist_ok = True)
+        for zoom, x, y, tile_data in tiles:
+            tile_folder = os.path.join(output_path, str(zoom), str(x))
+            os.makedirs(tile_folder, exist_ok = True)
+            with open(os.path.join(
+                tile_folder, str(y)+'.pbf'), 'wb') as tile_file:
+                tile_file.write(tile_data)
+            tile_total += 1
+        with open(os.path.join(output_path, 'metadata.json'), 'w') as file:
+            json.dump(tile_info, file)
+    elif output_format == 'mbtiles':
+        # The tiles are written to a temporary file that replaces 
+        # output_path only once every tile has been saved, so an 
+        # interrupted export won't leave a partial .mbtiles file behind.
+        temp_path = output_path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            with contextlib.closing(sqlite3.connect(temp_path)) as tile_db:
+                tile_db.execute("Create table metadata (name text, value text)")
+                tile_db.execute("Create table tiles (zoom_level integer, \
+tile_column integer, tile_row integer, tile_data blob)")
+                for zoom, x, y, tile_data in tiles:
+                    # MBTiles files number their rows from the bottom of the
+                    # map and store gzipped tile data.
+                    tile_db.execute("Insert into tiles values (?, ?, ?, ?)",
+                    (zoom, x, 2 ** zoom - 1 - y, gzip.compress(tile_data)))
+                    tile_total += 1
+                tile_db.executemany("Insert into metadata values (?, ?)", [
+                    ('name', layer_name), ('format', 'pbf'), 
+                    ('minzoom', str(min_zoom)), ('maxzoom', str(max_zoom)),
+                    ('bounds', ','.join(str(bound) 
+                    for bound in tile_info['bounds'])),
+                    ('json', json.dumps({'vector_layers':[{'id':layer_name, 
+                    'fields':{key:'' for key in properties_list[0]}}]} 
+                    if len(properties_list) > 0 else {}))])
+                tile_db.execute("Create unique index tile_index on tiles \
+(zoom_level, tile_column, tile_row)")
+                tile_db.commit()
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        os.replace(temp_path, output_path)
+    else:
+        raise ValueError("Error: output_format should be either 'directory' \
+or 'mbtiles'.")
+
+    print(f"Created {tile_total} tiles.")
+    return tile_info
+
+
+class _VectorTileTooltip(MacroElement):
+    '''Displays a tooltip with a shape's properties when the user hovers 
+    over it within a vector tile layer.'''
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var tooltip = L.tooltip();
+            var fields = {{ this.fields|tojson }};
+            var aliases = {{ this.aliases|tojson }};
+            """ + ESCAPE_HTML_SCRIPT + """
+            {{ this.tile_layer.get_name() }}.on('mouseover', function(e) {
+                var rows = fields.map(function(field, i) {
+                    return '<b>' + escapeHtml(aliases[i]) + '</b>: ' + 
+                    escapeHtml(e.layer.properties[field]);
+                });
+                tooltip.setLatLng(e.latlng).setContent(rows.join('<br>'))
+                .openOn({{ this._parent.get_name() }});
+            });
+            {{ this.tile_layer.get_name() }}.on('mouseout', function(e) {
+                {{ this._parent.get_name() }}.closeTooltip(tooltip);
+            });
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, tile_layer, fields, aliases):
+        super().__init__()
+        self._name = 'VectorTileTooltip'
+        self.tile_layer = tile_layer
+        self.fields = fields
+        self.aliases = aliases
+
+
+def render_vector_tile_map(tile_info, tile_url, feature_text, map_name,
+    html_save_path, data_variable_text = 'Value', 
+    popup_variable_text = 'Value', additional_popup_variable_strings = [],
+    tiles = 'OpenStreetMap', zoom_start = 7):
+    '''Creates an interactive map that displays vector tiles created by
+    export_vector_tiles(). Only the tiles that are currently visible get
+    loaded, so this map will remain responsive even when it contains tens
+    of thousands of shapes.
+
+    tile_info: the dictionary returned by export_vector_tiles(). (If the 
+    tiles were saved to a folder, this dictionary can also be read from
+    the metadata.json file within that folder.)
+
+    tile_url: the URL template for the tiles, such as 
+    'zip_tiles/{z}/{x}/{y}.pbf'. Relative URLs are resolved relative to the
+    .html file. Note that browsers won't load tiles from your local file 
+    system directly, so you'll need to view the map through a web server.
+    serve_vector_tiles() can host both the map and its tiles (including
+    tiles stored within an .mbtiles file); for instance, after calling
+    serve_vector_tiles(html_save_path, {'zip_tiles':'zip_tiles.mbtiles'}),
+    you can visit http://localhost:8000/map_name.html . (For tiles saved
+    to a folder, running python -m http.server within html_save_path will
+    also work.)
+
+    See render_map's documentation for the remaining arguments.'''
+    
+    from folium.plugins import VectorGridProtobuf
+
+    m = folium.Map(location=[38.7, -95], zoom_start=zoom_start, tiles=tiles)
+    # The options are passed as a string so that they can contain a 
+    # JavaScript styling function (as shown in VectorGridProtobuf's
+    # documentation).
+    tile_options = """{
+        "interactive": true,
+        "maxNativeZoom": %d,
+        "minZoom": 0,
+        "vectorTileLayerStyles": {
+            %s: function(properties, zoom) {
+                return {"fill": true, "fillColor": properties.fill_color,
+                "fillOpacity": 0.75, "color": "#000000", "opacity": 0.2,
+                "weight": 1};
+            }
+        }
+    }""" % (tile_info['max_zoom'], json.dumps(tile_info['layer_name']))
+    tile_layer = VectorGridProtobuf(tile_url, 'choropleth', tile_options)
+    tile_layer.add_to(m)
+    m.add_child(_VectorTileTooltip(tile_layer, 
+    [tile_info['shape_feature_name'], tile_info['data_variable']] 
+    + tile_info['additional_property_cols'], 
+    [feature_text, popup_variable_text] + additional_popup_variable_strings))
+    StepColormap(tile_info['colors'], index = tile_info['bins'], 
+    vmin = tile_info['bins'][0], vmax = tile_info['bins'][-1], 
+    caption = data_variable_text).add_to(m)
+    folium.LayerControl().add_to(m)
 
     map_file_path = html_save_path+'/'+map_name+'.html'
     m.save(map_file_path)
+    return m
+
+
+def serve_vector_tiles(html_folder, mbtiles_paths = None, port = 8000):
+    '''Starts a local web server that displays maps created by
+    render_vector_tile_map(). Files within html_folder (such as the map's
+    .html file and any tile folders created by export_vector_tiles()) are
+    served as-is, and tiles stored within .mbtiles files are read from
+    those files as they're requested. The server runs until it is
+    interrupted (e.g. by pressing Ctrl+C).
+
+    mbtiles_paths: a dictionary whose keys are URL prefixes and whose
+    values are paths to .mbtiles files. For example, if this argument is
+    {'zip_tiles':'zip_tiles.mbtiles'}, requests for
+    zip_tiles/{z}/{x}/{y}.pbf will be answered using zip_tiles.mbtiles.
+    (This allows the same tile_url to be passed to render_vector_tile_map()
+    regardless of whether the tiles were saved to a folder or to an
+    .mbtiles file.) If this argument is None, all tiles will be read
+    from html_folder.
+
+    port: the port at which the server will listen. The map can then be
+    viewed at http://localhost:{port}/{map_name}.html .'''
+    import functools
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    mbtiles_paths = {prefix.strip('/'):os.path.abspath(path)
+    for prefix, path in (mbtiles_paths or {}).items()}
+
+    class VectorTileRequestHandler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            path_parts = self.path.split('?')[0].strip('/').split('/')
+            if (len(path_parts) == 4 and path_parts[0] in mbtiles_paths
+            and path_parts[3].endswith('.pbf')):
+                return self._send_mbtiles_tile(path_parts)
+            return super().do_GET()
+
+        def _send_mbtiles_tile(self, path_parts):
+            try:
+                zoom, x, y = (int(path_parts[1]), int(path_parts[2]),
+                int(path_parts[3][:-4]))
+            except ValueError:
+                return self.send_error(400)
+            # Each request uses its own connection, since SQLite
+            # connections can't be shared between the server's threads.
+            with contextlib.closing(sqlite3.connect(
+                mbtiles_paths[path_parts[0]])) as tile_db:
+                row = tile_db.execute("Select tile_data from tiles where \
+zoom_level = ? and tile_column = ? and tile_row = ?",
+                (zoom, x, 2 ** zoom - 1 - y)).fetchone()
+            if row is None: # (No tile is stored for areas without shapes.)
+                return self.send_error(404)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-protobuf')
+            self.send_header('Content-Encoding', 'gzip') # export_vector_tiles()
+            # stores gzipped tiles, so they can be sent without being
+            # decompressed.
+            self.send_header('Content-Length', str(len(row[0])))
+            self.end_headers()
+            self.wfile.write(row[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), functools.partial(
+        VectorTileRequestHandler, directory = html_folder))
+    print(f"Serving {html_folder} at http://localhost:{port}/ \
+(press Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def save_map_table(merged_data_table, output_path):
+    '''Saves a merged data table (such as one created by prepare_county_table)
+    in a binary format that can be reloaded far more quickly than a .csv
+    file. (When a GeoDataFrame is saved as a .csv file, its geometry is
+    stored as Well-Known Text (WKT) strings, which take a long time to 
+    parse.)
+
+    output_path: the path to the output file. If this path ends in 
+    '.feather', the table will be saved as a Feather file; otherwise, it 
+    will be saved as a GeoParquet file. GeoParquet files also store a
+    bounding box for each row, which allows read_map_table() to skip rows 
+    outside of a given area without loading them.'''
+    if output_path.endswith('.feather'):
+        merged_data_table.to_feather(output_path)
+    else:
+        merged_data_table.to_parquet(output_path, write_covering_bbox = True)
+        # See https://geopandas.org/en/stable/docs/reference/api/geopandas.GeoDataFrame.to_parquet.html
+    return output_path
 
 
-    # Finally, the function uses the Selenium library to create a screenshot 
-    # of the map so that it can be shared as a .png file.
-    # See https://www.selenium.dev/documentation/ for more information on 
-    # Selenium. Note that some setup work is required for the Selenium code
-    # to run correctly; if you don't have time right now to complete this 
-    # setup, you can skip the screenshot generation process.
+def read_map_table(input_path, columns = None, bbox = None, filters = None):
+    '''Reads a table saved by save_map_table() or convert_wkt_csv().
 
+    Variables:
 
-    if generate_image == True:
+    columns: an optional list of the columns to read. (The geometry column
+    will be included automatically.) Reading only the columns that you
+    need saves both time and memory.
 
-        # This section uses code from https://www.selenium.dev/documentation/webdriver/drivers/options/ 
-        options = Options() 
-        # The following two lines come from user 'undetected Selenium' at:
-        # # Based on https://stackoverflow.com/a/55016352/13097194
-        options.add_argument("--headless") # This ended up being necessary
-        # in order to set the width and height (as verified by get_window_size()
-        # below() equal to window_width and window_height. Without headless
-        # mode, the window ended up being significantly smaller.)
-        # options.add_argument(f"window-size={window_width},{window_height}")
-        seldriver = webdriver.Chrome(options=options)
+    bbox: an optional (minx, miny, maxx, maxy) tuple. If specified, only 
+    rows whose shapes intersect this bounding box will be returned. For 
+    instance, (-83.7, 36.5, -75.2, 39.5) will return rows within or near
+    Virginia.
 
+    filters: an optional list of row filters in pyarrow format, such as
+    [('STATE', '==', 51)] or [('NAME', 'in', ['Fairfax County, VA', 
+    'Arlington County, VA'])]. See 
+    https://arrow.apache.org/docs/python/generated/pyarrow.parquet.read_table.html
+    
+    With GeoParquet files, the bbox and filters arguments are applied while
+    the file is being read, so rows that don't match them never get loaded
+    into memory.'''
+    if columns is not None and 'geometry' not in columns:
+        columns = list(columns) + ['geometry']
+    if input_path.endswith('.feather'):
+        # Feather files don't support filtering during the read process,
+        # so these filters are applied afterward. Any filter columns that
+        # weren't requested are read as well, then dropped once the
+        # filters have been applied.
+        read_columns = columns
+        if columns is not None:
+            read_columns = list(dict.fromkeys(list(columns) + [
+                column for column, operator, value in (filters or [])]))
+        map_table = geopandas.read_feather(input_path, 
+        columns = read_columns)
+        if bbox is not None:
+            map_table = map_table.iloc[
+                map_table.sindex.query(shapely.box(*bbox))].sort_index()
+        for column, operator, value in (filters or []):
+            if operator == 'in':
+                map_table = map_table[map_table[column].isin(value)]
+            elif operator in ['==', '!=', '<', '<=', '>', '>=']:
+                map_table = map_table[map_table[column].to_frame().eval(
+                    '`' + column + '` ' + operator + ' @value')]
+            else:
+                raise ValueError(f"Error: filter operator {operator} is not \
+supported for Feather files.")
+        if columns is not None and len(read_columns) > len(columns):
+            map_table = map_table[columns]
+        return map_table
+    return geopandas.read_parquet(input_path, columns = columns, bbox = bbox,
+    filters = filters)
+
+
+def convert_wkt_csv(csv_path, output_path, geometry_column = 'geometry',
+    crs = 'EPSG:4269', csv_encoding = None):
+    '''Converts a .csv file whose geometry is stored as Well-Known Text
+    (such as data/2020-2023_net_domestic_migration_dataset.csv) into a 
+    GeoParquet or Feather file that can be read via read_map_table().
+
+    geometry_column: the name of the column that contains WKT geometry.
+
+    crs: the coordinate reference system of the geometry. The default
+    (EPSG:4269, or NAD83) is the system used by Census shapefiles. 
+
+    Returns the converted table.'''
+    print("Reading .csv file:")
+    csv_data = pd.read_csv(csv_path, encoding = csv_encoding)
+    print("Parsing geometry:")
+    # shapely.from_wkt() parses all of the WKT strings within a single
+    # vectorized call. 
+    map_table = geopandas.GeoDataFrame(csv_data.drop(
+        columns = geometry_column), geometry = shapely.from_wkt(
+        csv_data[geometry_column].to_numpy()), crs = crs)
+    print("Saving converted table:")
+    save_map_table(map_table, output_path)
+    return map_table
+
+
+def _point_coordinates(point_table, lat_column, lon_column):
+    '''Returns the longitude and latitude of each row within point_table
+    as two NumPy arrays, along with a Boolean array showing which rows
+    have valid coordinates. If point_table doesn't contain lat_column and 
+    lon_column but is a GeoDataFrame, the coordinates will be taken from 
+    its geometry (after converting it to EPSG:4326) instead.'''
+    if (lat_column not in point_table.columns and 
+    isinstance(point_table, geopandas.GeoDataFrame)):
+        geometry = point_table.geometry
+        if geometry.crs is not None:
+            geometry = geometry.to_crs('EPSG:4326')
+        lons = shapely.get_x(geometry.values)
+        lats = shapely.get_y(geometry.values)
+    else:
+        lons = pd.to_numeric(point_table[lon_column], 
+        errors = 'coerce').to_numpy(dtype = float, na_value = np.nan)
+        lats = pd.to_numeric(point_table[lat_column], 
+        errors = 'coerce').to_numpy(dtype = float, na_value = np.nan)
+    return lons, lats, np.isfinite(lons) & np.isfinite(lats)
+
+
+def _point_map_bins(values, bin_type):
+    '''Calculates the bins used to color points or cells. Point counts
+    often contain many identical values, which can produce duplicate
+    percentile-based bin edges; these duplicates are removed, and 
+    equally spaced bins are used instead if fewer than 3 bins (the minimum
+    number of ColorBrewer colors) would remain.'''
+    values = np.asarray(values, dtype = float)
+    bins = np.unique(calculate_bins(values.reshape(-1, 1), [bin_type])[0])
+    if len(bins) < 4:
+        min_val = np.nanmin(values)
+        max_val = max(np.nanmax(values), min_val + 1)
+        bins = np.linspace(min_val, max_val, 9)
+    return bins
+
+
+def _tooltip_html(table, tooltip_cols, tooltip_aliases):
+    '''Creates the HTML tooltip text for each row of table within a single
+    set of vectorized string operations.'''
+    tooltip_text = pd.Series('', index = table.index, dtype = object)
+    for i, (column, alias) in enumerate(zip(tooltip_cols, tooltip_aliases)):
+        values = table[column].astype(str).str.replace(
+            '&', '&amp;').str.replace('<', '&lt;').str.replace('>', '&gt;')
+        tooltip_text = tooltip_text + ('<br>' if i > 0 else '') + \
+        '<b>' + alias + '</b>: ' + values
+    return tooltip_text
+
+
+def _point_cells(x, y, cell_shape, cell_size):
+    '''Assigns Web Mercator (EPSG:3857) points to square or hexagonal
+    cells whose width equals cell_size meters. Returns the column and row
+    of each point's cell.
+
+    The hexagon calculations use 'pointy-top' axial coordinates; see
+    https://www.redblobgames.com/grids/hexagons/ for a detailed 
+    explanation of this approach.'''
+    if cell_shape == 'square':
+        return (np.floor(x / cell_size).astype(np.int64), 
+        np.floor(y / cell_size).astype(np.int64))
+    if cell_shape != 'hexagon':
+        raise ValueError("Error: cell_shape should be either 'hexagon' or \
+'square'.")
+    radius = cell_size / np.sqrt(3)
+    q = (np.sqrt(3) / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    s = -q - r
+    # Rounding these fractional coordinates to the nearest hexagon
+    # (while keeping q + r + s equal to 0):
+    q_round, r_round, s_round = np.round(q), np.round(r), np.round(s)
+    q_diff, r_diff, s_diff = (np.abs(q_round - q), np.abs(r_round - r), 
+    np.abs(s_round - s))
+    fix_q = (q_diff > r_diff) & (q_diff > s_diff)
+    fix_r = ~fix_q & (r_diff > s_diff)
+    q_round = np.where(fix_q, -r_round - s_round, q_round)
+    r_round = np.where(fix_r, -q_round - s_round, r_round)
+    return q_round.astype(np.int64), r_round.astype(np.int64)
+
+
+def _cell_polygons(columns, rows, cell_shape, cell_size):
+    '''Creates the Web Mercator polygons for the cells returned by 
+    _point_cells(). All polygons are created within a single vectorized
+    shapely call.'''
+    if cell_shape == 'square':
+        return shapely.box(columns * cell_size, rows * cell_size,
+        (columns + 1) * cell_size, (rows + 1) * cell_size)
+    radius = cell_size / np.sqrt(3)
+    center_x = radius * np.sqrt(3) * (columns + rows / 2)
+    center_y = radius * 1.5 * rows
+    angles = np.radians(60 * np.arange(7) - 30) # The 7th vertex closes 
+    # each ring.
+    vertices = np.stack([
+        center_x[:, None] + radius * np.cos(angles)[None, :],
+        center_y[:, None] + radius * np.sin(angles)[None, :]], axis = -1)
+    return shapely.polygons(vertices)
+
+
+def bin_points(point_table, lat_column = 'Lat', lon_column = 'Lon',
+    cell_shape = 'hexagon', cell_size = 5000, value_column = None,
+    aggfunc = 'mean'):
+    '''Groups points into hexagonal or square cells and returns a 
+    GeoDataFrame (in EPSG:4326) with one row per non-empty cell. This
+    allows hundreds of thousands of points to be displayed as a few
+    hundred shapes.
+
+    cell_shape: 'hexagon' or 'square'.
+
+    cell_size: the width of each cell in Web Mercator meters. (Web Mercator 
+    distances grow larger than actual distances as you move away from the
+    equator; within the continental US, a cell_size of 5000 corresponds
+    to cells that are roughly 3.5 to 4.5 kilometers wide.)
+
+    value_column: an optional numeric column to aggregate within each cell
+    using aggfunc (e.g. 'mean', 'median', or 'sum').
+
+    The output includes a 'Points' column with the number of points in
+    each cell, along with a value_column column (if one was specified).'''
+    lons, lats, valid = _point_coordinates(point_table, lat_column, 
+    lon_column)
+    projected_points = geopandas.GeoSeries(geopandas.points_from_xy(
+        lons[valid], lats[valid]), crs = 'EPSG:4326').to_crs('EPSG:3857')
+    cell_columns, cell_rows = _point_cells(
+        shapely.get_x(projected_points.values), 
+        shapely.get_y(projected_points.values), cell_shape, cell_size)
+    cell_data = pd.DataFrame({'Cell_Column':cell_columns, 
+    'Cell_Row':cell_rows})
+    if value_column is not None:
+        cell_data[value_column] = pd.to_numeric(
+            point_table[value_column], errors = 'coerce').to_numpy()[valid]
+    grouped_cells = cell_data.groupby(['Cell_Column', 'Cell_Row'], 
+    sort = False)
+    cell_table = grouped_cells.size().rename('Points').reset_index()
+    if value_column is not None:
+        cell_table[value_column] = grouped_cells[value_column].agg(
+            aggfunc).to_numpy()
+    return geopandas.GeoDataFrame(cell_table, geometry = _cell_polygons(
+        cell_table['Cell_Column'].to_numpy(), 
+        cell_table['Cell_Row'].to_numpy(), cell_shape, cell_size),
+        crs = 'EPSG:3857').to_crs('EPSG:4326')
+
+
+def render_point_map(point_table, map_name, html_save_path,
+    lat_column = 'Lat', lon_column = 'Lon', mode = 'markers',
+    tooltip_cols = [], tooltip_aliases = [], color_variable = None,
+    color_variable_text = 'Value', fill_color = 'Blues', 
+    marker_color = '#3186cc', bin_type = 'percentiles', radius = 5,
+    cell_shape = 'hexagon', cell_size = 5000, aggfunc = 'mean',
+    tiles = 'OpenStreetMap', zoom_start = 7, location = None,
+    coordinate_decimals = 5, generate_image = False, 
+    screenshot_save_path = '', screenshotter = None, 
+    delete_html_file = False):
+    '''Creates an interactive map of individual locations (such as 
+    students' or schools' addresses). This function serves as a companion
+    to render_map, which maps shapes rather than points.
+
+    Adding one folium.CircleMarker to a map for each row works fine for a 
+    few dozen points, but it becomes very slow for tens of thousands of 
+    points, and the resulting .html file can freeze the browser. This 
+    function instead creates all of its markers in a single step.
 
-        # See https://www.selenium.dev/documentation/webdriver/getting_started/open_browser/
-        # For more information on using Selenium to get screenshots of .html 
-        # files, see my get_screenshots.ipynb file within my route_maps_builder
-        # program, available here:
-        # https://github.com/kburchfiel/route_maps_builder/blob/master/get_screenshots.ipynb
-        window_width = 5500 # This produces a large window that can better
-        # capture small details (such as zip code shapefiles).
-        seldriver.set_window_size(window_width,window_width*(9/16)) # Creates
-        # a window with an HD/4K/8K aspect ratio
+    Explanations of variables:
 
-        seldriver.get(html_save_path+'/'+map_name+'.html') 
-        # See https://www.selenium.dev/documentation/webdriver/browser/navigation/
-        time.sleep(2) # This gives the page sufficient
-        # time to load the map tiles before the screenshot is taken. 
-        # You can also experiment with longer sleep times.
+    point_table: A DataFrame with one row per location. It should contain
+    lat_column and lon_column columns; alternatively, it can be a 
+    GeoDataFrame with point geometry.
+
+    map_name and html_save_path: The name of the map and the folder in
+    which its .html file will be saved (as in render_map).
+
+    lat_column and lon_column: The names of the columns that store each
+    point's latitude and longitude. 
+
+    mode: The way in which points will be displayed. 
+    'markers' (the default) adds every point to a single GeoJSON layer
+    that gets drawn on a canvas rather than as separate SVG elements. 
+    'cluster' groups nearby points into clusters within the browser
+    (using the Leaflet.markercluster plugin); these clusters split apart
+    as the user zooms in. 
+    'bins' groups points into hexagonal or square cells within Python (via
+    bin_points()), then displays these cells as a choropleth map. This 
+    option is the best fit for very large numbers of points, as the
+    size of the map won't depend on the number of points; it also
+    prevents individual addresses from being shown.
+
+    tooltip_cols and tooltip_aliases: The columns to display within each
+    point's tooltip, along with the labels to show for them. (These 
+    aren't used when mode is 'bins'; instead, each cell's tooltip will show
+    its point count and, if applicable, its color_variable value.) If
+    tooltip_aliases is empty, the column names will be used as labels;
+    otherwise, it should contain one label per column.
+
+    color_variable: An optional numeric column that will determine each 
+    point's (or, when mode is 'bins', each cell's) color. If this isn't
+    specified, points will be shown in marker_color, and cells will be 
+    colored by their point counts.
+
+    color_variable_text: The legend and tooltip text for color_variable.
+
+    fill_color and bin_type: The ColorBrewer palette and bin type used
+    for color_variable (see render_map's documentation).
+
+    radius: The radius of each marker in pixels.
+
+    cell_shape, cell_size, and aggfunc: The settings used when mode is
+    'bins'. See bin_points() for more information. aggfunc determines how 
+    color_variable values will be combined within each cell.
+
+    location: The [latitude, longitude] on which the map will initially be 
+    centered. If this isn't specified, the center of the points' bounding 
+    box will be used.
+
+    coordinate_decimals: The number of decimal places to which coordinates
+    will be rounded. (5 decimals correspond to around 1 meter.)
+
+    generate_image, screenshot_save_path, screenshotter, and
+    delete_html_file: These work the same way as in render_map, except that
+    generate_image defaults to False and only Selenium-based screenshots 
+    are supported.
+
+    Example (based on database_generator.ipynb):
+    render_point_map(df_va_addresses, 'va_addresses', html_save_path,
+    tooltip_cols = ['Address'], tooltip_aliases = ['Address'])
+    '''
+    if mode not in ['markers', 'cluster', 'bins']:
+        raise ValueError("Error: mode should be 'markers', 'cluster', or \
+'bins'.")
+    if len(tooltip_aliases) == 0:
+        tooltip_aliases = list(tooltip_cols)
+    elif len(tooltip_aliases) != len(tooltip_cols):
+        raise ValueError("Error: tooltip_aliases should contain one label \
+for each column within tooltip_cols.")
+    lons, lats, valid = _point_coordinates(point_table, lat_column, 
+    lon_column)
+    point_data = pd.DataFrame(point_table).loc[valid, list(dict.fromkeys(
+        tooltip_cols + ([color_variable] if color_variable else [])))]
+    lons = np.round(lons[valid], coordinate_decimals)
+    lats = np.round(lats[valid], coordinate_decimals)
+    print("Number of points to map:", len(point_data))
+    if len(point_data) == 0:
+        raise ValueError("Error: point_table doesn't contain any rows with \
+valid coordinates.")
+
+    if location is None:
+        location = [(lats.min() + lats.max()) / 2, 
+        (lons.min() + lons.max()) / 2]
+    m = folium.Map(location = location, zoom_start = zoom_start, 
+    tiles = tiles, prefer_canvas = True)
+    # prefer_canvas causes Leaflet to draw all markers on a single <canvas>
+    # element, which is much faster than creating one SVG element per marker.
+    # See https://leafletjs.com/reference.html#map-prefercanvas
+
+    if mode == 'bins':
+        cell_table = bin_points(pd.DataFrame({'Lat':lats, 'Lon':lons,
+        **({color_variable:point_data[color_variable].to_numpy()} 
+        if color_variable else {})}), cell_shape = cell_shape, 
+        cell_size = cell_size, value_column = color_variable,
+        aggfunc = aggfunc)
+        data_variable = color_variable or 'Points'
+        cell_table = cell_table.dropna(subset = [data_variable])
+        bins = _point_map_bins(cell_table[data_variable], bin_type)
+        tooltip_fields = ['Points'] + ([color_variable] 
+        if color_variable else [])
+        tooltip_labels = ['Points'] + ([color_variable_text] 
+        if color_variable else [])
+        _add_compact_choropleth_layer(m, cell_table, 'Points', data_variable,
+        bins, fill_color, color_variable_text if color_variable 
+        else 'Points', tooltip_fields, tooltip_labels, 
+        coordinate_decimals = coordinate_decimals)
 
-        screenshot_image = seldriver.get_screenshot_as_file(
-            screenshot_save_path+'/'+map_name+'.png') 
-        # Based on:
-        # https://www.selenium.dev/selenium/docs/api/java/org/openqa/selenium/TakesScreenshot.html
+    else:
+        if color_variable is not None:
+            color_values = pd.to_numeric(point_data[color_variable], 
+            errors = 'coerce')
+            bins = _point_map_bins(color_values.dropna(), bin_type)
+            color_range, point_colors = _assign_bin_colors(
+                color_values, bins, fill_color)
+            # Points without a color_variable value are shown in gray.
+            point_colors = np.where(color_values.isna(), '#999999', 
+            point_colors)
+            StepColormap(color_range, index = list(bins), vmin = bins[0], 
+            vmax = bins[-1], caption = color_variable_text).add_to(m)
+        else:
+            point_colors = np.full(len(point_data), marker_color)
+
+        if mode == 'markers':
+            # The GeoJSON features are built directly from the coordinate
+            # and property columns, which is much faster than converting a
+            # GeoDataFrame with many rows into GeoJSON.
+            property_table = point_data[tooltip_cols].astype(object).where(
+                point_data[tooltip_cols].notna(), None)
+            property_table['fill_color'] = point_colors
+            marker_data = {'type':'FeatureCollection', 'features':[
+                {'type':'Feature', 'properties':properties, 'geometry':
+                {'type':'Point', 'coordinates':[lon, lat]}} 
+                for lon, lat, properties in zip(lons.tolist(), lats.tolist(),
+                property_table.to_dict('records'))]}
+            folium.features.GeoJson(
+                marker_data,
+                name = 'points',
+                marker = folium.CircleMarker(radius = radius, fill = True),
+                style_function = lambda x: {
+                    'fillColor': x['properties']['fill_color'],
+                    'color': x['properties']['fill_color'],
+                    'fillOpacity': 0.75, 'weight': 1},
+                tooltip = folium.features.GeoJsonTooltip(
+                    fields = tooltip_cols,
+                    aliases = tooltip_aliases,
+                    style = ("background-color: white; color: #333333; \
+font-family: arial; font-size: 12px; padding: 10px;")
+                ) if len(tooltip_cols) > 0 else None
+            ).add_to(m)
+            # folium.GeoJson groups features that share the same style, so
+            # each color is stored only once within the .html file.
+
+        else:
+            from folium.plugins import FastMarkerCluster
+            # FastMarkerCluster creates its markers within the browser from
+            # a compact array of [lat, lon, tooltip, color] rows.
+            # See https://python-visualization.github.io/folium/latest/user_guide/plugins/marker_cluster.html
+            cluster_data = pd.DataFrame({'lat':lats, 'lon':lons,
+            'tooltip':_tooltip_html(point_data, tooltip_cols, 
+            tooltip_aliases).to_numpy(), 'color':point_colors})
+            callback = f"""var callback = function (row) {{
+                var marker = L.circleMarker(new L.LatLng(row[0], row[1]), 
+                {{radius: {radius}, color: row[3], fillColor: row[3], 
+                fillOpacity: 0.75, weight: 1}});
+                if (row[2]) {{marker.bindTooltip(row[2]);}}
+                return marker;
+            }};"""
+            FastMarkerCluster(cluster_data.values.tolist(), 
+            callback = callback, name = 'points').add_to(m)
 
-        seldriver.quit()
-        # Based on: https://www.selenium.dev/documentation/webdriver/browser/windows/
+    folium.LayerControl().add_to(m)
+
+    map_file_path = html_save_path+'/'+map_name+'.html'
+    m.save(map_file_path)
+
+    if generate_image == True:
+        screenshot_file_path = screenshot_save_path+'/'+map_name+'.png'
+        if screenshotter is not None:
+            screenshotter.capture(map_file_path, screenshot_file_path)
+        else:
+            with MapScreenshotter() as temporary_screenshotter:
+                temporary_screenshotter.capture(
+                    map_file_path, screenshot_file_path)
 
     if delete_html_file == True:
         os.remove(map_file_path)
 
-    return m
\ No newline at end of file
+    return m
+
+
+class PolygonIndex:
+    '''A reusable spatial index over the shapes within a merged data table
+    (such as one created by prepare_county_table or prepare_zip_table).
+    aggregate_points_to_polygons() uses this index to find the shape that
+    contains each point. 
+
+    Checking every point against every shape would require 
+    (points x shapes) comparisons. Instead, an STRtree first finds the
+    few shapes whose bounding boxes contain each point; only these
+    candidates are then checked using prepared (pre-processed) geometries.
+    Both steps are vectorized, so millions of points can be located within
+    a few seconds. See
+    https://shapely.readthedocs.io/en/stable/strtree.html
+
+    Building the index (and preparing its geometries) only needs to happen
+    once; the same index can then be passed to many
+    aggregate_points_to_polygons() calls.
+
+    Variables:
+
+    polygon_table: the GeoDataFrame whose shapes should be indexed.
+
+    shape_feature_name: the column containing each shape's unique ID.
+
+    Example:
+    county_index = PolygonIndex(merged_county_table, 'NAME')
+    county_counts = aggregate_points_to_polygons(df_curr_enrollment,
+    merged_county_table, 'NAME', polygon_index = county_index)
+    '''
+
+    def __init__(self, polygon_table, shape_feature_name):
+        self.shape_feature_name = shape_feature_name
+        self.shape_ids = polygon_table[shape_feature_name].to_numpy()
+        self.crs = polygon_table.crs
+        self.geometries = np.array(polygon_table.geometry.values, 
+        dtype = object)
+        self.tree = shapely.STRtree(self.geometries)
+        shapely.prepare(self.geometries)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def locate_points(self, lons, lats, chunk_size = 1000000):
+        '''Returns the position (within the indexed table) of the shape
+        that contains each point, or -1 for points that don't fall within
+        any shape. Points are processed chunk_size at a time in order to
+        limit memory usage.
+
+        Points located on the border between two shapes are assigned to
+        only one of them.'''
+        lons = np.asarray(lons, dtype = float)
+        lats = np.asarray(lats, dtype = float)
+        if self.crs is not None and not self.crs.is_geographic:
+            # (Geographic systems such as NAD83, which is used by Census
+            # shapefiles, differ from the latitude/longitude values
+            # stored within curr_enrollment by only a meter or so, so
+            # points only need to be converted for projected systems.)
+            projected_points = geopandas.GeoSeries(geopandas.points_from_xy(
+                lons, lats), crs = 'EPSG:4326').to_crs(self.crs)
+            lons = shapely.get_x(projected_points.values)
+            lats = shapely.get_y(projected_points.values)
+        positions = np.full(len(lons), -1, dtype = np.int64)
+        for start in range(0, len(lons), chunk_size):
+            chunk_lons = lons[start:start + chunk_size]
+            chunk_lats = lats[start:start + chunk_size]
+            valid_rows = np.flatnonzero(np.isfinite(chunk_lons) & 
+            np.isfinite(chunk_lats))
+            chunk_lons = chunk_lons[valid_rows]
+            chunk_lats = chunk_lats[valid_rows]
+            # Finding all shapes whose bounding boxes contain each point.
+            # (The results are sorted by point number.)
+            point_numbers, shape_numbers = self.tree.query(
+                shapely.points(chunk_lons, chunk_lats))
+            # Checking which of these candidate shapes actually contain
+            # each point:
+            matches = shapely.intersects_xy(self.geometries[shape_numbers],
+            chunk_lons[point_numbers], chunk_lats[point_numbers])
+            point_numbers = point_numbers[matches]
+            shape_numbers = shape_numbers[matches]
+            # Keeping only the first matching shape for each point:
+            first_match = np.r_[True, point_numbers[1:] != point_numbers[:-1]]
+            positions[start + valid_rows[point_numbers[first_match]]] = \
+            shape_numbers[first_match]
+        return positions
+
+
+def aggregate_points_to_polygons(point_table, polygon_table, 
+    shape_feature_name, lat_column = 'Lat', lon_column = 'Lon',
+    aggregations = {}, count_column = 'Points', polygon_index = None,
+    chunk_size = 1000000):
+    '''Determines which shape (e.g. county or zip code) contains each point
+    within point_table, then calculates the number of points (and, 
+    optionally, other aggregates) within each shape. This makes it 
+    possible to map students by county or zip code without 
+    preaggregating their data elsewhere.
+
+    Variables:
+
+    point_table: a DataFrame with one row per location (such as
+    curr_enrollment). It should contain lat_column and lon_column columns;
+    alternatively, it can be a GeoDataFrame with point geometry.
+
+    polygon_table: the merged data table (created via prepare_zip_table,
+    prepare_county_table, or prepare_state_table) to which the points 
+    will be assigned.
+
+    shape_feature_name: the column within polygon_table that contains
+    unique IDs for each shape.
+
+    aggregations: an optional dictionary of additional values to
+    calculate for each shape. Each key is the name of an output column,
+    and each value is a (point_table column, aggregation function) tuple,
+    as in pandas' named aggregation. For example, 
+    {'Average_Score':('Score', 'mean')}.
+
+    count_column: the name of the column that will store the number of
+    points within each shape.
+
+    polygon_index: an optional PolygonIndex for polygon_table. If none is
+    provided, a new index will be built. When aggregating several point
+    tables by the same shapes, build the index once and pass it to each 
+    call.
+
+    chunk_size: the number of points to locate at a time.
+
+    Returns a copy of polygon_table with count_column and aggregations 
+    columns added. (Shapes without any points will have a count of 0.) 
+    This table can be passed directly to render_map.'''
+    if polygon_index is None:
+        polygon_index = PolygonIndex(polygon_table, shape_feature_name)
+    elif (len(polygon_index) != len(polygon_table) or 
+    polygon_index.shape_feature_name != shape_feature_name):
+        raise ValueError("Error: polygon_index was not built from \
+polygon_table.")
+
+    lons, lats, valid = _point_coordinates(point_table, lat_column, 
+    lon_column)
+    positions = polygon_index.locate_points(lons, lats, 
+    chunk_size = chunk_size)
+    located = positions >= 0
+    print(f"{located.sum()} of {len(positions)} points were located \
+within a shape.")
+
+    aggregated_table = polygon_table.copy()
+    aggregated_table[count_column] = np.bincount(positions[located], 
+    minlength = len(polygon_index))
+    if len(aggregations) > 0:
+        point_values = pd.DataFrame(point_table)[list(dict.fromkeys(
+            column for column, aggfunc in aggregations.values()))][located]
+        shape_aggregates = point_values.groupby(positions[located]).agg(
+            **aggregations).reindex(range(len(polygon_index)))
+        for column in aggregations:
+            aggregated_table[column] = shape_aggregates[column].to_numpy()
+    return aggregated_table
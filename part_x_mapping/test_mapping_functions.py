@@ -0,0 +1,203 @@
+# Tests for mapping_functions.py
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# These tests can be run (from within part_x_mapping) via:
+# python -m pytest test_mapping_functions.py
+
+import json
+import re
+
+import geopandas
+import numpy as np
+import shapely
+
+import mapping_functions
+
+
+def _decode_topology(topology):
+    '''A small reference TopoJSON decoder that converts each geometry
+    within a topology's 'shapes' object back into a Shapely geometry
+    (or None for null geometries).'''
+    scale = np.array(topology['transform']['scale'])
+    translate = np.array(topology['transform']['translate'])
+    arcs = [np.cumsum(np.array(arc), axis = 0) * scale + translate
+    for arc in topology['arcs']]
+
+    def decode_ring(arc_numbers):
+        points = []
+        for arc_number in arc_numbers:
+            arc = arcs[arc_number] if arc_number >= 0 else (
+                arcs[~arc_number][::-1])
+            # Each arc after the first starts with the previous arc's
+            # final point.
+            points.extend(arc if len(points) == 0 else arc[1:])
+        return points
+
+    shapes = []
+    for geometry in topology['objects']['shapes']['geometries']:
+        if geometry['type'] is None:
+            shapes.append(None)
+            continue
+        polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else (
+            geometry['arcs'])
+        shapes.append(shapely.MultiPolygon([shapely.Polygon(
+            decode_ring(rings[0]), [decode_ring(ring) for ring in rings[1:]])
+            for rings in polygons]))
+    return shapes
+
+
+def _adjacent_shapes():
+    '''Returns a GeoSeries with two polygons that share a jagged border,
+    a third polygon (with a hole) that borders both of them, a
+    multipolygon, and a missing shape.'''
+    border = [(1, 0), (1, 0.25), (1.1, 0.5), (1, 0.75), (1, 1)]
+    left = shapely.Polygon([(0, 0)] + border + [(0, 1)])
+    right = shapely.Polygon(border + [(2, 1), (2, 0)])
+    top = shapely.Polygon([(0, 1), (1, 1), (2, 1), (2, 2), (0, 2)],
+    [[(0.5, 1.25), (0.5, 1.75), (1.5, 1.75), (1.5, 1.25)]])
+    islands = shapely.MultiPolygon([shapely.box(3, 0, 3.5, 0.5),
+    shapely.box(3, 1, 3.5, 1.5)])
+    return geopandas.GeoSeries([left, right, top, islands, None],
+    crs = 'EPSG:4326')
+
+
+def test_encode_topology_round_trip():
+    geometry = _adjacent_shapes()
+    coordinate_decimals = 3
+    topology = json.loads(mapping_functions.convert_geometry_to_topology(
+        geometry, coordinate_decimals))
+    decoded_shapes = _decode_topology(topology)
+
+    assert len(decoded_shapes) == len(geometry)
+    assert decoded_shapes[-1] is None
+    tolerance = 10 ** -coordinate_decimals
+    for original, decoded in zip(geometry.values[:-1], decoded_shapes[:-1]):
+        assert decoded.is_valid
+        assert original.hausdorff_distance(decoded) <= tolerance
+        assert abs(original.area - decoded.area) <= tolerance * (
+            original.length)
+
+
+def test_encode_topology_shares_borders():
+    topology = mapping_functions._encode_topology(_adjacent_shapes(), 3)
+    geometries = topology['objects']['shapes']['geometries']
+
+    def arc_ids(geometry):
+        polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else (
+            geometry['arcs'])
+        return {arc_number if arc_number >= 0 else ~arc_number
+        for rings in polygons for ring in rings for arc_number in ring}
+
+    left, right = arc_ids(geometries[0]), arc_ids(geometries[1])
+    # The jagged border between the first two shapes should be stored
+    # as a single arc that both shapes reference.
+    shared_arcs = left & right
+    assert len(shared_arcs) == 1
+    assert len(topology['arcs'][shared_arcs.pop()]) == 5
+
+    # Every arc should be referenced by at least one shape.
+    assert set().union(*[arc_ids(geometry) for geometry in geometries
+    if geometry['type'] is not None]) == set(range(len(topology['arcs'])))
+
+
+def _county_shapes(path):
+    '''Saves a small shapefile containing a grid of square "counties" to
+    path and returns the corresponding GeoDataFrame.'''
+    shapes = geopandas.GeoDataFrame({'STATEFP':['01'] * 6, 
+    'COUNTYFP':[f'{i:03d}' for i in range(1, 7)],
+    'NAME':[f'County {i}' for i in range(1, 7)]},
+    geometry = [shapely.box(x, y, x + 1, y + 1).segmentize(0.1)
+    for x in range(3) for y in range(2)], crs = 'EPSG:4326')
+    shapes.to_file(path)
+    return shapes
+
+
+def test_stage_events_for_shape_reads(tmp_path):
+    shapefile_path = str(tmp_path / 'counties.shp')
+    _county_shapes(shapefile_path)
+    collector = mapping_functions.add_instrumentation_sink(
+        mapping_functions.StageEventCollector())
+    try:
+        mapping_functions._read_simplified_shapes(shapefile_path, 0.01,
+        key_normalization = 'county', key_columns = ['STATEFP', 'COUNTYFP'],
+        cache_dir = str(tmp_path / 'cache'))
+        first_run_events = list(collector.events)
+        mapping_functions._read_simplified_shapes(shapefile_path, 0.01,
+        key_normalization = 'county', key_columns = ['STATEFP', 'COUNTYFP'],
+        cache_dir = str(tmp_path / 'cache'))
+    finally:
+        mapping_functions.remove_instrumentation_sink(collector)
+
+    events = {event['stage']:event for event in first_run_events}
+    assert list(events) == ['read', 'key_normalization', 'simplify',
+    'cache_write']
+    assert events['read']['rows_out'] == 6
+    for stage in ['key_normalization', 'simplify', 'cache_write']:
+        assert events[stage]['rows_in'] == 6
+    assert events['simplify']['rows_out'] == 6
+    assert events['cache_write']['output_bytes'] > 0
+    assert all(event['succeeded'] and event['elapsed_seconds'] >= 0
+    and event['function'] == '_read_simplified_shapes'
+    for event in first_run_events)
+
+    cache_events = collector.events[len(first_run_events):]
+    assert [event['stage'] for event in cache_events] == ['read_cache']
+    assert cache_events[0]['rows_out'] == 6
+
+
+def test_stage_events_for_render_map(tmp_path):
+    shapes = _county_shapes(str(tmp_path / 'counties.shp'))
+    shapes['Population'] = [100, 250, None, 400, 800, 1600]
+    collector = mapping_functions.add_instrumentation_sink(
+        mapping_functions.StageEventCollector())
+    try:
+        mapping_functions.render_map(shapes, 'NAME', 'Population', 
+        'County', 'population', str(tmp_path), str(tmp_path),
+        generate_image = False, compact_output = True)
+    finally:
+        mapping_functions.remove_instrumentation_sink(collector)
+
+    df_events = collector.to_dataframe()
+    assert df_events['stage'].tolist() == ['binning',
+    'geojson_serialization', 'html_save']
+    assert (df_events['function'] == 'render_map').all()
+    # The shape with a missing value gets removed before binning.
+    assert df_events.set_index('stage').loc[
+        ['binning', 'geojson_serialization'], 'rows_in'].tolist() == [5, 5]
+    assert df_events.set_index('stage').loc['html_save', 
+    'output_bytes'] == (tmp_path / 'population.html').stat().st_size
+
+
+def test_render_maps_reuses_shared_topology(tmp_path):
+    shapes = _county_shapes(str(tmp_path / 'counties.shp'))
+    shapes['Population'] = [100, 250, 300, 400, 800, 1600]
+    shapes['Income'] = [50.5, None, 61.2, None, 48.9, 70.1]
+    topology = mapping_functions.convert_geometry_to_topology(
+        shapes['geometry'])
+    map_file_paths = mapping_functions.render_maps(shapes, 'NAME',
+    [{'data_variable':'Population', 'bin_type':'equally_spaced'},
+    {'data_variable':'Income'}], 'County', str(tmp_path), str(tmp_path),
+    generate_image = False, topology = topology)
+
+    for map_file_path in map_file_paths:
+        with open(map_file_path) as map_file:
+            map_html = map_file.read()
+        # Each map should contain the shared topology as is, even if some
+        # of its values are missing.
+        assert topology in map_html
+    # Shapes with missing values should receive null colors.
+    assert 'var colorIndices = [2, null, 5, null, 0, 7]' in map_html
+
+    # The Population map (which isn't missing any values) should match
+    # the one created by render_map.
+    mapping_functions.render_map(shapes, 'NAME', 'Population', 'County',
+    'Population_single', str(tmp_path), str(tmp_path),
+    generate_image = False, compact_output = True,
+    bin_type = 'equally_spaced')
+    def normalized_html(path):
+        with open(path) as map_file:
+            # (Removing the random IDs that folium assigns to each element)
+            return re.sub(r'[0-9a-f]{32}', '', map_file.read())
+    assert normalized_html(map_file_paths[0]) == normalized_html(
+        str(tmp_path / 'Population_single.html'))
@@ -0,0 +1,368 @@
+# Database Generator:
+# Functions for creating synthetic versions of network_database.db at
+# any scale
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# database_generator.ipynb builds our 4,000-student sample database one
+# value at a time (e.g. by calling rng.choice() once per student). That
+# approach is easy to follow, but it becomes slow when generating larger
+# datasets. The functions below create the same three tables
+# (curr_enrollment, test_results, and grad_outcomes) by drawing entire
+# columns at once from NumPy's random number generator. Names and
+# addresses are sampled from pools that are prepared ahead of time, and
+# the results are written to SQLite in large batches within a single
+# transaction. This makes it possible to create databases with millions of
+# rows (which can be helpful for testing how other scripts in this project
+# perform at scale) within seconds.
+#
+# Example (from the command line):
+# python database_generator.py --students 1000000 --schools 40 --years 3
+# --periods Fall Winter Spring --output large_network_database.db
+
+import argparse
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+default_pool_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+'curr_enrollment.csv')
+
+# The first four schools match those within the original database;
+# additional schools will use the other names in this list.
+school_name_list = ['Sycamore', 'Dogwood', 'Chestnut', 'Hickory', 'Maple',
+'Oak', 'Birch', 'Cedar', 'Willow', 'Aspen', 'Magnolia', 'Juniper', 'Poplar',
+'Spruce', 'Hawthorn', 'Linden', 'Redbud', 'Sassafras', 'Tupelo', 'Hemlock',
+'Laurel', 'Alder', 'Buckeye', 'Catalpa', 'Elm', 'Ginkgo', 'Holly', 'Ironwood',
+'Locust', 'Mulberry', 'Pecan', 'Fir', 'Sweetgum', 'Walnut', 'Yew']
+
+grade_list = ['K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11',
+'12']
+race_list = ['African American', 'American Indian', 'Asian', 'White']
+race_probabilities = [0.3, 0.05, 0.2, 0.45]
+ethnicity_list = ['Hispanic', 'Non-Hispanic']
+ethnicity_probabilities = [0.3, 0.7]
+outcomes_list = ['4 Year College', '2 Year College', 'Trade School',
+'Employment', 'Other/Unknown']
+# Outcome probabilities for each graduating class (from
+# database_generator.ipynb). Years before 2018 use the 2018 probabilities,
+# and years after 2022 use the 2022 probabilities.
+outcome_probabilities = {
+2018:[0.5, 0.1, 0.05, 0.25, 0.1],
+2019:[0.55, 0.05, 0.1, 0.2, 0.1],
+2020:[0.6, 0.05, 0.15, 0.15, 0.05],
+2021:[0.65, 0.03, 0.12, 0.1, 0.1],
+2022:[0.7, 0.02, 0.15, 0.1, 0.03]}
+
+table_schemas = {
+'curr_enrollment':[('Student_ID', 'BIGINT'), ('First_Name', 'TEXT'),
+('Last_Name', 'TEXT'), ('Full_School_Name', 'TEXT'), ('School', 'TEXT'),
+('Grade', 'TEXT'), ('Gender', 'TEXT'), ('Race', 'TEXT'),
+('Ethnicity', 'TEXT'), ('Street', 'TEXT'), ('City', 'TEXT'),
+('State', 'TEXT'), ('Zip', 'TEXT'), ('Lat', 'FLOAT'), ('Lon', 'FLOAT'),
+('Address', 'TEXT'), ('Students', 'BIGINT'), ('Grade_for_Sorting', 'INTEGER')],
+'test_results':[('Student_ID', 'BIGINT'), ('School', 'TEXT'),
+('Grade', 'TEXT'), ('Starting_Year', 'BIGINT'), ('Period', 'TEXT'),
+('Score', 'BIGINT')],
+'grad_outcomes':[('Student_ID', 'BIGINT'), ('Starting_Year', 'BIGINT'),
+('Full_School_Name', 'TEXT'), ('School', 'TEXT'), ('Grade', 'TEXT'),
+('Gender', 'TEXT'), ('Race', 'TEXT'), ('Ethnicity', 'TEXT'),
+('Outcome', 'TEXT'), ('Students', 'BIGINT')]}
+
+
+def build_sampling_pools(pool_path = default_pool_path, faker_names = 0,
+    seed = 1158):
+    '''Prepares the pools of names and addresses from which students'
+    values will be sampled. By default, these pools are taken from the
+    curr_enrollment.csv file within this folder, so no additional data or
+    libraries are needed.
+
+    faker_names: the number of additional male first names, female first
+    names, and last names to generate via Faker (if it's installed).
+    Larger pools produce more varied names, but the sampling process takes
+    the same amount of time regardless of pool size.
+
+    Returns a dictionary of NumPy arrays.'''
+    df_pool = pd.read_csv(pool_path, dtype = {'Zip':str})
+    pools = {
+    'Male_First_Name':df_pool.query("Gender == 'Male'")[
+        'First_Name'].unique(),
+    'Female_First_Name':df_pool.query("Gender == 'Female'")[
+        'First_Name'].unique(),
+    'Last_Name':df_pool['Last_Name'].unique()}
+    if faker_names > 0:
+        from faker import Faker
+        fake = Faker()
+        fake.seed_instance(seed)
+        for pool_name, name_function in [
+            ('Male_First_Name', fake.first_name_male),
+            ('Female_First_Name', fake.first_name_female),
+            ('Last_Name', fake.last_name)]:
+            pools[pool_name] = np.unique(np.concatenate([pools[pool_name],
+            [name_function() for i in range(faker_names)]]))
+    df_addresses = df_pool[['Street', 'City', 'State', 'Zip', 'Lat', 'Lon',
+    'Address']].drop_duplicates('Address')
+    for column in df_addresses.columns:
+        pools[column] = df_addresses[column].to_numpy()
+    return pools
+
+
+def _school_names(schools):
+    '''Returns arrays of full school names and school codes (e.g.
+    'Chestnut Academy' and 'CA'). If a code has already been used, the
+    first two letters of the school's name are used instead (e.g. 'SpA'
+    for Spruce Academy). If more schools are requested than there are
+    names in school_name_list, the names are reused with numbers added
+    (e.g. 'Sycamore Academy 2' and 'SA2').'''
+    full_names = []
+    codes = []
+    for i in range(schools):
+        name = school_name_list[i % len(school_name_list)]
+        suffix = '' if i < len(school_name_list) else str(
+            i // len(school_name_list) + 1)
+        full_names.append(f'{name} Academy {suffix}'.strip())
+        code = name[0] + 'A' + suffix
+        if code in codes:
+            code = name[:2] + 'A' + suffix
+        while code in codes:
+            code += 'X'
+        codes.append(code)
+    return np.array(full_names), np.array(codes)
+
+
+def generate_enrollment(rng, pools, student_ids, full_school_names,
+    school_codes):
+    '''Generates curr_enrollment rows for the given student IDs. Each column
+    is drawn with a single vectorized call.'''
+    count = len(student_ids)
+    school_indices = rng.integers(0, len(school_codes), count)
+    grades = rng.choice(grade_list, size = count)
+    genders = np.where(rng.random(count) < 0.5, 'Male', 'Female')
+    male_names = pools['Male_First_Name'][rng.integers(
+        0, len(pools['Male_First_Name']), count)]
+    female_names = pools['Female_First_Name'][rng.integers(
+        0, len(pools['Female_First_Name']), count)]
+    address_indices = rng.integers(0, len(pools['Address']), count)
+    df_enrollment = pd.DataFrame({'Student_ID':student_ids,
+    'First_Name':np.where(genders == 'Male', male_names, female_names),
+    'Last_Name':pools['Last_Name'][rng.integers(
+        0, len(pools['Last_Name']), count)],
+    'Full_School_Name':full_school_names[school_indices],
+    'School':school_codes[school_indices], 'Grade':grades, 'Gender':genders,
+    'Race':rng.choice(race_list, size = count, p = race_probabilities),
+    'Ethnicity':rng.choice(ethnicity_list, size = count,
+    p = ethnicity_probabilities)})
+    for column in ['Street', 'City', 'State', 'Zip', 'Lat', 'Lon',
+    'Address']:
+        df_enrollment[column] = pools[column][address_indices]
+    df_enrollment['Students'] = 1
+    df_enrollment['Grade_for_Sorting'] = np.where(
+        grades == 'K', '0', grades).astype('int64')
+    return df_enrollment
+
+
+def generate_test_results(rng, df_enrollment, starting_years, periods,
+    spring_adjustments):
+    '''Generates one test result per student for each starting year and
+    period. As in database_generator.ipynb, spring scores are higher for
+    Chestnut and Sycamore Academy and lower for certain grades.
+
+    spring_adjustments: a dictionary that maps each starting year to a
+    (boost, penalty) tuple. These values are drawn once by
+    generate_database() and passed to every chunk of students so that all
+    students receive the same adjustments (as in the notebook, which draws
+    them once for the whole table).'''
+    result_tables = []
+    for starting_year in starting_years:
+        for period in periods:
+            scores = rng.normal(50, 10, len(df_enrollment))
+            if period == 'Spring':
+                spring_boost, spring_penalty = spring_adjustments[
+                    starting_year]
+                scores = np.where(df_enrollment['School'].isin(['CA', 'SA']),
+                scores + spring_boost, scores)
+                # (The notebook identifies these grades via
+                # str.contains('2|4|11'), which also matches 12th grade.)
+                scores = np.where(df_enrollment['Grade'].isin(
+                    ['2', '4', '11', '12']), scores - spring_penalty, scores)
+            result_tables.append(pd.DataFrame({
+            'Student_ID':df_enrollment['Student_ID'].to_numpy(),
+            'School':df_enrollment['School'].to_numpy(),
+            'Grade':df_enrollment['Grade'].to_numpy(),
+            'Starting_Year':starting_year, 'Period':period,
+            'Score':np.round(scores).astype('int64')}))
+    return pd.concat(result_tables, ignore_index = True)
+
+
+def generate_grad_outcomes(rng, first_student_id, graduates_per_year,
+    full_school_names, school_codes):
+    '''Generates grad_outcomes rows for each year in graduates_per_year
+    (a dictionary that maps starting years to numbers of graduates).'''
+    starting_years = np.repeat(list(graduates_per_year.keys()),
+    list(graduates_per_year.values()))
+    count = len(starting_years)
+    outcomes = np.empty(count, dtype = object)
+    for starting_year in graduates_per_year:
+        year_rows = starting_years == starting_year
+        probabilities = outcome_probabilities[min(max(
+            starting_year, min(outcome_probabilities)),
+            max(outcome_probabilities))]
+        outcomes[year_rows] = rng.choice(outcomes_list,
+        size = year_rows.sum(), p = probabilities)
+    school_indices = rng.integers(0, len(school_codes), count)
+    return pd.DataFrame({
+    'Student_ID':np.arange(first_student_id, first_student_id + count),
+    'Starting_Year':starting_years,
+    'Full_School_Name':full_school_names[school_indices],
+    'School':school_codes[school_indices], 'Grade':'12',
+    'Gender':rng.choice(['Male', 'Female'], size = count),
+    'Race':rng.choice(race_list, size = count, p = race_probabilities),
+    'Ethnicity':rng.choice(ethnicity_list, size = count,
+    p = ethnicity_probabilities),
+    'Outcome':outcomes, 'Students':1})
+
+
+def _write_rows(connection, table, df):
+    '''Inserts a DataFrame's rows into a table via executemany(). Converting
+    each column to a list first ensures that SQLite receives native Python
+    values rather than NumPy scalars.'''
+    columns = [column for column, column_type in table_schemas[table]]
+    connection.executemany(f'''Insert into {table} values
+    ({', '.join('?' * len(columns))})''',
+    zip(*[df[column].tolist() for column in columns]))
+
+
+def generate_database(output_path, students = 4000, schools = 4,
+    years = 1, periods = ('Fall', 'Spring'), graduating_classes = 5,
+    last_starting_year = 2023, seed = 1158, chunk_size = 250000,
+    pools = None):
+    '''Creates a synthetic network database at output_path.
+
+    Variables:
+
+    students: the number of currently enrolled students.
+
+    schools: the number of schools. (The first four schools are the same
+    ones found in the original database.)
+
+    years: the number of school years for which test results will be
+    generated. (Each enrolled student will receive one result per year
+    and period.)
+
+    periods: the testing periods to include within each year.
+
+    graduating_classes: the number of graduating classes to include within
+    grad_outcomes. The size of these classes is scaled to the number of
+    students (with 4,000 students producing the same 170 to 250 graduates
+    per year found in the original database).
+
+    last_starting_year: the starting year of the current school year.
+
+    chunk_size: the number of students to generate and write at a time.
+    Each chunk is discarded after it is written, so memory usage depends
+    on this value rather than on the total number of students.
+
+    pools: the output of build_sampling_pools(). (If None, this function
+    will be called using its default arguments.)
+
+    The database is first written to a temporary file, then renamed once
+    all tables are complete, so an existing database at output_path will
+    remain intact if the generation process fails.
+
+    Returns a dictionary with the number of rows in each table.'''
+    start_time = time.time()
+    rng = np.random.default_rng(seed = seed)
+    pools = pools if pools is not None else build_sampling_pools(seed = seed)
+    full_school_names, school_codes = _school_names(schools)
+    starting_years = list(range(last_starting_year - years + 1,
+    last_starting_year + 1))
+
+    temp_path = output_path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path, isolation_level = None) # (This
+    # allows transactions to be started and committed manually.)
+    # These settings trade durability for speed, which is fine here since
+    # the database is being written to a temporary file that will simply
+    # be discarded if anything goes wrong.
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA locking_mode = EXCLUSIVE")
+    connection.execute("PRAGMA temp_store = MEMORY")
+    connection.execute("PRAGMA cache_size = -262144") # 256 MB
+    # Drawing the spring score adjustments here (rather than within each
+    # chunk) keeps them consistent across all students.
+    spring_adjustments = {starting_year:(rng.random() * 10, 
+    rng.random() * 5) for starting_year in starting_years}
+    row_counts = {}
+    try:
+        for table, columns in table_schemas.items():
+            connection.execute(f'''Create table {table} ({', '.join(
+                f'"{column}" {column_type}' for column, column_type
+                in columns)})''')
+        connection.execute("Begin")
+        for first_id in range(40001, 40001 + students, chunk_size):
+            student_ids = np.arange(first_id, min(first_id + chunk_size,
+            40001 + students))
+            df_enrollment = generate_enrollment(rng, pools, student_ids,
+            full_school_names, school_codes)
+            _write_rows(connection, 'curr_enrollment', df_enrollment)
+            _write_rows(connection, 'test_results', generate_test_results(
+                rng, df_enrollment, starting_years, periods,
+                spring_adjustments))
+
+        # Graduating class sizes (based on the original database's
+        # 170, 200, 220, 235, and 250 graduates for 4,000 students):
+        class_sizes = np.interp(np.linspace(0, 1, graduating_classes),
+        [0, 0.25, 0.5, 0.75, 1], [170, 200, 220, 235, 250]
+        ) if graduating_classes > 1 else np.array([250])
+        graduates_per_year = {last_starting_year - graduating_classes + i:
+        int(round(size * students / 4000)) for i, size in enumerate(
+            class_sizes)}
+        graduate_count = sum(graduates_per_year.values())
+        # Graduates' IDs start at 30000 (as in the original database) unless
+        # they would overlap with current students' IDs.
+        first_graduate_id = 30000 if graduate_count <= 10001 \
+        else 40001 + students
+        df_grad_outcomes = generate_grad_outcomes(rng, first_graduate_id,
+        graduates_per_year, full_school_names, school_codes)
+        _write_rows(connection, 'grad_outcomes', df_grad_outcomes)
+        # This unique index matches the one created by
+        # prepare_test_results_table() within
+        # part_x_data_cleaning/ingestion_functions.py. Creating it after
+        # all rows have been inserted is faster than updating it row by row.
+        connection.execute('''Create unique index test_results_student_period
+        on test_results (Student_ID, Starting_Year, Period)''')
+        connection.execute("Commit")
+        for table in table_schemas:
+            row_counts[table] = connection.execute(
+                f"Select Count(*) from {table}").fetchone()[0]
+    except BaseException:
+        connection.close()
+        os.remove(temp_path)
+        raise
+    connection.close()
+    os.replace(temp_path, output_path)
+    row_count_text = ', '.join(f'{count:,} {table} rows' for table, count
+    in row_counts.items())
+    print(f"Generated {row_count_text} in {round(time.time() - start_time, 2)} \
+seconds.")
+    return row_counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Creates a synthetic \
+network database for testing purposes.")
+    parser.add_argument('--output', default = 'generated_network_database.db')
+    parser.add_argument('--students', type = int, default = 4000)
+    parser.add_argument('--schools', type = int, default = 4)
+    parser.add_argument('--years', type = int, default = 1)
+    parser.add_argument('--periods', nargs = '+', default = ['Fall', 'Spring'])
+    parser.add_argument('--graduating_classes', type = int, default = 5)
+    parser.add_argument('--seed', type = int, default = 1158)
+    args = parser.parse_args()
+    generate_database(args.output, students = args.students,
+    schools = args.schools, years = args.years, periods = args.periods,
+    graduating_classes = args.graduating_classes, seed = args.seed)
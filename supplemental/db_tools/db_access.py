@@ -0,0 +1,284 @@
+# Database Access:
+# Shared functions for reading data from network_database.db
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# Many scripts within this project create their own SQLAlchemy engine,
+# import entire tables via 'Select *', and then filter them within pandas.
+# That works well for our small sample database, but larger databases will
+# benefit from the approach shown here:
+#
+# 1. A single engine is created for each database and then reused.
+# 2. Indexes on commonly-filtered columns let SQLite find matching rows
+# without scanning entire tables.
+# 3. Column selections and filters are applied within the SQL query, so
+# unneeded data never gets loaded into Python.
+# 4. Low-cardinality text columns (like School and Grade) are stored as
+# categoricals; integers are downcast to smaller types; and other text
+# columns use Arrow-backed strings. Together, these changes greatly reduce
+# the amount of memory that each table requires.
+
+import os
+import threading
+import pandas as pd
+import sqlalchemy
+
+default_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+'..', '..', 'data', 'network_database.db')
+
+# Columns that will be converted to categoricals (when present). Grade and
+# Period use ordered categories so that sorting by them produces
+# chronological rather than alphabetical results.
+category_orders = {
+'Grade':['K'] + [str(grade) for grade in range(1, 13)],
+'Period':['Fall', 'Winter', 'Spring']}
+categorical_columns = ['School', 'Full_School_Name', 'Grade', 'Gender',
+'Race', 'Ethnicity', 'Period', 'Outcome', 'City', 'State']
+
+# Indexes that ensure_indexes() will create. Each entry maps a table to
+# the column combinations that should be indexed.
+index_definitions = {
+'curr_enrollment':[['Student_ID'], ['School', 'Grade']],
+'test_results':[['Student_ID'], ['School', 'Grade', 'Period'],
+['Period']],
+'grad_outcomes':[['Student_ID'], ['School', 'Grade']]}
+
+supported_filter_operators = ['=', '==', '!=', '<', '<=', '>', '>=', 'in',
+'not in']
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    '''Applies settings that speed up read-heavy workloads to each new
+    SQLite connection. (These settings only last for the lifetime of the
+    connection, so they don't modify the database file itself.)'''
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA cache_size = -65536") # 64 MB page cache
+    cursor.execute("PRAGMA mmap_size = 268435456") # 256 MB memory map
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.close()
+
+
+def get_engine(db_path = default_db_path):
+    '''Returns a SQLAlchemy engine for the database at db_path. The same
+    engine (and its pool of connections) is returned each time this
+    function is called with a given path, so scripts that import this
+    module don't need to create and configure their own engines.'''
+    db_path = os.path.abspath(db_path)
+    with _engine_lock:
+        if db_path not in _engines:
+            engine = sqlalchemy.create_engine('sqlite:///' + db_path)
+            sqlalchemy.event.listen(engine, 'connect', _configure_connection)
+            _engines[db_path] = engine
+        return _engines[db_path]
+
+
+def ensure_indexes(engine = None):
+    '''Creates the indexes listed within index_definitions (if they
+    don't already exist), then updates SQLite's table statistics so that
+    its query planner can make use of them.'''
+    engine = engine or get_engine()
+    with engine.begin() as connection:
+        existing_tables = [row[0] for row in connection.exec_driver_sql(
+            "Select name from sqlite_master where type = 'table'")]
+        for table, column_sets in index_definitions.items():
+            if table not in existing_tables:
+                continue
+            for columns in column_sets:
+                connection.exec_driver_sql(f'''Create index if not exists
+                {table}_{'_'.join(columns).lower()} on {table}
+                ({', '.join(f'"{column}"' for column in columns)})''')
+        connection.exec_driver_sql("Analyze")
+
+
+def _table_columns(connection, table):
+    columns = [row[1] for row in connection.exec_driver_sql(
+        f"PRAGMA table_info('{table}')")]
+    if len(columns) == 0:
+        raise ValueError(f"Error: {table} isn't present within the database.")
+    return columns
+
+
+def _build_query(table, table_columns, columns, filters, order_by):
+    '''Builds a parameterized Select statement. Column names are checked
+    against the table's actual columns, and filter values are passed as
+    bound parameters, so user-supplied values can't alter the query.'''
+    for column in (columns or []) + [filter_entry[0] for filter_entry in
+    (filters or [])] + (order_by or []):
+        if column not in table_columns:
+            raise ValueError(f"Error: {column} is not a column within \
+{table}.")
+    column_list = ', '.join(f'"{column}"' for column in columns) if columns \
+    else '*'
+    conditions = []
+    params = {}
+    for filter_number, (column, operator, value) in enumerate(filters or []):
+        if operator not in supported_filter_operators:
+            raise ValueError(f"Error: filter operator {operator} is not \
+supported.")
+        if operator in ['in', 'not in']:
+            value = list(value)
+            if len(value) == 0:
+                # An empty 'in' list matches no rows, while an empty
+                # 'not in' list matches every row. (Writing these as
+                # "in (null)" would match no rows in either case.)
+                if operator == 'in':
+                    conditions.append('0')
+                continue
+            placeholders = [f':filter_{filter_number}_{value_number}'
+            for value_number in range(len(value))]
+            params.update({placeholder[1:]:item for placeholder, item
+            in zip(placeholders, value)})
+            conditions.append(f'''"{column}" {operator}
+            ({', '.join(placeholders)})''')
+        else:
+            params[f'filter_{filter_number}'] = value
+            conditions.append(f'''"{column}" {'=' if operator == '=='
+            else operator} :filter_{filter_number}''')
+    query = f'Select {column_list} from "{table}"'
+    if len(conditions) > 0:
+        query += ' where ' + ' and '.join(conditions)
+    if order_by:
+        query += ' order by ' + ', '.join(f'"{column}"'
+        for column in order_by)
+    return sqlalchemy.text(query), params
+
+
+def compact_dtypes(df, dtype_plan = None):
+    '''Converts a DataFrame's columns to memory-efficient types:
+    categoricals for the columns listed in categorical_columns; the
+    smallest integer type that can hold each integer column's values;
+    and Arrow-backed strings for all other text columns.
+
+    dtype_plan: an optional dictionary in which the type chosen for each
+    column will be recorded. When a table is converted one chunk at a
+    time, passing the same dictionary for every chunk ensures that each
+    column receives the same type within all chunks. (Grade and Period
+    use ordered categories only if every value seen so far fits within
+    category_orders; if a later chunk contains other values, the column's
+    plan will change to 'category', and earlier chunks should then be
+    converted via .cat.as_unordered(), as read_table() does.)'''
+    if dtype_plan is None:
+        dtype_plan = {}
+    for column in df.columns:
+        plan = dtype_plan.get(column)
+        if plan is None and (column in categorical_columns
+        or df[column].notna().any()):
+            # Other columns without any values are left undecided so that
+            # a later chunk can determine their type.
+            if column in categorical_columns:
+                plan = 'ordered_category' if column in category_orders \
+                else 'category'
+            elif pd.api.types.is_integer_dtype(df[column]):
+                plan = 'integer'
+            elif (pd.api.types.is_object_dtype(df[column])
+            or pd.api.types.is_string_dtype(df[column])):
+                plan = 'string'
+            else:
+                plan = 'unchanged'
+            dtype_plan[column] = plan
+        if column in categorical_columns:
+            values = df[column].astype('string')
+            if plan == 'ordered_category' and not values.dropna().isin(
+                category_orders[column]).all():
+                plan = dtype_plan[column] = 'category'
+            if plan == 'ordered_category':
+                df[column] = pd.Categorical(values,
+                categories = category_orders[column], ordered = True)
+            else:
+                df[column] = df[column].astype('category')
+        elif plan == 'integer' and pd.api.types.is_integer_dtype(df[column]):
+            # (Chunks in which an integer column contains missing values
+            # will be read as floats; pd.concat() will convert the other
+            # chunks to the same type.)
+            df[column] = pd.to_numeric(df[column], downcast = 'integer')
+        elif plan == 'string':
+            df[column] = df[column].astype('string[pyarrow]')
+    return df
+
+
+def _combine_chunks(chunks):
+    '''Concatenates compacted chunks while keeping categorical columns
+    categorical. (pd.concat() would convert categoricals whose categories
+    differ between chunks back to object columns.)'''
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks, ignore_index = True)
+    for column in chunks[0].columns:
+        if (isinstance(chunks[0][column].dtype, pd.CategoricalDtype)
+        and not isinstance(df[column].dtype, pd.CategoricalDtype)):
+            # (union_categoricals() requires each chunk's categories to
+            # have the same type, but a chunk in which the column has no
+            # values will have object-typed categories; therefore, all
+            # categories are converted to objects first.)
+            df[column] = pd.api.types.union_categoricals(
+                [chunk[column].cat.set_categories(
+                    chunk[column].cat.categories.astype(object))
+                for chunk in chunks])
+    return df
+
+
+def read_table(table, columns = None, filters = None, order_by = None,
+    compact = True, engine = None, chunk_size = 100000):
+    '''Reads data from a table within the database.
+
+    Variables:
+
+    table: the name of the table (e.g. 'curr_enrollment').
+
+    columns: an optional list of columns to read. Only these columns will
+    be retrieved from the database.
+
+    filters: an optional list of (column, operator, value) filters, such as
+    [('School', '==', 'CA')] or [('Grade', 'in', ['9', '10', '11', '12'])].
+    (This is the same format used by read_map_table() within
+    mapping_functions.py.) These filters are applied within the SQL query
+    itself, so if the filtered columns are indexed (see ensure_indexes()),
+    SQLite will only read the matching rows. Multiple filters are combined
+    using 'and'. Supported operators are =, ==, !=, <, <=, >, >=, in, and
+    not in.
+
+    order_by: an optional list of columns by which to sort the results.
+
+    compact: set to True (the default) to convert the results to the
+    memory-efficient types described within compact_dtypes(). Set to
+    False to retrieve the same types that pd.read_sql() would return.
+
+    engine: the engine to use (by default, the shared engine for
+    network_database.db).
+
+    chunk_size: the number of rows to read at a time. When compact is True,
+    each chunk is converted before the next one is read, which keeps the
+    peak memory usage of this function close to that of the final
+    DataFrame.
+
+    Example: read_table('curr_enrollment', columns = ['Student_ID',
+    'School', 'Grade'], filters = [('School', '==', 'CA')])'''
+    engine = engine or get_engine()
+    with engine.connect() as connection:
+        table_columns = _table_columns(connection, table)
+        query, params = _build_query(table, table_columns, columns, filters,
+        order_by)
+        if compact == False:
+            return pd.read_sql(query, con = connection, params = params)
+        dtype_plan = {}
+        chunks = []
+        for chunk in pd.read_sql(query, con = connection, params = params,
+        chunksize = chunk_size):
+            ordered_columns = [column for column, plan in dtype_plan.items()
+            if plan == 'ordered_category']
+            chunks.append(compact_dtypes(chunk, dtype_plan))
+            for column in ordered_columns:
+                if dtype_plan[column] == 'category':
+                    # This chunk contained values outside of the column's
+                    # category order, so the earlier chunks' versions of
+                    # this column will be converted to unordered
+                    # categoricals as well.
+                    for earlier_chunk in chunks[:-1]:
+                        earlier_chunk[column] = earlier_chunk[
+                            column].cat.as_unordered()
+    if len(chunks) == 0:
+        return pd.DataFrame(columns = columns or table_columns)
+    return _combine_chunks(chunks)
@@ -0,0 +1,244 @@
+# Summary Tables:
+# Functions for creating and updating pre-aggregated tables within
+# network_database.db
+# By Kenneth Burchfiel
+# Released under the MIT license
+
+# Several notebooks in this project (such as spreadsheet_ops.ipynb and
+# data_cleaning.ipynb) calculate the same aggregates from scratch each time
+# they run: enrollment totals by school and grade, average test scores by
+# school, grade, and period, and weighted averages of each student's fall,
+# winter, and spring scores. The functions below store these aggregates
+# within summary tables inside the database itself.
+#
+# Triggers on the source tables record which groups (e.g. school/grade
+# pairs) are affected by each inserted, updated, or deleted row. When
+# refresh_summary_tables() runs, only those groups get recalculated,
+# so refreshing the summaries after a small batch of new results
+# takes very little time even if the source tables are large.
+
+import time
+import pandas as pd
+
+# The weights used for each testing period when calculating weighted
+# averages (matching those used within data_cleaning.ipynb):
+weight_dict = {'Fall':0.2, 'Winter':0.3, 'Spring':0.5}
+
+# Each summary table is defined by its source table; the columns by which
+# the source rows are grouped; and a query that calculates the summary
+# rows for a given set of groups. ({filter} will be replaced with a
+# condition that limits the query to the groups that need to be
+# recalculated.)
+summary_table_definitions = {
+'summary_enrollment':{
+    'source_table':'curr_enrollment',
+    'group_columns':['School', 'Grade_for_Sorting', 'Grade'],
+    'query':'''Select School, Grade_for_Sorting, Grade,
+    Sum(Students) as Students from curr_enrollment where {filter}
+    group by School, Grade_for_Sorting, Grade'''},
+'summary_test_scores':{
+    'source_table':'test_results',
+    'group_columns':['Starting_Year', 'School', 'Grade', 'Period'],
+    # Storing the sum and count of each group's scores (in addition to
+    # their average) allows these results to be combined into averages
+    # for larger groups, such as entire schools.
+    'query':'''Select Starting_Year, School, Grade, Period,
+    Sum(Score) as Score_Sum, Count(Score) as Score_Count,
+    Avg(Score) as Average_Score from test_results where {filter}
+    group by Starting_Year, School, Grade, Period'''},
+'summary_weighted_averages':{
+    'source_table':'test_results',
+    'group_columns':['Student_ID', 'Starting_Year'],
+    # Missing results are excluded from both the numerator and the
+    # denominator so that they don't lower students' weighted averages.
+    'query':'''Select *, ({weighted_sum}) / ({total_weight})
+    as Weighted_Avg from (Select Student_ID, Starting_Year,
+    {period_columns} from test_results where {filter}
+    group by Student_ID, Starting_Year)'''.replace(
+        '{weighted_sum}', ' + '.join(f'Coalesce({period}, 0) * {weight}'
+        for period, weight in weight_dict.items())).replace(
+        '{total_weight}', ' + '.join(f'({period} is not null) * {weight}'
+        for period, weight in weight_dict.items())).replace(
+        '{period_columns}', ', '.join(f"Max(Case when Period = '{period}' \
+then Score end) as {period}" for period in weight_dict))}
+}
+
+
+def _change_log_columns():
+    '''Returns the columns (for each source table) that the change log needs
+    to record in order to identify the groups affected by a change.'''
+    log_columns = {}
+    for definition in summary_table_definitions.values():
+        source_columns = log_columns.setdefault(
+            definition['source_table'], [])
+        source_columns.extend(column for column in definition['group_columns']
+        if column not in source_columns)
+    return log_columns
+
+
+def _create_change_tracking(connection):
+    '''Creates the change log and version tables along with the triggers
+    that add entries to the change log.'''
+    log_columns = _change_log_columns()
+    all_log_columns = sorted(set(column for columns in log_columns.values()
+    for column in columns))
+    connection.exec_driver_sql(f'''Create table if not exists
+    summary_change_log (Version integer primary key autoincrement,
+    Source_Table text, {', '.join(all_log_columns)})''')
+    connection.exec_driver_sql('''Create table if not exists
+    summary_versions (Summary_Table text primary key, Source_Table text,
+    Applied_Version integer, Refreshed_At text, Row_Count integer)''')
+    for source_table, columns in log_columns.items():
+        column_list = ', '.join(columns)
+        for event, row_references in [('insert', ['new']),
+        ('update', ['old', 'new']), ('delete', ['old'])]:
+            inserts = ' '.join(f'''Insert into summary_change_log
+            (Source_Table, {column_list}) values ('{source_table}',
+            {', '.join(f'{reference}.{column}' for column in columns)});'''
+            for reference in row_references)
+            connection.exec_driver_sql(f'''Create trigger if not exists
+            summary_log_{source_table}_{event} after {event}
+            on {source_table} begin {inserts} end''')
+        for summary_table, definition in summary_table_definitions.items():
+            if definition['source_table'] == source_table:
+                # Indexing the group columns allows each refresh to
+                # read only the affected groups' rows.
+                connection.exec_driver_sql(f'''Create index if not exists
+                {summary_table}_groups on {source_table}
+                ({', '.join(definition['group_columns'])})''')
+
+
+def _expected_triggers():
+    return [f'summary_log_{source_table}_{event}'
+    for source_table in _change_log_columns()
+    for event in ['insert', 'update', 'delete']]
+
+
+def _change_tracking_is_intact(connection):
+    '''Returns True if the version and change log tables, every summary
+    table, and every change log trigger exist. Replacing a source table
+    (e.g. via to_sql(if_exists = 'replace') within database_generator.ipynb)
+    drops its triggers, after which changes to that table would no longer
+    get recorded.'''
+    existing_objects = set(row[0] for row in connection.exec_driver_sql(
+        "Select name from sqlite_master where type in ('table', 'trigger')"
+        ).fetchall())
+    return set(['summary_versions', 'summary_change_log']
+    + list(summary_table_definitions) + _expected_triggers()).issubset(
+        existing_objects)
+
+
+def _group_filter(table, group_columns):
+    '''Returns a condition that limits table to the groups stored within
+    temp.affected. Each column is compared using 'is' (rather than '=') so
+    that groups with missing values will also be matched. Joining
+    temp.affected to table allows SQLite to use the index on table's
+    group columns.'''
+    join_conditions = ' and '.join(f'{table}.{column} is a.{column}'
+    for column in group_columns)
+    return f"{table}.rowid in (Select {table}.rowid from temp.affected a \
+join {table} on {join_conditions})"
+
+
+def _latest_version(connection):
+    return connection.exec_driver_sql(
+        "Select Coalesce(Max(Version), 0) from summary_change_log").scalar()
+
+
+def _record_refresh(connection, summary_table, version):
+    row_count = connection.exec_driver_sql(
+        f"Select Count(*) from {summary_table}").scalar()
+    connection.exec_driver_sql('''Insert or replace into summary_versions
+    values (?, ?, ?, ?, ?)''', (summary_table,
+    summary_table_definitions[summary_table]['source_table'], version,
+    time.strftime('%Y-%m-%d %H:%M:%S'), row_count))
+
+
+def build_summary_tables(engine):
+    '''Creates (or re-creates) all summary tables from scratch, along with
+    the triggers and change log that refresh_summary_tables() relies on.
+    This function only needs to be called once; afterwards,
+    refresh_summary_tables() can be used to keep these tables up to date.'''
+    with engine.begin() as connection:
+        _create_change_tracking(connection)
+        version = _latest_version(connection)
+        for summary_table, definition in summary_table_definitions.items():
+            connection.exec_driver_sql(f"Drop table if exists {summary_table}")
+            connection.exec_driver_sql(f'''Create table {summary_table} as
+            {definition['query'].replace('{filter}', '1')}''')
+            connection.exec_driver_sql(f'''Create unique index
+            {summary_table}_key on {summary_table}
+            ({', '.join(definition['group_columns'])})''')
+            _record_refresh(connection, summary_table, version)
+        _prune_change_log(connection)
+
+
+def _prune_change_log(connection):
+    '''Removes change log entries that have been applied to all summary
+    tables.'''
+    connection.exec_driver_sql('''Delete from summary_change_log where
+    Version <= (Select Coalesce(Min(Applied_Version), 0)
+    from summary_versions)''')
+
+
+def refresh_summary_tables(engine):
+    '''Brings all summary tables up to date by recalculating only the
+    groups affected by changes made since the last refresh. (If the summary
+    tables haven't been built yet, or if any of the triggers that record
+    changes are missing, build_summary_tables() will be called instead.)
+
+    All updates take place within a single transaction, so other
+    connections will see either the old or the new version of the summary
+    tables (but never a mix of the two).
+
+    Returns a dictionary showing how many groups were recalculated
+    within each summary table.'''
+    with engine.connect() as connection:
+        tracking_is_intact = _change_tracking_is_intact(connection)
+    if tracking_is_intact == False:
+        build_summary_tables(engine)
+        return {summary_table:'built' for summary_table
+        in summary_table_definitions}
+
+    refreshed_groups = {}
+    with engine.begin() as connection:
+        version = _latest_version(connection)
+        applied_versions = dict(connection.exec_driver_sql(
+            "Select Summary_Table, Applied_Version from summary_versions"
+            ).fetchall())
+        for summary_table, definition in summary_table_definitions.items():
+            applied_version = applied_versions.get(summary_table, 0)
+            if applied_version >= version:
+                refreshed_groups[summary_table] = 0
+                continue
+            group_list = ', '.join(definition['group_columns'])
+            connection.exec_driver_sql("Drop table if exists temp.affected")
+            connection.exec_driver_sql(f'''Create temp table affected as
+            Select distinct {group_list} from summary_change_log
+            where Source_Table = ? and Version > ? and Version <= ?''',
+            (definition['source_table'], applied_version, version))
+            connection.exec_driver_sql(f'''Delete from {summary_table}
+            where {_group_filter(summary_table, definition['group_columns'])}
+            ''')
+            source_filter = _group_filter(definition['source_table'],
+            definition['group_columns'])
+            connection.exec_driver_sql(f'''Insert into {summary_table}
+            {definition['query'].replace('{filter}', source_filter)}''')
+            refreshed_groups[summary_table] = connection.exec_driver_sql(
+                "Select Count(*) from temp.affected").scalar()
+            _record_refresh(connection, summary_table, version)
+        connection.exec_driver_sql("Drop table if exists temp.affected")
+        _prune_change_log(connection)
+    return refreshed_groups
+
+
+def get_change_versions(engine):
+    '''Returns each summary table's most recently applied change version,
+    along with the latest version recorded for its source table. When
+    these two values are equal, the summary table is up to date. (Export
+    scripts can also compare Applied_Version to the version seen during
+    their previous run in order to skip tables that haven't changed.)'''
+    return pd.read_sql('''Select v.*, (Select Coalesce(Max(Version),
+    v.Applied_Version) from summary_change_log l
+    where l.Source_Table = v.Source_Table) as Latest_Version
+    from summary_versions v''', con = engine)